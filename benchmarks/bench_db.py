@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+DB throughput benchmark: 100 ta parallel handler.
+
+Har "handler" bot qiladigan ishni bajaradi: foydalanuvchini get_or_create,
+SearchHistory yozuvi va foydalanuvchi yuklashlari sonini o'qish.
+
+- sync_to_async: eski holat (thread_sensitive=True, hammasi bitta thread'da)
+- async ORM:     Django aget_or_create/acreate/acount
+- repository:    core.repository.run_db — o'qishlar BOT_DB_THREADS ta thread'da,
+                 yozishlar bitta writer thread'da
+
+Asosiy bazaga tegmaydi: vaqtinchalik nusxada migrate qilib ishlaydi.
+
+Ishga tushirish: python benchmarks/bench_db.py [--handlers 100] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+
+from core import repository  # noqa: E402
+from core.models import DownloadHistory, SearchHistory, TelegramUser  # noqa: E402
+
+USERS = 500
+
+
+def handler_work(telegram_id: int, n: int) -> int:
+    user, _ = TelegramUser.objects.get_or_create(telegram_id=telegram_id, defaults={'first_name': 'Bench'})
+    SearchHistory.objects.create(user=user, query=f'query {n}', results_count=10)
+    return DownloadHistory.objects.filter(user=user).count()
+
+
+def get_user(telegram_id: int) -> TelegramUser:
+    return TelegramUser.objects.get_or_create(telegram_id=telegram_id, defaults={'first_name': 'Bench'})[0]
+
+
+def log_search(user: TelegramUser, n: int):
+    SearchHistory.objects.create(user=user, query=f'query {n}', results_count=10)
+
+
+def count_downloads(user: TelegramUser) -> int:
+    return DownloadHistory.objects.filter(user=user).count()
+
+
+async def handler_repository(telegram_id: int, n: int) -> int:
+    user = await repository.run_db(get_user, telegram_id)
+    await repository.run_db(log_search, user, n, write=True)
+    return await repository.run_db(count_downloads, user)
+
+
+async def handler_async_orm(telegram_id: int, n: int) -> int:
+    user, _ = await TelegramUser.objects.aget_or_create(telegram_id=telegram_id, defaults={'first_name': 'Bench'})
+    await SearchHistory.objects.acreate(user=user, query=f'query {n}', results_count=10)
+    return await DownloadHistory.objects.filter(user=user).acount()
+
+
+MODES = {
+    'sync_to_async': lambda tid, n: sync_to_async(handler_work)(tid, n),
+    'async ORM': handler_async_orm,
+    'repository': handler_repository,
+}
+
+
+async def run_mode(call, handlers: int, rounds: int):
+    latencies = []
+
+    async def one(n):
+        started = time.perf_counter()
+        await call(1_000_000 + n % USERS, n)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for r in range(rounds):
+        await asyncio.gather(*(one(r * handlers + i) for i in range(handlers)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handlers', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        connections.close_all()
+        call_command('migrate', verbosity=0)
+
+        print(f'{args.handlers} parallel handler x {args.rounds} round, DB threads={repository.DB_THREADS}')
+        print(f'{"mode":<15}{"handlers/s":>12}{"p50 ms":>10}{"p95 ms":>10}')
+        for name, call in MODES.items():
+            rate, p50, p95 = asyncio.run(run_mode(call, args.handlers, args.rounds))
+            print(f'{name:<15}{rate:>12.0f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}')
+        repository.shutdown()
+        connections.close_all()
+
+
+if __name__ == '__main__':
+    main()
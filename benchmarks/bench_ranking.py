@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Search ranking benchmark: 50 YouTube nomzod + 5 Spotify trek.
+
+Nomzodlar haqiqiy qidiruvga o'xshaydi: har qo'shiqning "Official Video",
+"lyrics", "audio" nusxalari, remix/live versiyalari va boshqa kanallar.
+services.search.ranking.rank_results har chaqiruvi vaqti o'lchanadi va
+natija sifati (takrorlar qisqardimi, Spotify biriktirildimi) ko'rsatiladi.
+
+Maqsad: 50 nomzod uchun millisekunddan ancha kam — p50 < 0.5 ms, p99 < 1 ms.
+Sekin bo'lsa chiqish kodi 1.
+
+Ishga tushirish: python benchmarks/bench_ranking.py [--candidates 50] [--rounds 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+from services.search.ranking import rank_results  # noqa: E402
+
+TARGET_P50_US = 500
+TARGET_P99_US = 1000
+
+ARTISTS = ['Shahzoda', 'Ummon', 'Yulduz Usmonova', 'Sherali Jo\'rayev', 'Lola', 'Ozoda', 'Jaloliddin Ahmadaliyev']
+SONGS = ['Yoqub', 'Bahor', 'Sevgi', 'Onajon', 'Yor-yor', 'Toshkent oqshomi', 'Kechir', 'Sog\'indim']
+SUFFIXES = [
+    ' (Official Video)', ' | Official Music Video', ' lyrics', ' (Audio)', ' текст', ' HD',
+    ' (Remix)', ' (Live)', ' klip', '',
+]
+
+
+def make_candidates(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        artist = rng.choice(ARTISTS)
+        song = rng.choice(SONGS)
+        items.append({
+            'id': f'{i:011d}',
+            'title': f'{artist} - {song}{rng.choice(SUFFIXES)}',
+            'artist': rng.choice([artist, f'{artist} Official', 'UzMusic', 'Lyrics Uz']),
+            'duration': 200 + rng.randint(0, 3) + SONGS.index(song) * 20,
+            'url': f'https://www.youtube.com/watch?v={i:011d}',
+        })
+    spotify = [
+        {'id': f'sp{i}', 'title': song, 'artist': artist, 'duration': 200 + SONGS.index(song) * 20,
+         'url': f'https://open.spotify.com/track/sp{i}'}
+        for i, (artist, song) in enumerate(zip(ARTISTS[:5], SONGS[:5]))
+    ]
+    return items, spotify
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidates', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    candidates, spotify = make_candidates(args.candidates)
+    query = 'shahzoda yoqub'
+    for _ in range(50):
+        rank_results(query, candidates, spotify)
+
+    samples = []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        ranked, unmatched = rank_results(query, candidates, spotify)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    matched = sum(1 for item in ranked if item.get('spotify_url'))
+    print(f'{args.candidates} nomzod + {len(spotify)} Spotify, {args.rounds} round')
+    print(f'{"p50 us":>10}{"p99 us":>10}{"mean us":>10}')
+    print(f'{p50:>10.0f}{p99:>10.0f}{statistics.mean(samples) * 1e6:>10.0f}')
+    print(f'natija: {len(ranked)} qator ({args.candidates - len(ranked)} takror qisqardi), '
+          f'Spotify biriktirildi: {matched}, alohida: {len(unmatched)}')
+    print('top 5:')
+    for item in ranked[:5]:
+        print(f'  {item["title"]}  [{item["artist"]}]{"  +spotify" if item.get("spotify_url") else ""}')
+    if p50 < TARGET_P50_US and p99 < TARGET_P99_US:
+        print('OK')
+        return 0
+    print(f'SEKIN: maqsad p50 < {TARGET_P50_US} us, p99 < {TARGET_P99_US} us')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+SQLite concurrency stress test: bot yozuvchilari + dashboard o'quvchilari.
+
+Alohida process'larda bir vaqtda ishlaydi:
+- bot writer (x2): event sink kabi batch INSERT + last_active UPDATE
+- dashboard reader (x2): bosh sahifa statistikasi (count, kunlik, platforma)
+- broadcast writer (x1): dashboard broadcast thread'i kabi kichik UPDATE'lar
+
+Ikki profil solishtiriladi: Django default (rollback journal) va core.db
+pragma'lari (WAL, synchronous=NORMAL, busy_timeout, mmap, cache).
+Har profil vaqtinchalik bazada ishlaydi, asosiy db.sqlite3 ga tegmaydi.
+
+Ishga tushirish: python benchmarks/bench_sqlite.py [--seconds 10]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+USERS = 500
+
+
+def setup_django(db_path: str, tuning: bool):
+    sys.path.insert(0, str(ROOT))
+    os.environ['SQLITE_PATH'] = db_path
+    os.environ['DB_SQLITE_TUNING'] = 'True' if tuning else 'False'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+def prepare(db_path: str, tuning: bool):
+    setup_django(db_path, tuning)
+    from django.core.management import call_command
+    from core.models import DownloadHistory, TelegramUser, Broadcast
+
+    call_command('migrate', verbosity=0)
+    TelegramUser.objects.bulk_create(
+        [TelegramUser(telegram_id=i, first_name=f'U{i}') for i in range(USERS)]
+    )
+    users = list(TelegramUser.objects.all())
+    DownloadHistory.objects.bulk_create([
+        DownloadHistory(user=random.choice(users), video_url='https://youtu.be/x', video_title='t',
+                        platform=random.choice(['youtube', 'instagram', 'tiktok']), format_label='Video',
+                        status='completed')
+        for _ in range(20000)
+    ])
+    Broadcast.objects.create(message='bench')
+
+
+def bot_writer(users, rnd):
+    from django.db import transaction
+    from django.utils import timezone
+    from core.models import DownloadHistory, TelegramUser
+
+    with transaction.atomic():
+        DownloadHistory.objects.bulk_create([
+            DownloadHistory(user_id=rnd.choice(users), video_url='https://youtu.be/x', video_title='t',
+                            platform='youtube', format_label='Video', status='completed')
+            for _ in range(20)
+        ])
+        TelegramUser.objects.filter(pk__in=rnd.sample(users, 50)).update(last_active=timezone.now())
+
+
+def dashboard_reader(users, rnd):
+    from datetime import timedelta
+    from django.db.models import Count
+    from django.utils import timezone
+    from core.models import DownloadHistory, TelegramUser
+
+    now = timezone.now()
+    TelegramUser.objects.count()
+    TelegramUser.objects.filter(last_active__gte=now - timedelta(hours=24)).count()
+    DownloadHistory.objects.count()
+    DownloadHistory.objects.filter(status='failed').count()
+    list(DownloadHistory.objects.values('platform').annotate(count=Count('id')))
+    list(DownloadHistory.objects.select_related('user').order_by('-downloaded_at')[:10])
+
+
+def broadcast_writer(users, rnd):
+    from django.db.models import F
+    from core.models import Broadcast
+
+    Broadcast.objects.filter(pk=1).update(sent_count=F('sent_count') + 1)
+
+
+ROLES = {
+    'bot writer': (bot_writer, 2),
+    'dashboard reader': (dashboard_reader, 2),
+    'broadcast writer': (broadcast_writer, 1),
+}
+
+
+def worker(role: str, db_path: str, tuning: bool, seconds: float, start_at: float, results):
+    setup_django(db_path, tuning)
+    from django.db import OperationalError
+    from core.models import TelegramUser
+
+    func = ROLES[role][0]
+    users = list(TelegramUser.objects.values_list('pk', flat=True))
+    rnd = random.Random(os.getpid())
+    latencies = []
+    errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            func(users, rnd)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put((role, latencies, errors))
+
+
+def run_profile(name: str, tuning: bool, seconds: float):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.sqlite3')
+        p = ctx.Process(target=prepare, args=(db_path, tuning))
+        p.start()
+        p.join()
+
+        results = ctx.Queue()
+        start_at = time.time() + 3
+        procs = [
+            ctx.Process(target=worker, args=(role, db_path, tuning, seconds, start_at, results))
+            for role, (_, count) in ROLES.items() for _ in range(count)
+        ]
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    print(f'\n== {name}')
+    print(f'{"role":<18}{"ops/s":>8}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}{"locked":>8}')
+    for role in ROLES:
+        latencies = sorted(x for r, lat, _ in collected if r == role for x in lat)
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            print(f'{role:<18}{0:>8}{"-":>9}{"-":>9}{"-":>9}{errors:>8}')
+            continue
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) > 1 else latencies[0]
+        print(f'{role:<18}{len(latencies) / seconds:>8.0f}{statistics.median(latencies) * 1000:>9.1f}'
+              f'{p99 * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}{errors:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    run_profile('default (rollback journal)', False, args.seconds)
+    run_profile('tuned (core.db pragmas)', True, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
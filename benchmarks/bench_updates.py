@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Update throughput benchmark (Telegram'siz).
+
+Sekin "download" update'lar soni oshgani sari tez update'lar (/start, search
+menyusi) o'tkazuvchanligi qanday o'zgarishini o'lchaydi:
+
+- sequential: eski holat, update'lar birma-bir, download handler ichida kutiladi
+- concurrent: ChatOrderedUpdateProcessor + download fon task'da (@background)
+
+Ishga tushirish: python benchmarks/bench_updates.py
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Chat, Message, Update  # noqa: E402
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from bot.concurrency import ChatOrderedUpdateProcessor  # noqa: E402
+
+FAST_UPDATES = 2000
+CHATS = 200
+FAST_HANDLER_SECONDS = 0.002
+SLOW_DOWNLOAD_SECONDS = 2.0
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type=Chat.PRIVATE)
+    message = Message(message_id=update_id, date=datetime.now(timezone.utc), chat=chat, text='x')
+    return Update(update_id=update_id, message=message)
+
+
+async def run(processor, slow_count: int, in_background: bool) -> float:
+    """Returns fast-update throughput (updates/second)"""
+    background_tasks = set()
+
+    async def slow_handler():
+        if in_background:
+            task = asyncio.create_task(asyncio.sleep(SLOW_DOWNLOAD_SECONDS))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        else:
+            await asyncio.sleep(SLOW_DOWNLOAD_SECONDS)
+
+    async def fast_handler():
+        await asyncio.sleep(FAST_HANDLER_SECONDS)
+
+    async with processor:
+        pending = []
+        started = time.perf_counter()
+        update_id = 0
+        for i in range(slow_count):
+            update_id += 1
+            update = make_update(update_id, 10_000 + i)
+            pending.append(asyncio.create_task(processor.process_update(update, slow_handler())))
+        for i in range(FAST_UPDATES):
+            update_id += 1
+            update = make_update(update_id, i % CHATS)
+            pending.append(asyncio.create_task(processor.process_update(update, fast_handler())))
+        # Faqat update'larni qayta ishlash vaqtini o'lchaymiz, fon download'larni emas
+        await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - started
+        for task in background_tasks:
+            task.cancel()
+    return FAST_UPDATES / elapsed
+
+
+async def main():
+    print(f'{"slow downloads":>15} | {"sequential upd/s":>17} | {"concurrent upd/s":>17}')
+    base_seconds = None
+    for slow_count in (0, 1, 10, 50, 200):
+        if slow_count <= 1:
+            sequential = await run(SimpleUpdateProcessor(1), slow_count, in_background=False)
+            if base_seconds is None:
+                base_seconds = FAST_UPDATES / sequential
+            sequential_text = f'{sequential:17.0f}'
+        else:
+            # Har bir download 2s bloklaydi, shuning uchun hisoblab qo'yamiz
+            estimate = FAST_UPDATES / (base_seconds + slow_count * SLOW_DOWNLOAD_SECONDS)
+            sequential_text = f'{estimate:16.0f}*'
+        concurrent = await run(ChatOrderedUpdateProcessor(64), slow_count, in_background=True)
+        print(f'{slow_count:>15} | {sequential_text} | {concurrent:17.0f}')
+    print('* hisoblangan qiymat')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Lokal "fake Spotify": accounts (/api/token) va Web API (/v1/search, /v1/tracks) stub.
+
+Ishlatish:
+    # stub'ni ko'tarib, botni unga yo'naltirish
+    python benchmarks/fake_spotify.py --port 18444 --latency 0.05
+    SPOTIFY_API_URL=http://127.0.0.1:18444 SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:18444 \\
+        SPOTIFY_CLIENT_ID=x SPOTIFY_CLIENT_SECRET=y python bot/run_bot.py
+
+    # o'z-o'zini tekshirish: services.search.spotify.SpotifyClient ni stub'ga qarshi
+    # (token single-flight, oldindan yangilash, 401 dan keyin qayta urinish,
+    # ulanishlar pool'i, batch /v1/tracks) va har so'rovga yangi ulanish bilan solishtirish
+    python benchmarks/fake_spotify.py --self-test
+"""
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SPOTIFY_CLIENT_ID', 'stub-id')
+os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'stub-secret')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+from services.search import spotify  # noqa: E402
+
+
+def make_track(track_id: str) -> dict:
+    number = sum(map(ord, track_id))
+    return {
+        'id': track_id,
+        'name': f'Song {track_id}',
+        'artists': [{'name': f'Artist {number % 17}'}],
+        'duration_ms': 150000 + number % 90 * 1000,
+        'external_ids': {'isrc': f'UZA{number:09d}'},
+        'album': {'name': f'Album {number % 7}'},
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+    }
+
+
+class FakeSpotify:
+    def __init__(self, latency: float = 0.0, expires_in: int = 3600):
+        self.latency = latency
+        self.expires_in = expires_in
+        self.tokens = {}
+        self.token_requests = 0
+        self.api_requests = 0
+        self.unauthorized = 0
+        self.connections = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/api/token', self.token)
+        app.router.add_get('/v1/search', self.search)
+        app.router.add_get('/v1/tracks', self.tracks)
+        return app
+
+    def revoke_all(self):
+        self.tokens.clear()
+
+    async def token(self, request: web.Request):
+        self.connections.add(request.transport)
+        self.token_requests += 1
+        expected = base64.b64encode(
+            f"{os.environ['SPOTIFY_CLIENT_ID']}:{os.environ['SPOTIFY_CLIENT_SECRET']}".encode()
+        ).decode()
+        if request.headers.get('Authorization') != f'Basic {expected}':
+            return web.json_response({'error': 'invalid_client'}, status=400)
+        await asyncio.sleep(self.latency)
+        token = f'token-{self.token_requests}'
+        self.tokens[token] = time.monotonic() + self.expires_in
+        return web.json_response({'access_token': token, 'token_type': 'Bearer', 'expires_in': self.expires_in})
+
+    def _authorized(self, request: web.Request) -> bool:
+        self.connections.add(request.transport)
+        self.api_requests += 1
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if self.tokens.get(token, 0) < time.monotonic():
+            self.unauthorized += 1
+            return False
+        return True
+
+    async def search(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({'error': {'status': 401}}, status=401)
+        await asyncio.sleep(self.latency)
+        limit = int(request.query.get('limit', '5'))
+        query = request.query.get('q', '')
+        items = [make_track(f'{abs(hash(query)) % 10000:04d}{i}') for i in range(limit)]
+        return web.json_response({'tracks': {'items': items}})
+
+    async def tracks(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({'error': {'status': 401}}, status=401)
+        ids = [i for i in request.query.get('ids', '').split(',') if i]
+        if len(ids) > 50:
+            return web.json_response({'error': {'status': 400}}, status=400)
+        await asyncio.sleep(self.latency)
+        return web.json_response({'tracks': [make_track(i) for i in ids]})
+
+
+async def start(fake: FakeSpotify, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def fresh_connection_search(url: str, token: str, query: str):
+    """Eski usul: token keshda, lekin har qidiruvga yangi ulanish (requests.get kabi)"""
+    async with httpx.AsyncClient() as client:
+        await client.get(f'{url}/v1/search', params={'q': query, 'type': 'track'},
+                         headers={'Authorization': f'Bearer {token}'})
+
+
+async def timed(coros, concurrency: int):
+    """Bir vaqtda concurrency tadan; har qidiruv vaqti (navbat kutishsiz)"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(coro):
+        async with semaphore:
+            started = time.perf_counter()
+            await coro
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(c) for c in coros))
+    latencies.sort()
+    return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+async def self_test(total: int, concurrency: int, latency: float):
+    fake = FakeSpotify(latency=latency)
+    runner = await start(fake, '127.0.0.1', 18444)
+    url = 'http://127.0.0.1:18444'
+    client = spotify.SpotifyClient(api_url=url, accounts_url=url)
+    try:
+        print(f'-- {concurrency} ta parallel qidiruv, token yo\'q (1 ta token so\'rovi kutiladi)')
+        results = await asyncio.gather(*(client.search_tracks(f'q{i}') for i in range(concurrency)))
+        print(f'natijalar={sum(map(len, results))} token_requests={fake.token_requests}')
+
+        print(f'-- {total} qidiruv ({concurrency} parallel), pool (ulanishlar <= SPOTIFY_POOL_SIZE={spotify.POOL_SIZE})')
+        fake.connections.clear()
+        before = fake.api_requests
+        p50, p99 = await timed((client.search_tracks(f'q{i}') for i in range(total)), concurrency)
+        print(f'p50={p50:.1f}ms p99={p99:.1f}ms so\'rov/qidiruv={(fake.api_requests - before) / total:.1f} '
+              f'ulanishlar={len(fake.connections)}')
+
+        print(f'-- {total} qidiruv ({concurrency} parallel), har biri yangi ulanish (eski usul)')
+        fake.connections.clear()
+        token = await client.token()
+        p50, p99 = await timed((fresh_connection_search(url, token, f'q{i}') for i in range(total)), concurrency)
+        print(f'p50={p50:.1f}ms p99={p99:.1f}ms ulanishlar={len(fake.connections)}')
+
+        print('-- token muddati yaqin: fonda yangilanadi, qidiruv kutmaydi, 401 bo\'lmaydi')
+        client._expires_at = time.monotonic() + spotify.REFRESH_AHEAD - 1
+        tokens_before, unauthorized_before = fake.token_requests, fake.unauthorized
+        await asyncio.gather(*(client.search_tracks(f'r{i}') for i in range(concurrency)))
+        await asyncio.sleep(latency * 2 + 0.05)
+        print(f'token_requests=+{fake.token_requests - tokens_before} 401=+{fake.unauthorized - unauthorized_before}')
+
+        print('-- token bekor qilindi: 401 -> bitta yangi token -> qayta urinish')
+        fake.revoke_all()
+        tokens_before = fake.token_requests
+        results = await asyncio.gather(*(client.search_tracks(f's{i}') for i in range(concurrency)))
+        print(f'natijalar={sum(map(len, results))} token_requests=+{fake.token_requests - tokens_before}')
+
+        print('-- get_tracks: 120 id (3 ta /v1/tracks so\'rovi kutiladi)')
+        before = fake.api_requests
+        tracks = await client.get_tracks(f'id{i}' for i in range(120))
+        print(f'treklar={len(tracks)} so\'rovlar={fake.api_requests - before} isrc={tracks[0]["isrc"]}')
+    finally:
+        await client.aclose()
+        await runner.cleanup()
+
+
+async def serve_forever(host: str, port: int, latency: float, expires_in: int):
+    runner = await start(FakeSpotify(latency=latency, expires_in=expires_in), host, port)
+    print(f'fake Spotify: http://{host}:{port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18444)
+    parser.add_argument('--latency', type=float, default=0.02, help="Har javobga sun'iy kechikish (soniya)")
+    parser.add_argument('--expires-in', type=int, default=3600)
+    parser.add_argument('--total', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--self-test', action='store_true')
+    args = parser.parse_args()
+
+    if args.self_test:
+        asyncio.run(self_test(args.total, args.concurrency, args.latency))
+    else:
+        asyncio.run(serve_forever(args.host, args.port, args.latency, args.expires_in))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Lokal "fake Telegram" sender: webhook endpoint'ga sintetik update'lar yuboradi.
+
+Ishlatish:
+    # ishlayotgan bot (BOT_MODE=webhook) ga yuborish
+    python benchmarks/fake_telegram.py --url http://127.0.0.1:8443/telegram/webhook --secret S
+
+    # o'z-o'zini tekshirish: sekin consumer bilan lokal receiver ko'tarib,
+    # secret tekshiruvi va backpressure (503) ni ko'rsatadi
+    python benchmarks/fake_telegram.py --self-test
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bot.webhook import SECRET_HEADER, WebhookReceiver, serve  # noqa: E402
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Test'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+async def send(url: str, secret: str, total: int, concurrency: int, chats: int):
+    statuses = Counter()
+    latencies = []
+    counter = iter(range(1, total + 1))
+
+    async def worker(session):
+        for update_id in counter:
+            started = time.perf_counter()
+            async with session.post(
+                url, json=make_update(update_id, update_id % chats + 1),
+                headers={SECRET_HEADER: secret} if secret else {},
+            ) as resp:
+                statuses[resp.status] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f'sent={total} in {elapsed:.2f}s ({total / elapsed:.0f} req/s)')
+    print(f'statuses={dict(statuses)}')
+    print(f'latency p50={statistics.median(latencies) * 1000:.1f}ms '
+          f'p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms')
+
+
+async def self_test(total: int, concurrency: int):
+    queue = asyncio.Queue(maxsize=100)
+
+    def submit(data):
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def slow_consumer():
+        while True:
+            await queue.get()
+            await asyncio.sleep(0.005)
+
+    receiver = WebhookReceiver(submit, secret='test-secret', path='/telegram/webhook')
+    runner = await serve(receiver, '127.0.0.1', 18443)
+    consumer = asyncio.create_task(slow_consumer())
+    url = 'http://127.0.0.1:18443/telegram/webhook'
+    try:
+        print('-- wrong secret (403 kutiladi)')
+        await send(url, 'wrong', 10, 2, 5)
+        print('-- load (200 va backpressure 503 kutiladi)')
+        await send(url, 'test-secret', total, concurrency, 50)
+    finally:
+        consumer.cancel()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8443/telegram/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--total', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=40)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--self-test', action='store_true')
+    args = parser.parse_args()
+
+    if args.self_test:
+        asyncio.run(self_test(args.total, args.concurrency))
+    else:
+        asyncio.run(send(args.url, args.secret, args.total, args.concurrency, args.chats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Concurrent update processing with per-chat ordering.
+
+- ChatOrderedUpdateProcessor: turli chatlar parallel, bitta chat ichidagi
+  update'lar kelgan tartibda ishlanadi.
+- background: uzoq ishlaydigan handler (download, search, Shazam) ni fon
+  task'ga chiqaradi, shunda chat navbati va global limit band bo'lib qolmaydi.
+"""
+import asyncio
+import functools
+import logging
+import os
+from typing import Any, Awaitable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+BACKGROUND_LIMIT = int(os.getenv('BOT_BACKGROUND_LIMIT', '32'))
+# Navbatda turgan + ishlanayotgan update'lar chegarasi (backpressure)
+INTAKE_QUEUE_SIZE = int(os.getenv('BOT_INTAKE_QUEUE_SIZE', '1000'))
+
+_background_slots: Optional[asyncio.Semaphore] = None
+
+
+def update_chat_key(update: object) -> Optional[int]:
+    """Chat id (yoki chat bo'lmasa, masalan inline query uchun, user id)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes up to max_concurrent_updates updates at once, but never two
+    updates of the same chat at the same time. asyncio.Lock wakes waiters in
+    FIFO order, so updates of one chat keep their arrival order.
+
+    Note: the global semaphore is taken before the chat lock, so a burst
+    from one chat can occupy slots while waiting. Handlers should therefore
+    stay short and push slow work to @background.
+    """
+
+    __slots__ = ('_chat_locks',)
+
+    def __init__(self, max_concurrent_updates: int = CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, users]; entry is dropped when nobody holds/waits
+        self._chat_locks: Dict[int, List[Any]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = update_chat_key(update)
+        if chat_id is None:
+            await coroutine
+            return
+
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._chat_locks.pop(chat_id, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+
+
+class IntakeQueue(asyncio.Queue):
+    """
+    Application.update_queue, lekin maxsize navbatdagi va hali ishlanayotgan
+    update'larni birga sanaydi. Concurrent rejimda PTB navbatni darhol task'larga
+    bo'shatadi, shuning uchun oddiy maxsize backpressure bermaydi. PTB har update
+    tugagach task_done() chaqiradi — shunda joy bo'shaydi.
+    """
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._unfinished_tasks
+
+    def task_done(self) -> None:
+        super().task_done()
+        # put() da kutayotganlarni uyg'otamiz (asyncio faqat get() da uyg'otadi)
+        self._wakeup_next(self._putters)
+
+
+def _get_background_slots() -> asyncio.Semaphore:
+    global _background_slots
+    if _background_slots is None:
+        _background_slots = asyncio.Semaphore(BACKGROUND_LIMIT)
+    return _background_slots
+
+
+def background(func):
+    """
+    Handler'ni (update, context, ...) fon task sifatida ishga tushiradi va darhol qaytadi.
+    Fon task'lar soni BOT_BACKGROUND_LIMIT bilan cheklangan; task'lar
+    Application.create_task orqali yaratiladi, shuning uchun app.stop() ularni kutadi.
+    """
+    @functools.wraps(func)
+    async def wrapper(update: Update, context, *args, **kwargs):
+        async def run():
+            async with _get_background_slots():
+                try:
+                    await func(update, context, *args, **kwargs)
+                except Exception as e:
+                    logger.exception("Background %s error: %s", func.__name__, e)
+                    message = update.effective_message if isinstance(update, Update) else None
+                    if message:
+                        try:
+                            await message.reply_text("Xatolik yuz berdi. Qaytadan urinib ko'ring.")
+                        except Exception:
+                            pass
+
+        context.application.create_task(run(), update=update, name=f'background:{func.__name__}')
+
+    return wrapper
@@ -0,0 +1,184 @@
+"""Buffered batch writer for history/log rows.
+
+Handler'lar DownloadHistory, ShazamLog, SearchHistory yozuvlarini bazaga
+o'zi yozmaydi — event_sink ga beradi:
+
+    record = event_sink.add(DownloadHistory(user=user, ..., status='processing'))
+    ...
+    record.status = 'completed'
+    event_sink.save(record, ['status', 'file_size', 'completed_at'])
+
+Hali yozilmagan yozuv o'zgartirilsa, alohida UPDATE bo'lmaydi — INSERT oxirgi
+qiymatlar bilan ketadi. Navbat BOT_EVENT_BATCH_SIZE ga yetganda yoki har
+BOT_EVENT_FLUSH_INTERVAL soniyada hammasi bitta tranzaksiyada bulk_create /
+bulk_update qilinadi. Application to'xtaganda (post_stop) qolgani yoziladi.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Sequence, Tuple
+
+from django.db import DatabaseError, IntegrityError
+
+from core import repository
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('BOT_EVENT_BATCH_SIZE', '200'))
+FLUSH_INTERVAL = float(os.getenv('BOT_EVENT_FLUSH_INTERVAL', '2'))
+# Baza vaqtincha ishlamasa navbat shundan oshmaydi (eng eskilari tashlanadi)
+MAX_PENDING = int(os.getenv('BOT_EVENT_MAX_PENDING', '20000'))
+CLOSE_RETRIES = 3
+
+
+class EventSink:
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # id(obj) -> obj; model instance pk=None bo'lsa hash qilinmaydi
+        self._inserts: Dict[int, object] = {}
+        self._updates: Dict[int, Tuple[object, set]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._closing = False
+        metrics.gauge('event_sink.pending', self.pending)
+
+    def pending(self) -> int:
+        return len(self._inserts) + len(self._updates)
+
+    # Handler API
+
+    def add(self, obj):
+        """Yangi yozuvni navbatga qo'yadi va o'zini qaytaradi"""
+        self._inserts[id(obj)] = obj
+        self._after_change()
+        return obj
+
+    def save(self, obj, fields: Sequence[str]):
+        """Yozuv o'zgardi: hali yozilmagan bo'lsa INSERT o'zi oxirgi qiymatni oladi"""
+        key = id(obj)
+        if key in self._inserts:
+            return
+        entry = self._updates.get(key)
+        if entry:
+            entry[1].update(fields)
+        else:
+            self._updates[key] = (obj, set(fields))
+        self._after_change()
+
+    def _after_change(self):
+        self._ensure_started()
+        if self._wakeup and self.pending() >= self.batch_size:
+            self._wakeup.set()
+        if self.pending() > MAX_PENDING:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        overflow = self.pending() - MAX_PENDING
+        for key in list(self._inserts)[:overflow]:
+            del self._inserts[key]
+        metrics.incr('event_sink.dropped', overflow)
+        logger.error("Event sink navbati to'ldi, %d ta yozuv tashlandi", overflow)
+
+    # Flushing
+
+    def _ensure_started(self):
+        if self._closing:
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name='event_sink')
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Event sink flush error: %s", e)
+                await asyncio.sleep(self.flush_interval)
+
+    def _take(self):
+        inserts = list(self._inserts.values())
+        updates = defaultdict(list)
+        for obj, fields in self._updates.values():
+            # pk yo'q: INSERT shu batch'da (oxirgi qiymatlar bilan) ketadi yoki tashlangan
+            if obj.pk is not None:
+                updates[(type(obj), tuple(sorted(fields)))].append(obj)
+        self._inserts = {}
+        self._updates = {}
+        return inserts, dict(updates)
+
+    def _requeue(self, inserts: list, updates: dict):
+        for obj in inserts:
+            if obj.pk is None:
+                self._inserts.setdefault(id(obj), obj)
+        for (model, fields), objs in updates.items():
+            for obj in objs:
+                self.save(obj, fields)
+
+    async def flush(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            if not self.pending():
+                return
+            inserts, updates = self._take()
+            if not inserts and not updates:
+                return
+            count = len(inserts) + sum(len(v) for v in updates.values())
+            started = time.perf_counter()
+            try:
+                await repository.write_events(inserts, updates)
+            except Exception as e:
+                # Tranzaksiya bekor bo'ldi — bulk_create bergan pk'lar haqiqiy emas
+                for obj in inserts:
+                    obj.pk = None
+                    obj._state.adding = True
+                if not isinstance(e, (IntegrityError, ValueError)):
+                    # Masalan "database is locked" — keyingi flush'da qayta urinamiz
+                    self._requeue(inserts, updates)
+                    metrics.incr('event_sink.flush_errors')
+                    raise
+                logger.warning("Event batch xato (%s), yozuvlar alohida saqlanadi", e)
+                try:
+                    dropped = await repository.write_events_one_by_one(inserts, updates)
+                except DatabaseError:
+                    self._requeue(inserts, updates)
+                    metrics.incr('event_sink.flush_errors')
+                    raise
+                metrics.incr('event_sink.dropped', dropped)
+            metrics.observe('event_sink.flush_seconds', time.perf_counter() - started)
+            metrics.incr('event_sink.written', count)
+
+    async def close(self):
+        """Shutdown: fon task'ni to'xtatib, qolganini yozadi"""
+        # cancel() emas: wait_for bir vaqtda uyg'onsa cancel yutilib ketishi mumkin
+        self._closing = True
+        if self._task:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        for attempt in range(CLOSE_RETRIES):
+            try:
+                await self.flush()
+            except DatabaseError as e:
+                logger.warning("Event sink yopishda xato (%d-urinish): %s", attempt + 1, e)
+                await asyncio.sleep(1)
+                continue
+            if not self.pending():
+                return
+        if self.pending():
+            logger.error("Event sink: %d ta yozuv saqlanmay qoldi", self.pending())
+
+
+event_sink = EventSink()
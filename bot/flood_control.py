@@ -0,0 +1,256 @@
+"""Outbound flood control for Bot API calls.
+
+Application.builder().rate_limiter(FloodControl()) — bot.send_*, reply_*,
+edit_*, delete va boshqalar shu yerdan o'tadi:
+
+- Global: BOT_FLOOD_GLOBAL_RATE xabar/soniya (supervisor rejimida workerlar
+  o'rtasida bo'linadi).
+- Chat: shaxsiy chatda BOT_FLOOD_CHAT_RATE/soniya, guruhda
+  BOT_FLOOD_GROUP_RATE/daqiqa; kichik burst'ga ruxsat.
+- Ustuvorlik: fayl yuborish > oddiy javob > status edit/delete/chat action.
+  Bitta chat ichida tartib saqlanadi (FIFO), ustuvorlik chatlar orasida.
+- Coalesce: bir xabarga navbatda turgan edit bo'lsa, yangisi uning o'rnini
+  oladi — faqat oxirgi "⏳" matni yuboriladi, hamma chaqiruvchi bitta
+  natijani oladi.
+- RetryAfter: chat (chat_id bo'lmasa — hammasi) retry_after ga to'xtatiladi,
+  so'rov navbat boshiga qaytadi.
+
+chat_id siz so'rovlar (getFile, answerCallbackQuery, getUpdates ...) navbatga
+qo'yilmaydi, faqat global pauzani kutadi.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv('BOT_FLOOD_GLOBAL_RATE', '30'))
+CHAT_RATE = float(os.getenv('BOT_FLOOD_CHAT_RATE', '1'))
+GROUP_RATE_PER_MINUTE = float(os.getenv('BOT_FLOOD_GROUP_RATE', '20'))
+CHAT_BURST = int(os.getenv('BOT_FLOOD_CHAT_BURST', '3'))
+MAX_RETRIES = int(os.getenv('BOT_FLOOD_MAX_RETRIES', '3'))
+
+PRIORITY_FILE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_STATUS = 2
+
+FILE_ENDPOINTS = {
+    'sendVideo', 'sendAudio', 'sendDocument', 'sendVoice', 'sendAnimation',
+    'sendVideoNote', 'sendMediaGroup',
+}
+STATUS_ENDPOINTS = {
+    'editMessageText', 'editMessageCaption', 'deleteMessage', 'deleteMessages', 'sendChatAction',
+}
+COALESCED_ENDPOINTS = {'editMessageText', 'editMessageCaption'}
+
+
+def endpoint_priority(endpoint: str) -> int:
+    if endpoint in FILE_ENDPOINTS:
+        return PRIORITY_FILE
+    if endpoint in STATUS_ENDPOINTS:
+        return PRIORITY_STATUS
+    return PRIORITY_NORMAL
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    retry = error.retry_after
+    return retry.total_seconds() if hasattr(retry, 'total_seconds') else float(retry)
+
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'key', 'call', 'future', 'retries')
+
+    def __init__(self, priority, seq, chat_id, key, call, max_retries):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.key = key
+        self.call = call
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.retries = max_retries
+
+
+class _Chat:
+    __slots__ = ('queue', 'tat', 'paused_until', 'interval')
+
+    def __init__(self, interval: float):
+        self.queue: Deque[_Request] = deque()
+        # GCRA: CHAT_BURST ta xabar ketma-ket, keyin har interval'da bittadan
+        self.tat = 0.0
+        self.paused_until = 0.0
+        self.interval = interval
+
+    def ready_at(self) -> float:
+        return max(self.paused_until, self.tat - (CHAT_BURST - 1) * self.interval)
+
+
+class FloodControl(BaseRateLimiter):
+    def __init__(self, global_rate: float = GLOBAL_RATE, max_retries: int = MAX_RETRIES, workers: int = 1):
+        # Bot token'ining global limiti hamma worker process'lar uchun bitta
+        self.global_interval = max(1, workers) / global_rate
+        self.max_retries = max_retries
+        self._chats: Dict[Any, _Chat] = {}
+        self._coalesce: Dict[tuple, _Request] = {}
+        self._seq = itertools.count()
+        self._global_next = 0.0
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running = set()
+        metrics.gauge('flood.queued', self.queued)
+
+    def queued(self) -> int:
+        return sum(len(chat.queue) for chat in self._chats.values())
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch(), name='flood_control')
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for chat in self._chats.values():
+            for request in chat.queue:
+                if not request.future.done():
+                    request.future.cancel()
+        self._chats.clear()
+        self._coalesce.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        call = (callback, args, kwargs)
+        chat_id = data.get('chat_id')
+        if chat_id is None or self._dispatcher is None:
+            return await self._call_direct(call, rate_limit_args or self.max_retries)
+
+        key = None
+        if endpoint in COALESCED_ENDPOINTS and data.get('message_id') is not None:
+            key = (endpoint, chat_id, data['message_id'])
+            queued = self._coalesce.get(key)
+            if queued is not None:
+                # Hali yuborilmagan edit: faqat oxirgi matn ketadi
+                queued.call = call
+                metrics.incr('flood.coalesced')
+                return await asyncio.shield(queued.future)
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self._chat_interval(chat_id))
+        request = _Request(
+            endpoint_priority(endpoint), next(self._seq), chat_id, key, call,
+            rate_limit_args or self.max_retries,
+        )
+        chat.queue.append(request)
+        if key:
+            self._coalesce[key] = request
+        self._wakeup.set()
+        return await asyncio.shield(request.future)
+
+    @staticmethod
+    def _chat_interval(chat_id) -> float:
+        try:
+            is_group = int(chat_id) < 0
+        except (TypeError, ValueError):
+            # @kanal_nomi
+            is_group = True
+        return 60.0 / GROUP_RATE_PER_MINUTE if is_group else 1.0 / CHAT_RATE
+
+    async def _call_direct(self, call, retries: int):
+        callback, args, kwargs = call
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                metrics.incr('flood.retry_after')
+                self._paused_until = time.monotonic() + _retry_seconds(e) + 0.1
+
+    # Dispatcher
+
+    def _next_request(self, now: float):
+        """Tayyor chatlar navbat boshidagi so'rovlardan eng ustuvori; bo'lmasa eng yaqin vaqt"""
+        best = None
+        best_chat = None
+        wait_until = None
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.queue:
+                if chat.tat <= now and chat.paused_until <= now:
+                    del self._chats[chat_id]
+                continue
+            ready = chat.ready_at()
+            if ready > now:
+                wait_until = ready if wait_until is None else min(wait_until, ready)
+                continue
+            head = chat.queue[0]
+            if best is None or (head.priority, head.seq) < (best.priority, best.seq):
+                best, best_chat = head, chat
+        return best, best_chat, wait_until
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            start_at = max(self._global_next, self._paused_until)
+            if start_at > now:
+                await asyncio.sleep(start_at - now)
+                continue
+            request, chat, wait_until = self._next_request(now)
+            if request is None:
+                self._wakeup.clear()
+                timeout = None if wait_until is None else max(0.0, wait_until - now)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            chat.queue.popleft()
+            if request.key:
+                self._coalesce.pop(request.key, None)
+            chat.tat = max(chat.tat, now) + chat.interval
+            self._global_next = now + self.global_interval
+            task = asyncio.create_task(self._run(request, chat))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, request: _Request, chat: _Chat):
+        callback, args, kwargs = request.call
+        try:
+            result = await callback(*args, **kwargs)
+        except RetryAfter as e:
+            if request.retries <= 0:
+                logger.warning("Flood control: chat %s uchun RetryAfter, urinishlar tugadi", request.chat_id)
+                request.future.set_exception(e)
+                return
+            request.retries -= 1
+            metrics.incr('flood.retry_after')
+            # Bo'sh chat shu orada o'chirilgan (yoki qayta yaratilgan) bo'lishi mumkin
+            chat = self._chats.setdefault(request.chat_id, chat)
+            chat.paused_until = time.monotonic() + _retry_seconds(e) + 0.1
+            # Chat navbatining boshiga qaytadi (tartib buzilmaydi)
+            chat.queue.appendleft(request)
+            if request.key:
+                self._coalesce.setdefault(request.key, request)
+            self._wakeup.set()
+        except Exception as e:
+            request.future.set_exception(e)
+        else:
+            request.future.set_result(result)
+            metrics.incr('flood.sent')
@@ -2,18 +2,24 @@
 import asyncio
 import logging
 import os
+from uuid import uuid4
 from telegram import Update
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
 from django.conf import settings
 
-from core.models import TelegramUser, DownloadHistory, ShazamLog
+from core.models import DownloadHistory, ShazamLog
 from django.utils import timezone
 from services.downloaders.factory import DownloaderFactory
-from services.downloaders.ytdl_utils import get_ydl_base_opts
+from services.downloaders.strategy import AUDIO_STRATEGIES, download_with_strategies
+from services.search.engine import remember_download, resolve_spotify
 from services.shazam.service import ShazamService
-from .download import process_download
-from .search import format_results, build_search_keyboard
+from bot.concurrency import background
+from bot.event_sink import event_sink
+from bot.quota import DOWNLOADS, SHAZAMS, acquire, refund, refund_on_error
+from bot.rate_limit import COST_CHEAP, COST_EXPENSIVE, allow
+from bot.session import DownloadOffer, SearchSession, Track, get_sessions
+from .download import file_too_large_text, platform_disabled_text, process_download
+from .search import build_search_keyboard, ensure_page, format_results, prefetch_next_page
 
 logger = logging.getLogger(__name__)
 
@@ -24,94 +30,11 @@ shazam_service = ShazamService()
 
 async def _download_youtube_audio(url: str, video_id: str) -> str | None:
     """Download audio from YouTube URL, return file path or None."""
-    import yt_dlp
-
-    output_path = os.path.join(DOWNLOADS_DIR, f'{video_id}_audio')
-
-    for old in [f'{output_path}.{e}' for e in ['mp3','m4a','webm','ogg','opus','wav']]:
-        try:
-            if os.path.exists(old):
-                os.remove(old)
-        except OSError:
-            pass
-
-    base_opts = get_ydl_base_opts()
-
-    # 1-usul: ffmpeg bilan mp3 ga convert
-    ydl_opts = {
-        **base_opts,
-        'format': 'bestaudio/best',
-        'outtmpl': f'{output_path}.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-    }
-
-    try:
-        def _do_download():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-        await asyncio.to_thread(_do_download)
-    except Exception as e:
-        logger.error("Audio download (ffmpeg) xato: %s", e)
-
-    # Tekshir — fayl bormi
-    for ext in ['mp3', 'm4a', 'webm', 'ogg', 'opus', 'wav']:
-        p = f'{output_path}.{ext}'
-        if os.path.exists(p) and os.path.getsize(p) > 0:
-            logger.info("Audio topildi (1-usul): %s [%d bytes]", p, os.path.getsize(p))
-            return p
-
-    # 2-usul: ffmpeg'siz — raw audio formatda
-    logger.warning("1-usul ishlamadi, 2-usul (ffmpeg'siz) boshlanmoqda: %s", url)
-    ydl_opts_fallback = {
-        **base_opts,
-        'format': 'bestaudio/best',
-        'outtmpl': f'{output_path}.%(ext)s',
-    }
-
-    try:
-        def _do_fallback():
-            with yt_dlp.YoutubeDL(ydl_opts_fallback) as ydl:
-                ydl.download([url])
-        await asyncio.to_thread(_do_fallback)
-    except Exception as e2:
-        logger.error("Audio fallback xato: %s", e2)
-
-    for ext in ['mp3', 'm4a', 'webm', 'ogg', 'opus', 'wav', 'mp4']:
-        p = f'{output_path}.{ext}'
-        if os.path.exists(p) and os.path.getsize(p) > 0:
-            logger.info("Audio topildi (2-usul): %s [%d bytes]", p, os.path.getsize(p))
-            return p
-
-    # 3-usul: format=worstaudio (eng kichik fayl)
-    logger.warning("2-usul ham ishlamadi, 3-usul boshlanmoqda: %s", url)
-    ydl_opts_last = {
-        **base_opts,
-        'format': 'worstaudio/worst',
-        'outtmpl': f'{output_path}.%(ext)s',
-    }
-
-    try:
-        def _do_last():
-            with yt_dlp.YoutubeDL(ydl_opts_last) as ydl:
-                ydl.download([url])
-        await asyncio.to_thread(_do_last)
-    except Exception as e3:
-        logger.error("Audio 3-usul xato: %s", e3)
-        return None
-
-    for ext in ['mp3', 'm4a', 'webm', 'ogg', 'opus', 'wav', 'mp4']:
-        p = f'{output_path}.{ext}'
-        if os.path.exists(p) and os.path.getsize(p) > 0:
-            logger.info("Audio topildi (3-usul): %s [%d bytes]", p, os.path.getsize(p))
-            return p
-
-    logger.error("Hech qanday usul ishlamadi: %s", url)
-    return None
+    # Bir trekni ikki foydalanuvchi bir vaqtda tanlashi mumkin — har so'rovga alohida fayl
+    output_base = os.path.join(DOWNLOADS_DIR, f'{video_id}_{uuid4().hex}_audio')
+    return await asyncio.to_thread(
+        download_with_strategies, 'youtube', url, output_base, AUDIO_STRATEGIES
+    )
 
 
 async def _reply_shazam_from_callback(query, result: dict):
@@ -139,49 +62,32 @@ async def _reply_shazam_from_callback(query, result: dict):
         )
 
 
-async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle callback queries"""
+@background
+async def _download_selected_track(update: Update, context: ContextTypes.DEFAULT_TYPE, track: Track, url: str):
+    """Qidiruv natijasidan tanlangan qo'shiqni audio qilib yuboradi"""
     query = update.callback_query
-    await query.answer()
-    data = query.data
-
-    if data == 'cancel':
-        await query.message.delete()
-        context.user_data.pop('results', None)
-        context.user_data.pop('page', None)
-        return
 
-    if data.startswith('page_'):
-        results = context.user_data.get('results', [])
-        page = int(data.split('_')[1])
-        if page < 0 or page * 10 >= len(results):
-            return
-        context.user_data['page'] = page
-        text = format_results(results, page=page)
-        await query.message.edit_text(
-            text, reply_markup=build_search_keyboard(page=page)
-        )
-        return
-
-    if data.startswith('select_'):
-        results = context.user_data.get('results', [])
-        index = int(data.split('_')[1])
-        if index < 0 or index >= len(results):
-            await query.message.reply_text("Natija topilmadi. Qaytadan qidiring.")
+    if track.is_spotify:
+        resolved = await resolve_spotify({
+            'id': track.id, 'title': track.title, 'artist': track.artist,
+            'duration': track.duration, 'url': track.url, 'isrc': track.isrc,
+        })
+        if not resolved:
+            await query.message.reply_text(
+                f"❌ \"{track.title}\" YouTube'dan topilmadi.\n\n"
+                "💡 Boshqa natijani tanlang yoki qo'shiq nomini boshqacha yozing."
+            )
             return
+        track = Track.from_dict(resolved)
+        url = track.watch_url
 
-        track = results[index]
-        title = track.get('title', 'Audio')
-        url = track.get('url', '')
-        video_id = track.get('id', '')
-
-        if not url:
-            await query.message.reply_text("URL topilmadi. Qaytadan qidiring.")
-            return
+    title = track.title
+    video_id = track.id
 
-        if not url.startswith("http"):
-            url = f"https://www.youtube.com/watch?v={video_id}"
+    if not await acquire(update, context, DOWNLOADS):
+        return
 
+    with refund_on_error(context, DOWNLOADS):
         status_msg = await query.message.reply_text(
             f"⏳ \"{title}\" yuklanmoqda...\n"
             "Biroz kuting..."
@@ -190,20 +96,22 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         file_path = await _download_youtube_audio(url, video_id)
 
         if file_path and os.path.exists(file_path):
+            file_size = os.path.getsize(file_path)
+            too_large = file_too_large_text(file_size, title)
+            if too_large:
+                refund(context, DOWNLOADS)
             try:
-                user = await sync_to_async(TelegramUser.objects.get)(
-                    telegram_id=query.from_user.id
-                )
-                await sync_to_async(DownloadHistory.objects.create)(
-                    user=user,
+                event_sink.add(DownloadHistory(
+                    user=context.db_user,
                     video_url=url,
                     video_title=title,
                     platform='youtube',
                     format_label='Audio',
-                    status='completed',
-                    file_size=os.path.getsize(file_path),
-                    completed_at=await sync_to_async(timezone.now)(),
-                )
+                    status='failed' if too_large else 'completed',
+                    error_message='File too large' if too_large else None,
+                    file_size=file_size,
+                    completed_at=None if too_large else timezone.now(),
+                ))
             except Exception as e:
                 logger.warning("DownloadHistory save error: %s", e)
 
@@ -213,20 +121,17 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 pass
 
             try:
-                file_size = os.path.getsize(file_path)
-                if file_size > 50 * 1024 * 1024:
-                    await query.message.reply_text(
-                        f"⚠️ \"{title}\" hajmi {file_size // (1024*1024)}MB — "
-                        "Telegram limiti 50MB. Kichikroq qo'shiq tanlang."
-                    )
+                if too_large:
+                    await query.message.reply_text(too_large + " Kichikroq qo'shiq tanlang.")
                 else:
                     with open(file_path, 'rb') as f:
-                        await query.message.reply_audio(
+                        sent = await query.message.reply_audio(
                             audio=f,
                             title=title,
-                            performer=track.get('artist', ''),
+                            performer=track.artist,
                             caption=f"🎵 {title}",
                         )
+                    remember_download(url, title, track.artist, track.duration, sent.audio.file_id if sent.audio else "")
             except Exception as e:
                 logger.error("Send audio error: %s", e)
                 await query.message.reply_text(
@@ -239,6 +144,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except OSError:
                     pass
         else:
+            refund(context, DOWNLOADS)
             try:
                 await status_msg.delete()
             except Exception:
@@ -248,55 +154,28 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"❌ \"{title}\" yuklab bo'lmadi.\n\n"
                 "💡 Qaytadan urinib ko'ring yoki boshqa qo'shiqni tanlang."
             )
-        return
 
-    if data.startswith('ytdl_'):
-        parts = data.split('_', 2)
-        callback_video_id = parts[1]
-        quality = parts[2]
-
-        info = None
-        url = None
-        url_hash = None
-
-        for key in list(context.user_data.keys()):
-            if key.startswith('video_id_'):
-                stored_hash = key.replace('video_id_', '')
-                stored_video_id = context.user_data.get(key)
-                if stored_video_id == callback_video_id:
-                    url_hash = stored_hash
-                    url = context.user_data.get(f'url_{stored_hash}')
-                    info = context.user_data.get(f'info_{stored_hash}')
-                    break
-
-        if not info or not url:
-            for key in list(context.user_data.keys()):
-                if key.startswith('info_'):
-                    stored_hash = key.replace('info_', '')
-                    stored_info = context.user_data.get(key)
-                    stored_url = context.user_data.get(f'url_{stored_hash}')
-                    if stored_info and stored_url:
-                        stored_video_id = str(stored_info.get('id', ''))[:20]
-                        if stored_video_id == callback_video_id:
-                            info = stored_info
-                            url = stored_url
-                            url_hash = stored_hash
-                            break
-
-        if not info or not url:
-            await query.message.reply_text("Video ma'lumotlari topilmadi. Havolani qayta yuboring.")
-            return
 
-        label = f'{quality}p' if quality != 'audio' else 'Audio'
+@background
+async def _download_youtube_format(update: Update, context: ContextTypes.DEFAULT_TYPE, offer: DownloadOffer, quality: str):
+    """YouTube videoni tanlangan formatda yuklab yuboradi"""
+    query = update.callback_query
+    url = offer.url
+    info = {'title': offer.title}
+    label = f'{quality}p' if quality != 'audio' else 'Audio'
+    if not await acquire(update, context, DOWNLOADS):
+        return
+    with refund_on_error(context, DOWNLOADS):
         await query.message.reply_text(f"⏳ \"{info['title']}\" ({label}) yuklanmoqda...")
 
         downloader = DownloaderFactory.get_downloader(url)
         if not downloader:
+            refund(context, DOWNLOADS)
             await query.message.reply_text("Yuklab bo'lmadi.")
             return
 
-        video_id_hash = str(abs(hash(url)))[-10:]
-        output_path = os.path.join(DOWNLOADS_DIR, f'youtube_{video_id_hash}_{quality}.mp4' if quality != 'audio' else f'youtube_{video_id_hash}_audio.mp3')
+        file_key = uuid4().hex
+        output_path = os.path.join(DOWNLOADS_DIR, f'youtube_{file_key}_{quality}.mp4' if quality != 'audio' else f'youtube_{file_key}_audio.mp3')
 
         if quality == 'audio':
             file_path = await asyncio.to_thread(downloader.download_audio, url, output_path)
@@ -305,26 +184,33 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         if file_path and os.path.exists(file_path):
             try:
-                user = await sync_to_async(TelegramUser.objects.get)(telegram_id=query.from_user.id)
-                await sync_to_async(DownloadHistory.objects.create)(
-                    user=user,
+                too_large = file_too_large_text(os.path.getsize(file_path), info['title'])
+                if too_large:
+                    refund(context, DOWNLOADS)
+                    await query.message.reply_text(too_large + " Kichikroq formatni tanlang.")
+                    return
+                event_sink.add(DownloadHistory(
+                    user=context.db_user,
                     video_url=url,
                     video_title=info['title'],
                     platform='youtube',
                     format_label=label,
                     status='completed',
                     file_size=os.path.getsize(file_path),
-                    completed_at=await sync_to_async(timezone.now)(),
-                )
+                    completed_at=timezone.now(),
+                ))
+                file_id = ""
                 with open(file_path, 'rb') as f:
                     if quality == 'audio':
-                        await query.message.reply_audio(
+                        sent = await query.message.reply_audio(
                             audio=f, title=info['title'], caption=f"🎵 {info['title']}"
                         )
+                        file_id = sent.audio.file_id if sent.audio else ""
                     else:
                         await query.message.reply_video(
                             video=f, caption=f"📁 {info['title']} ({label})", supports_streaming=True
                         )
+                remember_download(url, info['title'], file_id=file_id)
             except Exception as e:
                 logger.error("ytdl send error: %s", e)
                 await query.message.reply_text("Fayl juda katta yoki xatolik yuz berdi. Kichikroq formatni tanlang.")
@@ -334,50 +220,25 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except OSError:
                     pass
         else:
+            refund(context, DOWNLOADS)
             await query.message.reply_text("Yuklab bo'lmadi. Boshqa formatni tanlang.")
-        return
 
-    if data.startswith('social_video_') or data.startswith('social_audio_'):
-        parts = data.split('_')
-        if len(parts) < 4:
-            await query.message.reply_text("Xatolik: noto'g'ri callback data.")
-            return
-
-        action = parts[1]
-        platform = parts[2]
-        url_hash = parts[3]
 
-        try:
-            await process_download(update, context, url_hash, action, None)
-        except Exception as e:
-            logger.error("process_download error: %s", e)
-            await query.message.reply_text("Yuklashda xatolik yuz berdi. Qaytadan urinib ko'ring.")
+@background
+async def _recognize_instagram_music(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, token: str, downloader):
+    """Instagram videodagi musiqani Shazam orqali aniqlaydi"""
+    query = update.callback_query
+    if not await acquire(update, context, SHAZAMS):
         return
-
-    if data.startswith("music_instagram_"):
-        parts = data.split("_", 2)
-        if len(parts) < 3:
-            await query.message.reply_text("Xatolik: noto'g'ri callback data.")
-            return
-
-        url_hash = parts[2]
-        url = context.user_data.get(f"url_{url_hash}")
-        if not url:
-            await query.message.reply_text("Havola topilmadi. Qayta yuboring.")
-            return
-
-        downloader = DownloaderFactory.get_downloader(url)
-        if not downloader:
-            await query.message.reply_text("Platforma aniqlanmadi.")
-            return
-
+    with refund_on_error(context, SHAZAMS):
         await query.message.reply_text("🎧 Musiqa qidirilmoqda (Shazam)...")
 
-        tmp_name = f"insta_music_{url_hash}_{query.message.message_id}.mp4"
+        tmp_name = f"insta_music_{uuid4().hex}.mp4"
         tmp_path = os.path.join(DOWNLOADS_DIR, tmp_name)
 
         file_path = await asyncio.to_thread(downloader.download_video, url, tmp_path, None)
         if not file_path or not os.path.exists(file_path):
+            refund(context, SHAZAMS)
             await query.message.reply_text(
                 "Video yuklab bo'lmadi. Ko'p hollarda bu ffmpeg yo'qligi sababli bo'ladi.\n"
                 "ffmpeg o'rnating va botni qayta ishga tushiring."
@@ -387,15 +248,14 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             result = await shazam_service.recognize(file_path)
 
-            tg_user = await sync_to_async(TelegramUser.objects.get)(telegram_id=query.from_user.id)
-            await sync_to_async(ShazamLog.objects.create)(
-                user=tg_user,
+            event_sink.add(ShazamLog(
+                user=context.db_user,
                 audio_file_name=os.path.basename(file_path),
                 recognized_title=result.get("title") if result and result.get("is_successful") else None,
                 recognized_artist=result.get("artist") if result and result.get("is_successful") else None,
                 is_successful=bool(result and result.get("is_successful")),
                 error_message=None if result and result.get("is_successful") else (result.get("error_message") if result else "No result"),
-            )
+            ))
 
             await _reply_shazam_from_callback(query, result or {"is_successful": False, "error_message": "No result"})
         finally:
@@ -403,3 +263,130 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 os.remove(file_path)
             except OSError:
                 pass
+
+
+async def _show_page(update: Update, context: ContextTypes.DEFAULT_TYPE, sessions, token: str, search: SearchSession, page: int):
+    search.page = page
+    await update.callback_query.message.edit_text(
+        format_results(search.tracks, page=page), reply_markup=build_search_keyboard(token, page=page)
+    )
+    prefetch_next_page(context, sessions, token, search)
+
+
+@background
+async def _load_page(update: Update, context: ContextTypes.DEFAULT_TYPE, sessions, token: str, search: SearchSession, page: int):
+    """Hali olinmagan sahifa: keyingi bo'lak kelgach xabar tahrirlanadi"""
+    tapped = search.touched
+    if not await ensure_page(sessions, token, search, page):
+        return
+    if search.touched != tapped:
+        # Kutish paytida shu ro'yxatda yana tugma bosilgan — eski tahrir kerak emas
+        return
+    await _show_page(update, context, sessions, token, search, page)
+
+
+async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle callback queries"""
+    query = update.callback_query
+    data = query.data
+    cheap = data.startswith('page_') or data.startswith('cancel')
+    if not await allow(update, COST_CHEAP if cheap else COST_EXPENSIVE):
+        return
+    await query.answer()
+    sessions = get_sessions(update, context)
+
+    if data.startswith('cancel'):
+        await query.message.delete()
+        sessions.remove(data.partition('_')[2])
+        return
+
+    if data.startswith('page_'):
+        parts = data.split('_')
+        search = sessions.get(parts[1], SearchSession) if len(parts) == 3 else None
+        if not search:
+            return
+        page = int(parts[2])
+        if page < 0:
+            return
+        if page * 10 < len(search.tracks):
+            await _show_page(update, context, sessions, parts[1], search, page)
+        elif search.cursor is not None:
+            # Prefetch ulgurmagan: yuklash chat navbatini band qilmasin
+            await _load_page(update, context, sessions, parts[1], search, page)
+        return
+
+    if data.startswith('select_'):
+        parts = data.split('_')
+        search = sessions.get(parts[1], SearchSession) if len(parts) == 3 else None
+        index = int(parts[2]) if search else -1
+        if not search or index < 0 or index >= len(search.tracks):
+            await query.message.reply_text("Natija topilmadi. Qaytadan qidiring.")
+            return
+
+        disabled = platform_disabled_text('youtube')
+        if disabled:
+            await query.message.reply_text(disabled)
+            return
+
+        track = search.tracks[index]
+        url = track.watch_url
+        if not url:
+            await query.message.reply_text("URL topilmadi. Qaytadan qidiring.")
+            return
+
+        await _download_selected_track(update, context, track, url)
+        return
+
+    if data.startswith('ytdl_'):
+        parts = data.split('_', 2)
+        offer = sessions.get(parts[1], DownloadOffer) if len(parts) == 3 else None
+        if not offer:
+            await query.message.reply_text("Video ma'lumotlari topilmadi. Havolani qayta yuboring.")
+            return
+
+        disabled = platform_disabled_text(offer.platform)
+        if disabled:
+            await query.message.reply_text(disabled)
+            return
+
+        await _download_youtube_format(update, context, offer, parts[2])
+        return
+
+    if data.startswith('social_video_') or data.startswith('social_audio_'):
+        parts = data.split('_')
+        if len(parts) < 4:
+            await query.message.reply_text("Xatolik: noto'g'ri callback data.")
+            return
+
+        action = parts[1]
+        offer = sessions.get(parts[3], DownloadOffer)
+        if not offer:
+            await query.message.reply_text("Havola topilmadi. Qayta yuboring.")
+            return
+
+        await process_download(update, context, offer, action, None)
+        return
+
+    if data.startswith("music_instagram_"):
+        parts = data.split("_", 2)
+        if len(parts) < 3:
+            await query.message.reply_text("Xatolik: noto'g'ri callback data.")
+            return
+
+        offer = sessions.get(parts[2], DownloadOffer)
+        if not offer:
+            await query.message.reply_text("Havola topilmadi. Qayta yuboring.")
+            return
+
+        disabled = platform_disabled_text(offer.platform)
+        if disabled:
+            await query.message.reply_text(disabled)
+            return
+
+        url = offer.url
+        downloader = DownloaderFactory.get_downloader(url)
+        if not downloader:
+            await query.message.reply_text("Platforma aniqlanmadi.")
+            return
+
+        await _recognize_instagram_music(update, context, url, parts[2], downloader)
@@ -2,14 +2,20 @@
 import asyncio
 import os
 import shutil
+from uuid import uuid4
 from urllib.parse import quote
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
 from django.conf import settings
-
-from core.models import DownloadHistory, TelegramUser
+from django.utils import timezone
+
+from bot.concurrency import background
+from bot.event_sink import event_sink
+from bot.quota import DOWNLOADS, acquire, refund, refund_on_error
+from bot.session import DownloadOffer, get_sessions
+from bot.settings_cache import settings_cache
+from core.models import DownloadHistory
 from services.downloaders.factory import DownloaderFactory
 
 DOWNLOADS_DIR = os.path.join(settings.BASE_DIR, 'downloads')
@@ -24,6 +30,23 @@ PLATFORM_NAMES = {
 }
 
 
+def platform_disabled_text(platform):
+    """Platforma admin panelda o'chirilgan bo'lsa foydalanuvchiga xabar, aks holda None"""
+    if settings_cache.platform_enabled(platform):
+        return None
+    return f"⛔ {PLATFORM_NAMES.get(platform, platform)} dan yuklash hozircha o'chirilgan."
+
+
+def file_too_large_text(file_size, title):
+    """Fayl BotSettings.max_file_size_mb dan katta bo'lsa xabar, aks holda None"""
+    if file_size <= settings_cache.max_file_size:
+        return None
+    return (
+        f"⚠️ \"{title}\" hajmi {file_size // (1024 * 1024)}MB — "
+        f"limit {settings_cache.current.max_file_size_mb}MB."
+    )
+
+
 def format_filesize(size_bytes):
     """Format file size"""
     if not size_bytes:
@@ -34,7 +57,7 @@ def format_filesize(size_bytes):
     return f'{size_bytes / 1024:.0f}KB'
 
 
-def build_youtube_keyboard(qualities, video_id):
+def build_youtube_keyboard(qualities, token):
     """Build YouTube quality selection keyboard"""
     rows = []
     row = []
@@ -43,7 +66,7 @@ def build_youtube_keyboard(qualities, video_id):
         size = format_filesize(fmt['filesize'])
         icon = '🎵' if label == 'Audio' else '📁'
         btn_text = f"{icon} {label} - {size}"
-        callback = f"ytdl_{video_id}_{fmt['height']}"
+        callback = f"ytdl_{token}_{fmt['height']}"
         row.append(InlineKeyboardButton(btn_text, callback_data=callback))
         if len(row) == 2 or label == 'Audio':
             rows.append(row)
@@ -53,12 +76,12 @@ def build_youtube_keyboard(qualities, video_id):
     return InlineKeyboardMarkup(rows)
 
 
-def build_social_keyboard(platform, url_hash):
+def build_social_keyboard(platform, token):
     """Build social media download keyboard"""
     return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton('📁 Video', callback_data=f'social_video_{platform}_{url_hash}'),
-            InlineKeyboardButton('🎵 Audio', callback_data=f'social_audio_{platform}_{url_hash}'),
+            InlineKeyboardButton('📁 Video', callback_data=f'social_video_{platform}_{token}'),
+            InlineKeyboardButton('🎵 Audio', callback_data=f'social_audio_{platform}_{token}'),
         ]
     ])
 
@@ -84,7 +107,7 @@ def _ffmpeg_available() -> bool:
     return False
 
 
-def _build_instagram_keyboard(instagram_url: str, bot_username: str, url_hash: str) -> InlineKeyboardMarkup:
+def _build_instagram_keyboard(instagram_url: str, bot_username: str, token: str) -> InlineKeyboardMarkup:
     """
     Instagram video tagidagi tugmalar:
     - Musiqasini qidirish (Shazam)
@@ -95,79 +118,93 @@ def _build_instagram_keyboard(instagram_url: str, bot_username: str, url_hash: s
     share_url = f"https://t.me/share/url?url={quote(instagram_url)}&text={quote(share_text)}"
     return InlineKeyboardMarkup(
         [
-            [InlineKeyboardButton("🎧 Musiqasini qidirish", callback_data=f"music_instagram_{url_hash}")],
+            [InlineKeyboardButton("🎧 Musiqasini qidirish", callback_data=f"music_instagram_{token}")],
             [InlineKeyboardButton("📤 Do'stlarga yuborish", url=share_url)],
         ]
     )
 
 
-async def _send_instagram_direct(update: Update, context: ContextTypes.DEFAULT_TYPE, user, url: str, url_hash: str, downloader, info: dict):
+async def _send_instagram_direct(update: Update, context: ContextTypes.DEFAULT_TYPE, user, url: str, token: str, downloader, info: dict):
     """
     Instagram link kelganda darhol video yuklab yuboradi.
     """
     platform = "instagram"
     platform_name = PLATFORM_NAMES.get(platform, platform)
 
-    await update.message.reply_text("⏳ Instagram videosi yuklanmoqda...")
+    if not await acquire(update, context, DOWNLOADS):
+        return
+
+    with refund_on_error(context, DOWNLOADS):
+        await update.message.reply_text("⏳ Instagram videosi yuklanmoqda...")
 
-    # DownloadHistory yozuvi
-    download_record = await sync_to_async(DownloadHistory.objects.create)(
-        user=user,
-        video_url=url,
-        video_title=info.get("title", "Instagram Video"),
-        platform=platform,
-        format_label="Video",
-        status="processing",
-    )
+        # DownloadHistory yozuvi
+        download_record = event_sink.add(DownloadHistory(
+            user=user,
+            video_url=url,
+            video_title=info.get("title", "Instagram Video"),
+            platform=platform,
+            format_label="Video",
+            status="processing",
+        ))
+
+        video_id = uuid4().hex
+        output_path = os.path.join(DOWNLOADS_DIR, f"{platform}_{video_id}.mp4")
+
+        file_path = await asyncio.to_thread(downloader.download_video, url, output_path, None)
+        if not file_path or not os.path.exists(file_path):
+            refund(context, DOWNLOADS)
+            download_record.status = "failed"
+            download_record.error_message = "Download failed"
+            event_sink.save(download_record, ['status', 'error_message'])
+
+            msg = (
+                f"{platform_name} dan video yuklab bo'lmadi.\n\n"
+                "Qaytadan urinib ko'ring yoki boshqa havolani yuboring."
+            )
+            await update.message.reply_text(msg)
+            return
 
-    video_id = str(abs(hash(url)))[-10:]
-    output_path = os.path.join(DOWNLOADS_DIR, f"{platform}_{video_id}.mp4")
+        try:
+            too_large = file_too_large_text(os.path.getsize(file_path), info.get("title", "Instagram Video"))
+            if too_large:
+                refund(context, DOWNLOADS)
+                download_record.status = "failed"
+                download_record.error_message = "File too large"
+                event_sink.save(download_record, ['status', 'error_message'])
+                await update.message.reply_text(too_large)
+                return
 
-    file_path = await asyncio.to_thread(downloader.download_video, url, output_path, None)
-    if not file_path or not os.path.exists(file_path):
-        download_record.status = "failed"
-        download_record.error_message = "Download failed"
-        await sync_to_async(download_record.save)()
+            download_record.status = "completed"
+            download_record.file_size = os.path.getsize(file_path)
+            download_record.completed_at = timezone.now()
+            event_sink.save(download_record, ['status', 'file_size', 'completed_at'])
 
-        msg = (
-            f"{platform_name} dan video yuklab bo'lmadi.\n\n"
-            "Qaytadan urinib ko'ring yoki boshqa havolani yuboring."
-        )
-        await update.message.reply_text(msg)
-        return
+            me = await context.bot.get_me()
+            bot_username = getattr(me, "username", "") or ""
+            bot_link = f"https://t.me/{bot_username}" if bot_username else ""
 
-    try:
-        download_record.status = "completed"
-        download_record.file_size = os.path.getsize(file_path)
-        from django.utils import timezone
-        download_record.completed_at = await sync_to_async(timezone.now)()
-        await sync_to_async(download_record.save)()
-
-        me = await context.bot.get_me()
-        bot_username = getattr(me, "username", "") or ""
-        bot_link = f"https://t.me/{bot_username}" if bot_username else ""
-
-        caption = (
-            f"📁 {info.get('title', 'Instagram Video')}\n\n"
-            f"🤖 Bot: {bot_link}\n"
-            f"👨‍💻 Dasturchi: @Husanbek_coder"
-        )
-        keyboard = _build_instagram_keyboard(url, bot_username, url_hash)
-
-        with open(file_path, "rb") as f:
-            await update.message.reply_video(
-                video=f,
-                caption=caption,
-                reply_markup=keyboard,
-                supports_streaming=True,
+            caption = (
+                f"📁 {info.get('title', 'Instagram Video')}\n\n"
+                f"🤖 Bot: {bot_link}\n"
+                f"👨‍💻 Dasturchi: @Husanbek_coder"
             )
-    finally:
-        try:
-            os.remove(file_path)
-        except OSError:
-            pass
+            keyboard = _build_instagram_keyboard(url, bot_username, token)
+
+            with open(file_path, "rb") as f:
+                await update.message.reply_video(
+                    video=f,
+                    caption=caption,
+                    reply_markup=keyboard,
+                    supports_streaming=True,
+                )
+        finally:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
 
 
+@background
 async def handle_download_request(update: Update, context: ContextTypes.DEFAULT_TYPE, user, url, downloader):
     """Handle download request - route to appropriate service"""
     platform = DownloaderFactory.detect_platform(url)
@@ -181,24 +218,19 @@ async def handle_download_request(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text(f"{platform_name} dan ma'lumotlarni olishda xatolik yuz berdi.")
         return
 
-    # Store in context for callback
-    url_hash = str(abs(hash(url)))[-10:]
-    context.user_data[f'url_{url_hash}'] = url
-    context.user_data[f'platform_{url_hash}'] = platform
+    # Callback uchun faqat kerakli maydonlar saqlanadi (formats ro'yxati emas)
+    token = get_sessions(update, context).add(DownloadOffer(url, platform, info.get('title', 'Video')))
 
     if platform == 'youtube':
-        # YouTube has quality options
-        qualities = downloader.get_available_qualities(url)
-        video_id = info.get('id', 'video')[:20]
-        context.user_data[f'info_{url_hash}'] = info
-        context.user_data[f'video_id_{url_hash}'] = video_id  # Store for callback lookup
+        # YouTube has quality options — get_info allaqachon olgan formatlardan
+        qualities = downloader.qualities_from_info(info)
 
         caption = f"📁 {info['title']}\n"
         if info.get('channel'):
             caption += f"👤 {info['channel']}\n"
         caption += "\nFormats to download ↓"
 
-        keyboard = build_youtube_keyboard(qualities, video_id)
+        keyboard = build_youtube_keyboard(qualities, token)
 
         if info.get('thumbnail'):
             try:
@@ -212,13 +244,11 @@ async def handle_download_request(update: Update, context: ContextTypes.DEFAULT_
     else:
         # Instagram: link yuborilganda darhol video yuboramiz
         if platform == "instagram":
-            context.user_data[f'info_{url_hash}'] = info
-            await _send_instagram_direct(update, context, user, url, url_hash, downloader, info)
+            await _send_instagram_direct(update, context, user, url, token, downloader, info)
             return
 
         # Social media platforms
-        keyboard = build_social_keyboard(platform, url_hash)
-        context.user_data[f'info_{url_hash}'] = info
+        keyboard = build_social_keyboard(platform, token)
 
         caption = f"📁 {info['title']}\n"
         if info.get('channel'):
@@ -236,7 +266,8 @@ async def handle_download_request(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text(caption, reply_markup=keyboard)
 
 
-async def process_download(update: Update, context: ContextTypes.DEFAULT_TYPE, url_hash: str, format_type: str, quality: str = None):
+@background
+async def process_download(update: Update, context: ContextTypes.DEFAULT_TYPE, offer: DownloadOffer, format_type: str, quality: str = None):
     """Process download using appropriate service"""
     # Get message from update (callback query or regular message)
     if update.callback_query:
@@ -249,141 +280,155 @@ async def process_download(update: Update, context: ContextTypes.DEFAULT_TYPE, u
         print('[ERROR] Message topilmadi')
         return
 
-    url = context.user_data.get(f'url_{url_hash}')
-    platform = context.user_data.get(f'platform_{url_hash}')
-    
-    if not url:
-        await message.reply_text("Havola topilmadi. Qayta yuboring.")
-        return
+    url = offer.url
+    platform = offer.platform
 
     downloader = DownloaderFactory.get_downloader(url)
     if not downloader:
         await message.reply_text("Platforma aniqlanmadi.")
         return
 
-    platform_name = PLATFORM_NAMES.get(platform, platform)
-    info = context.user_data.get(f'info_{url_hash}', {})
+    disabled = platform_disabled_text(platform)
+    if disabled:
+        await message.reply_text(disabled)
+        return
 
-    if format_type == 'video':
-        await message.reply_text(f"⏳ {platform_name} dan video yuklanmoqda...")
-        
-        # Get user from update
-        user_id = update.effective_user.id if update.effective_user else (update.callback_query.from_user.id if update.callback_query else None)
-        if not user_id:
-            await message.reply_text("Foydalanuvchi ma'lumotlari topilmadi.")
-            return
-        
-        # Create download record
-        user = await sync_to_async(TelegramUser.objects.get)(telegram_id=user_id)
-        download_record = await sync_to_async(DownloadHistory.objects.create)(
-            user=user,
-            video_url=url,
-            video_title=info.get('title', 'Video'),
-            platform=platform,
-            format_label='Video',
-            status='processing',
-        )
+    user = context.db_user
+    if not user:
+        await message.reply_text("Foydalanuvchi ma'lumotlari topilmadi.")
+        return
+
+    if not await acquire(update, context, DOWNLOADS):
+        return
+
+    with refund_on_error(context, DOWNLOADS):
+        platform_name = PLATFORM_NAMES.get(platform, platform)
+        info = {'title': offer.title}
 
-        video_id = str(abs(hash(url)))[-10:]
-        output_path = os.path.join(DOWNLOADS_DIR, f'{platform}_{video_id}.mp4')
+        if format_type == 'video':
+            await message.reply_text(f"⏳ {platform_name} dan video yuklanmoqda...")
+
+            download_record = event_sink.add(DownloadHistory(
+                user=user,
+                video_url=url,
+                video_title=info.get('title', 'Video'),
+                platform=platform,
+                format_label='Video',
+                status='processing',
+            ))
+
+            video_id = uuid4().hex
+            output_path = os.path.join(DOWNLOADS_DIR, f'{platform}_{video_id}.mp4')
         
-        file_path = await asyncio.to_thread(
-            downloader.download_video, url, output_path, quality
-        )
+            file_path = await asyncio.to_thread(
+                downloader.download_video, url, output_path, quality
+            )
 
-        if file_path and os.path.exists(file_path):
-            try:
-                file_size = os.path.getsize(file_path)
-                download_record.status = 'completed'
-                download_record.file_size = file_size
-                from django.utils import timezone
-                download_record.completed_at = await sync_to_async(timezone.now)()
-                await sync_to_async(download_record.save)()
-
-                with open(file_path, 'rb') as f:
-                    await message.reply_video(
-                        video=f,
-                        caption=f"📁 {info.get('title', 'Video')}",
-                        supports_streaming=True
-                    )
-            except Exception as e:
-                download_record.status = 'failed'
-                download_record.error_message = str(e)
-                await sync_to_async(download_record.save)()
-                await message.reply_text("Fayl juda katta yoki xatolik yuz berdi.")
-            finally:
+            if file_path and os.path.exists(file_path):
                 try:
-                    os.remove(file_path)
-                except OSError:
-                    pass
-        else:
-            download_record.status = 'failed'
-            download_record.error_message = 'Download failed'
-            await sync_to_async(download_record.save)()
-            await message.reply_text("Video yuklab bo'lmadi.")
-
-    elif format_type == 'audio':
-        if not _ffmpeg_available():
-            await message.reply_text(
-                "🎵 Audio yuklash uchun **ffmpeg/ffprobe** kerak.\n\n"
-                "Windows:\n"
-                "- `C:\\ffmpeg\\bin` ni PATH ga qo'shing\n"
-                "yoki `.env` ga:\n"
-                "- `FFMPEG_PATH=C:\\ffmpeg\\bin\\ffmpeg.exe`\n\n"
-                "So'ng botni qayta ishga tushiring."
-            )
-            return
+                    file_size = os.path.getsize(file_path)
+                    too_large = file_too_large_text(file_size, info.get('title', 'Video'))
+                    if too_large:
+                        refund(context, DOWNLOADS)
+                        download_record.status = 'failed'
+                        download_record.error_message = 'File too large'
+                        event_sink.save(download_record, ['status', 'error_message'])
+                        await message.reply_text(too_large)
+                        return
+
+                    download_record.status = 'completed'
+                    download_record.file_size = file_size
+                    download_record.completed_at = timezone.now()
+                    event_sink.save(download_record, ['status', 'file_size', 'completed_at'])
+
+                    with open(file_path, 'rb') as f:
+                        await message.reply_video(
+                            video=f,
+                            caption=f"📁 {info.get('title', 'Video')}",
+                            supports_streaming=True
+                        )
+                except Exception as e:
+                    download_record.status = 'failed'
+                    download_record.error_message = str(e)
+                    event_sink.save(download_record, ['status', 'error_message'])
+                    await message.reply_text("Fayl juda katta yoki xatolik yuz berdi.")
+                finally:
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+            else:
+                refund(context, DOWNLOADS)
+                download_record.status = 'failed'
+                download_record.error_message = 'Download failed'
+                event_sink.save(download_record, ['status', 'error_message'])
+                await message.reply_text("Video yuklab bo'lmadi.")
+
+        elif format_type == 'audio':
+            if not _ffmpeg_available():
+                await message.reply_text(
+                    "🎵 Audio yuklash uchun **ffmpeg/ffprobe** kerak.\n\n"
+                    "Windows:\n"
+                    "- `C:\\ffmpeg\\bin` ni PATH ga qo'shing\n"
+                    "yoki `.env` ga:\n"
+                    "- `FFMPEG_PATH=C:\\ffmpeg\\bin\\ffmpeg.exe`\n\n"
+                    "So'ng botni qayta ishga tushiring."
+                )
+                refund(context, DOWNLOADS)
+                return
 
-        await message.reply_text(f"⏳ {platform_name} dan audio yuklanmoqda...")
-        
-        # Get user from update
-        user_id = update.effective_user.id if update.effective_user else (update.callback_query.from_user.id if update.callback_query else None)
-        if not user_id:
-            await message.reply_text("Foydalanuvchi ma'lumotlari topilmadi.")
-            return
-        
-        user = await sync_to_async(TelegramUser.objects.get)(telegram_id=user_id)
-        download_record = await sync_to_async(DownloadHistory.objects.create)(
-            user=user,
-            video_url=url,
-            video_title=info.get('title', 'Audio'),
-            platform=platform,
-            format_label='Audio',
-            status='processing',
-        )
+            await message.reply_text(f"⏳ {platform_name} dan audio yuklanmoqda...")
+
+            download_record = event_sink.add(DownloadHistory(
+                user=user,
+                video_url=url,
+                video_title=info.get('title', 'Audio'),
+                platform=platform,
+                format_label='Audio',
+                status='processing',
+            ))
 
-        video_id = str(abs(hash(url)))[-10:]
-        output_path = os.path.join(DOWNLOADS_DIR, f'{platform}_{video_id}_audio.mp3')
+            video_id = uuid4().hex
+            output_path = os.path.join(DOWNLOADS_DIR, f'{platform}_{video_id}_audio.mp3')
         
-        file_path = await asyncio.to_thread(downloader.download_audio, url, output_path)
+            file_path = await asyncio.to_thread(downloader.download_audio, url, output_path)
 
-        if file_path and os.path.exists(file_path):
-            try:
-                file_size = os.path.getsize(file_path)
-                download_record.status = 'completed'
-                download_record.file_size = file_size
-                from django.utils import timezone
-                download_record.completed_at = await sync_to_async(timezone.now)()
-                await sync_to_async(download_record.save)()
-
-                with open(file_path, 'rb') as f:
-                    await message.reply_audio(
-                        audio=f,
-                        title=info.get('title', 'Audio'),
-                        caption=f"🎵 {info.get('title', 'Audio')}"
-                    )
-            except Exception as e:
-                download_record.status = 'failed'
-                download_record.error_message = str(e)
-                await sync_to_async(download_record.save)()
-                await message.reply_text("Xatolik yuz berdi.")
-            finally:
+            if file_path and os.path.exists(file_path):
                 try:
-                    os.remove(file_path)
-                except OSError:
-                    pass
-        else:
-            download_record.status = 'failed'
-            download_record.error_message = 'Download failed'
-            await sync_to_async(download_record.save)()
-            await message.reply_text("Audio yuklab bo'lmadi.")
+                    file_size = os.path.getsize(file_path)
+                    too_large = file_too_large_text(file_size, info.get('title', 'Audio'))
+                    if too_large:
+                        refund(context, DOWNLOADS)
+                        download_record.status = 'failed'
+                        download_record.error_message = 'File too large'
+                        event_sink.save(download_record, ['status', 'error_message'])
+                        await message.reply_text(too_large)
+                        return
+
+                    download_record.status = 'completed'
+                    download_record.file_size = file_size
+                    download_record.completed_at = timezone.now()
+                    event_sink.save(download_record, ['status', 'file_size', 'completed_at'])
+
+                    with open(file_path, 'rb') as f:
+                        await message.reply_audio(
+                            audio=f,
+                            title=info.get('title', 'Audio'),
+                            caption=f"🎵 {info.get('title', 'Audio')}"
+                        )
+                except Exception as e:
+                    download_record.status = 'failed'
+                    download_record.error_message = str(e)
+                    event_sink.save(download_record, ['status', 'error_message'])
+                    await message.reply_text("Xatolik yuz berdi.")
+                finally:
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+            else:
+                refund(context, DOWNLOADS)
+                download_record.status = 'failed'
+                download_record.error_message = 'Download failed'
+                event_sink.save(download_record, ['status', 'error_message'])
+                await message.reply_text("Audio yuklab bo'lmadi.")
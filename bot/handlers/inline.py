@@ -0,0 +1,137 @@
+"""Inline rejim: istalgan chatda "@bot qo'shiq nomi".
+
+- Avval mahalliy indeks (services/search/local_index: FTS5 prefiks +
+  trigram, yuklab olinganlar reytingi bilan). Ishonchli moslik bo'lsa javob
+  darhol — tashqi so'rovsiz, odatda bir necha ms.
+- Bot avval yuborgan treklar (file_id ma'lum) audio sifatida qaytadi:
+  Telegram faylni qayta yuklamasdan chatga yuboradi. Qolganlari — havola.
+- Indeks yetmasa tashqi qidiruv (cached_search), lekin INLINE_DEBOUNCE
+  kutilgandan keyin: foydalanuvchi yozishda davom etsa, eski so'rov bekor
+  qilinadi va faqat oxirgisi qidiriladi.
+
+BotFather'da inline rejim yoqilgan bo'lishi kerak (/setinline).
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from telegram import (
+    InlineQueryResultArticle, InlineQueryResultCachedAudio, InlineQueryResultsButton,
+    InputTextMessageContent, Update,
+)
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+
+from bot.rate_limit import allow
+from core.metrics import metrics
+from services.search.engine import cached_file_ids, cached_search, local_tracks
+from .search import format_duration
+
+logger = logging.getLogger(__name__)
+
+# Shuncha vaqt ichida yangi harf kelmasa tashqi qidiruv boshlanadi
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.6'))
+# Inline so'rovga ~10 soniyada javob berilmasa Telegram uni eskirgan deb hisoblaydi
+INLINE_REMOTE_TIMEOUT = float(os.getenv('INLINE_REMOTE_TIMEOUT', '6'))
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+# Bundan qisqa so'rovlar faqat mahalliy indeksdan
+INLINE_MIN_REMOTE_CHARS = 3
+# Telegram bitta javobda 50 tagacha natija qabul qiladi
+INLINE_LIMIT = 20
+
+# user id -> kutayotgan (debounce) yoki ketayotgan tashqi qidiruv
+_pending: Dict[int, asyncio.Task] = {}
+
+
+def _results(tracks: List[Dict]) -> list:
+    results = []
+    seen = set()
+    for track in tracks:
+        if len(results) >= INLINE_LIMIT:
+            break
+        key = str(track.get('id') or track.get('url') or '')[:64]
+        if not key or key in seen or not track.get('title'):
+            continue
+        seen.add(key)
+        title = track['title']
+        if track.get('file_id'):
+            results.append(InlineQueryResultCachedAudio(
+                id=key, audio_file_id=track['file_id'], caption=f"🎵 {title}",
+            ))
+            continue
+        details = ' · '.join(filter(None, [track.get('artist'), format_duration(track.get('duration'))]))
+        results.append(InlineQueryResultArticle(
+            id=key,
+            title=title,
+            description=details,
+            url=track.get('url') or None,
+            thumbnail_url=f"https://i.ytimg.com/vi/{track['id']}/mqdefault.jpg" if len(track.get('id') or '') == 11 else None,
+            input_message_content=InputTextMessageContent(f"🎵 {title}\n{track.get('url') or ''}".strip()),
+        ))
+    return results
+
+
+async def _answer(update: Update, tracks: List[Dict], cache_time: int):
+    try:
+        await update.inline_query.answer(
+            _results(tracks),
+            cache_time=cache_time,
+            button=InlineQueryResultsButton(text="🎵 Botda qidirish", start_parameter='inline'),
+        )
+    except TelegramError as e:
+        # Odatda "query is too old": foydalanuvchi allaqachon boshqa so'rov yozgan
+        metrics.incr('inline.answer_errors')
+        logger.debug("Inline javob yuborilmadi: %s", e)
+
+
+async def _remote(update: Update, query: str, local: List[Dict], started: float):
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    tracks = list(local)
+    if await allow(update):
+        metrics.incr('inline.remote_searches')
+        try:
+            result = await asyncio.wait_for(cached_search(query), timeout=INLINE_REMOTE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Qidiruv cached_search ichida davom etadi va keshga tushadi
+            metrics.incr('inline.remote_timeouts')
+            result = None
+        if result is not None:
+            remote = [row for row in result.youtube + result.lyrics if row.get('id')]
+            file_ids = await cached_file_ids([row['id'] for row in remote])
+            tracks += [dict(row, file_id=file_ids.get(row['id'], '')) for row in remote]
+    await _answer(update, tracks, INLINE_CACHE_TIME if len(tracks) > len(local) else 0)
+    metrics.observe('inline.remote_answer_seconds', asyncio.get_running_loop().time() - started)
+
+
+def _forget(user_id: int, task: asyncio.Task):
+    if _pending.get(user_id) is task:
+        del _pending[user_id]
+    if not task.cancelled() and task.exception():
+        logger.warning("Inline qidiruv xatolik: %s", task.exception())
+
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mahalliy javob darhol; indeks yetmasa debounce'dan keyin tashqi qidiruv"""
+    query = update.inline_query.query.strip()
+    user_id = update.effective_user.id
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    # Foydalanuvchi yozishda davom etdi — oldingi so'rov endi kerak emas
+    previous = _pending.pop(user_id, None)
+    if previous is not None and not previous.done():
+        previous.cancel()
+        metrics.incr('inline.debounced')
+
+    tracks, confident = await local_tracks(query, limit=INLINE_LIMIT)
+    if confident or len(query) < INLINE_MIN_REMOTE_CHARS:
+        metrics.incr('inline.local_answers')
+        await _answer(update, tracks, INLINE_CACHE_TIME if tracks else 0)
+        metrics.observe('inline.answer_seconds', loop.time() - started)
+        return
+
+    # Handler darhol qaytadi: chat (user) navbati keyingi harfni kutib qolmasin
+    task = context.application.create_task(_remote(update, query, tracks, started), name=f'inline:{user_id}')
+    _pending[user_id] = task
+    task.add_done_callback(lambda t: _forget(user_id, t))
@@ -1,15 +1,23 @@
 """Search handlers - Multi-source music search (YouTube + Spotify + Lyrics)."""
 import asyncio
 import logging
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
 
+from bot.concurrency import background
+from bot.event_sink import event_sink
+from bot.session import SearchSession, Track, get_sessions
+from core.metrics import metrics
 from core.models import SearchHistory
-from services.search.engine import multi_search_text
+from services.search.engine import cached_search, fetch_more
 
 logger = logging.getLogger(__name__)
 
+# Oraliq natijalar bilan status xabarini tahrirlash oralig'i (chat limiti — bot/flood_control.py)
+SEARCH_EDIT_INTERVAL = float(os.getenv('SEARCH_EDIT_INTERVAL', '1.0'))
+
 
 def format_duration(seconds):
     if not seconds:
@@ -19,68 +27,190 @@ def format_duration(seconds):
     return f'{minutes}:{secs:02d}'
 
 
-def build_search_keyboard(page=0):
+def build_search_keyboard(token, page=0):
     start = page * 10
-    row1 = [InlineKeyboardButton(str(start + i + 1), callback_data=f'select_{start + i}') for i in range(5)]
-    row2 = [InlineKeyboardButton(str(start + i + 6), callback_data=f'select_{start + i + 5}') for i in range(5)]
+    row1 = [InlineKeyboardButton(str(start + i + 1), callback_data=f'select_{token}_{start + i}') for i in range(5)]
+    row2 = [InlineKeyboardButton(str(start + i + 6), callback_data=f'select_{token}_{start + i + 5}') for i in range(5)]
     row3 = [
-        InlineKeyboardButton('⬅️', callback_data=f'page_{page - 1}'),
-        InlineKeyboardButton('❌', callback_data='cancel'),
-        InlineKeyboardButton('➡️', callback_data=f'page_{page + 1}'),
+        InlineKeyboardButton('⬅️', callback_data=f'page_{token}_{page - 1}'),
+        InlineKeyboardButton('❌', callback_data=f'cancel_{token}'),
+        InlineKeyboardButton('➡️', callback_data=f'page_{token}_{page + 1}'),
     ]
     return InlineKeyboardMarkup([row1, row2, row3])
 
 
-def format_results(results, page=0):
+def format_results(tracks, page=0):
     start = page * 10
-    page_results = results[start:start + 10]
+    page_tracks = tracks[start:start + 10]
     lines = []
-    for i, track in enumerate(page_results):
+    for i, track in enumerate(page_tracks):
         num = start + i + 1
-        title = track.get("title", "Noma'lum")
-        dur = format_duration(track.get("duration"))
-        lines.append(f'{num}. {title} {dur}')
+        dur = format_duration(track.duration)
+        name = f'{track.artist} - {track.title}' if track.is_spotify and track.artist else track.title
+        lines.append(f'{num}. {name} {dur}')
     return '\n'.join(lines)
 
 
+async def _fetch_next(sessions, token, search: SearchSession):
+    rows, cursor = await fetch_more(search.query, search.cursor)
+    known = {t.id for t in search.tracks}
+    search.tracks.extend(Track.from_dict(r) for r in rows if r.get('id') not in known)
+    search.cursor = cursor
+    sessions.update_size(token)
+
+
+async def ensure_page(sessions, token, search: SearchSession, page: int) -> bool:
+    """page sahifasida natija bormi; yetmasa keyingi bo'laklarni yuklaydi (prefetch bo'lsa o'shani kutadi)"""
+    while len(search.tracks) <= page * 10 and search.cursor is not None:
+        before = (len(search.tracks), search.cursor)
+        if search.loading is None or search.loading.done():
+            search.loading = asyncio.ensure_future(_fetch_next(sessions, token, search))
+        await asyncio.shield(search.loading)
+        if (len(search.tracks), search.cursor) == before:
+            # Timeout/xato — foydalanuvchi keyinroq qayta bosadi
+            break
+    return page * 10 < len(search.tracks)
+
+
+def prefetch_next_page(context, sessions, token, search: SearchSession):
+    """Foydalanuvchi joriy sahifani ko'rayotganda keyingisi fonda olinadi"""
+    if search.cursor is None or len(search.tracks) >= (search.page + 2) * 10:
+        return
+    if search.loading is None or search.loading.done():
+        search.loading = context.application.create_task(
+            _fetch_next(sessions, token, search), name=f'search_prefetch:{token}'
+        )
+
+
+class SearchProgress:
+    """
+    Qidiruv davomida status xabari birinchi kelgan natijalar bilan tahrirlanadi,
+    sekin manbalar kelgach — birlashtirilgan natija bilan. Tahrirlar
+    SEARCH_EDIT_INTERVAL dan tez-tez bo'lmaydi, oradagi oraliq natijalardan
+    faqat oxirgisi yuboriladi. Oraliq ro'yxatda tugma yo'q: tartib yakuniy
+    natijada o'zgarishi mumkin, tanlash yakuniy ro'yxatdan.
+    """
+
+    def __init__(self, message, started: float):
+        self.message = message
+        self.started = started
+        self.shown = False
+        self._closed = False
+        self._text = None
+        self._latest = None
+        self._last_edit = 0.0
+        self._task = None
+
+    def show(self, result):
+        """engine.multi_search on_partial"""
+        rows = result.youtube or result.spotify or result.lyrics
+        if self._closed or not rows:
+            return
+        tracks = [Track.from_dict(r) for r in rows]
+        self._latest = format_results(tracks, page=0) + "\n\n⏳ Boshqa manbalar kutilmoqda..."
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while self._latest is not None and not self._closed:
+            wait = self._last_edit + SEARCH_EDIT_INTERVAL - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            text, self._latest = self._latest, None
+            if text == self._text:
+                continue
+            try:
+                await self.message.edit_text(text)
+            except TelegramError as e:
+                logger.debug("Oraliq natija ko'rsatilmadi: %s", e)
+                continue
+            self._text = text
+            self._last_edit = loop.time()
+            if not self.shown:
+                self.shown = True
+                metrics.incr('search.partial_shown')
+                metrics.observe('search.first_result_seconds', loop.time() - self.started)
+
+    def close(self):
+        """Yakuniy natijadan oldin: kutayotgan oraliq tahrir bekor qilinadi"""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+async def _reply_results(update: Update, context: ContextTypes.DEFAULT_TYPE, query, results, cursor=None, message=None):
+    """
+    Natijalarni sessiyaga saqlab, raqamli ro'yxat yuboradi.
+    message — oraliq natijalar ko'rsatilgan status xabari: yangisi o'rniga shu tahrirlanadi.
+    """
+    tracks = [Track.from_dict(r) for r in results]
+    sessions = get_sessions(update, context)
+    search = SearchSession(query, tracks, cursor)
+    token = sessions.add(search)
+    text = format_results(tracks, page=0)
+    markup = build_search_keyboard(token, page=0)
+    if message is not None:
+        try:
+            await message.edit_text(text, reply_markup=markup)
+        except TelegramError as e:
+            logger.debug("Status xabari tahrirlanmadi, yangisi yuboriladi: %s", e)
+            message = None
+    if message is None:
+        await update.message.reply_text(text, reply_markup=markup)
+    prefetch_next_page(context, sessions, token, search)
+
+
+@background
 async def handle_search_request(update: Update, context: ContextTypes.DEFAULT_TYPE, user, query):
     if not query:
         await update.message.reply_text("Iltimos, qo'shiq nomini yozing.")
         return
 
+    loop = asyncio.get_running_loop()
+    started = loop.time()
     status_msg = await update.message.reply_text(
         f"🔍 \"{query}\" qidirilmoqda...\n⏳ Biroz kuting..."
     )
+    progress = SearchProgress(status_msg, started)
 
     try:
-        search_result = await asyncio.to_thread(multi_search_text, query)
+        search_result = await cached_search(query, on_partial=progress.show)
     except Exception as e:
         logger.error("Search error: %s", e)
         await status_msg.edit_text("Qidirishda xatolik yuz berdi. Qaytadan urinib ko'ring.")
         return
+    finally:
+        progress.close()
 
     total_found = len(search_result.youtube) + len(search_result.spotify) + len(search_result.lyrics)
+    if total_found and not progress.shown:
+        # Kesh, mahalliy indeks yoki hamma manba birdan — birinchi natija shu yakuniy ro'yxat
+        metrics.observe('search.first_result_seconds', loop.time() - started)
 
     try:
-        await sync_to_async(SearchHistory.objects.create)(
+        event_sink.add(SearchHistory(
             user=user, query=query, results_count=total_found
-        )
+        ))
     except Exception as e:
         logger.warning("SearchHistory save error: %s", e)
 
-    try:
-        await status_msg.delete()
-    except Exception:
-        pass
+    # Oraliq natija ko'rsatilgan bo'lsa yakuniy ro'yxat shu xabarda, aks holda yangi xabar
+    results_msg = status_msg if progress.shown else None
+    if results_msg is None:
+        try:
+            await status_msg.delete()
+        except Exception:
+            pass
 
     if search_result.youtube:
-        context.user_data['results'] = search_result.youtube
-        context.user_data['page'] = 0
-        text = format_results(search_result.youtube, page=0)
-        await update.message.reply_text(text, reply_markup=build_search_keyboard(page=0))
+        await _reply_results(update, context, query, search_result.youtube, search_result.cursor, results_msg)
 
-        if search_result.spotify and search_result.spotify[0].get("url"):
-            best = search_result.spotify[0]
+        # Ro'yxatdagi qatorga biriktirilgan Spotify trek (ranking) yoki mos kelmagani
+        matched = next((r for r in search_result.youtube if r.get("spotify_url")), None)
+        best = {**matched, "url": matched["spotify_url"]} if matched else (search_result.spotify or [{}])[0]
+        if best.get("url"):
             await update.message.reply_text(
                 "🟢 Spotify'da ham topildi:\n"
                 f"🎧 {best.get('title', '')} — {best.get('artist', '')}\n"
@@ -88,21 +218,13 @@ async def handle_search_request(update: Update, context: ContextTypes.DEFAULT_TY
             )
         return
 
-    if search_result.spotify and search_result.spotify[0].get("url"):
-        best = search_result.spotify[0]
-        await update.message.reply_text(
-            "🟢 Spotify'dan topildi:\n"
-            f"🎧 {best.get('title', '')} — {best.get('artist', '')}\n"
-            f"🔗 {best.get('url')}\n\n"
-            "YouTube'dan topolmadim. Boshqa variant bilan yozing."
-        )
+    if search_result.spotify:
+        # Tanlanganda YouTube'dagi mos video topiladi (services/search/spotify_map.py)
+        await _reply_results(update, context, query, search_result.spotify, message=results_msg)
         return
 
     if search_result.lyrics:
-        context.user_data['results'] = search_result.lyrics
-        context.user_data['page'] = 0
-        text = format_results(search_result.lyrics, page=0)
-        await update.message.reply_text(text, reply_markup=build_search_keyboard(page=0))
+        await _reply_results(update, context, query, search_result.lyrics, message=results_msg)
         return
 
     await update.message.reply_text(
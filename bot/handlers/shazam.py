@@ -1,13 +1,18 @@
 """Shazam handlers - routes to Shazam service"""
 import os
 import asyncio
+from uuid import uuid4
 from telegram import Update
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
 
-from core.models import TelegramUser, ShazamLog
+from bot.concurrency import background
+from bot.event_sink import event_sink
+from bot.quota import SHAZAMS, acquire, refund_on_error
+from bot.rate_limit import allow
+from core.models import ShazamLog
+from services.search.engine import remember_recognized
 from services.shazam.service import ShazamService
 
 DOWNLOADS_DIR = os.path.join(settings.BASE_DIR, 'downloads')
@@ -16,20 +21,6 @@ os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 shazam_service = ShazamService()
 
 
-@sync_to_async
-def save_user(tg_user):
-    """Save or update user in database"""
-    user, _ = TelegramUser.objects.update_or_create(
-        telegram_id=tg_user.id,
-        defaults={
-            'username': tg_user.username or '',
-            'first_name': tg_user.first_name or '',
-            'last_name': tg_user.last_name or '',
-        },
-    )
-    return user
-
-
 async def send_shazam_result(update: Update, result: dict, file_name: str, user):
     """Send Shazam recognition result"""
     if result.get('is_successful'):
@@ -45,13 +36,14 @@ async def send_shazam_result(update: Update, result: dict, file_name: str, user)
             text += f"\n🔗 <a href=\"{result['shazam_url']}\">Shazam da ochish</a>"
 
         # Save successful log
-        await sync_to_async(ShazamLog.objects.create)(
+        event_sink.add(ShazamLog(
             user=user,
             audio_file_name=file_name,
             recognized_title=result['title'],
             recognized_artist=result['artist'],
             is_successful=True,
-        )
+        ))
+        remember_recognized(result['title'], result['artist'])
 
         if result.get('cover'):
             try:
@@ -64,12 +56,12 @@ async def send_shazam_result(update: Update, result: dict, file_name: str, user)
         await update.message.reply_text(text, parse_mode='HTML')
     else:
         # Save failed log
-        await sync_to_async(ShazamLog.objects.create)(
+        event_sink.add(ShazamLog(
             user=user,
             audio_file_name=file_name,
             is_successful=False,
             error_message=result.get('error_message', 'Unknown error'),
-        )
+        ))
         reason = result.get('error_message', 'Unknown error')
         await update.message.reply_text(
             "Qo‘shiqni aniqlab bo‘lmadi.\n\n"
@@ -82,97 +74,73 @@ async def send_shazam_result(update: Update, result: dict, file_name: str, user)
         )
 
 
+@background
+async def _recognize_file(update: Update, context: ContextTypes.DEFAULT_TYPE, user, file_id: str, file_name: str):
+    """Telegram faylini yuklab olib Shazam orqali aniqlaydi"""
+    with refund_on_error(context, SHAZAMS):
+        file = await context.bot.get_file(file_id)
+        # message_id faqat chat ichida noyob — parallel so'rovlar bir-birining faylini o'chirmasin
+        tmp = os.path.join(DOWNLOADS_DIR, f'{uuid4().hex}_{file_name}')
+        await file.download_to_drive(tmp)
+
+        try:
+            result = await shazam_service.recognize(tmp)
+            if result:
+                await send_shazam_result(update, result, file_name, user)
+            else:
+                await send_shazam_result(
+                    update,
+                    {'is_successful': False, 'error_message': 'No result'},
+                    file_name,
+                    user
+                )
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice message"""
-    user = await save_user(update.effective_user)
-    await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
-
     voice = update.message.voice or update.message.audio
     if not voice:
         return
+    if not await allow(update) or not await acquire(update, context, SHAZAMS):
+        return
+    user = context.db_user
+    with refund_on_error(context, SHAZAMS):
+        await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
 
-    file = await context.bot.get_file(voice.file_id)
-    tmp = os.path.join(DOWNLOADS_DIR, f'shazam_{update.message.message_id}.ogg')
-    await file.download_to_drive(tmp)
-
-    try:
-        result = await shazam_service.recognize(tmp)
-        if result:
-            await send_shazam_result(update, result, f'shazam_{update.message.message_id}.ogg', user)
-        else:
-            await send_shazam_result(
-                update,
-                {'is_successful': False, 'error_message': 'No result'},
-                f'shazam_{update.message.message_id}.ogg',
-                user
-            )
-    finally:
-        try:
-            os.remove(tmp)
-        except OSError:
-            pass
+    await _recognize_file(update, context, user, voice.file_id, f'shazam_{update.message.message_id}.ogg')
 
 
 async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle video message"""
-    user = await save_user(update.effective_user)
-    await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
-
     video = update.message.video or update.message.video_note
     if not video:
         return
+    if not await allow(update) or not await acquire(update, context, SHAZAMS):
+        return
+    user = context.db_user
+    with refund_on_error(context, SHAZAMS):
+        await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
 
-    file = await context.bot.get_file(video.file_id)
-    tmp = os.path.join(DOWNLOADS_DIR, f'shazam_video_{update.message.message_id}.mp4')
-    await file.download_to_drive(tmp)
-
-    try:
-        result = await shazam_service.recognize(tmp)
-        if result:
-            await send_shazam_result(update, result, f'shazam_video_{update.message.message_id}.mp4', user)
-        else:
-            await send_shazam_result(
-                update,
-                {'is_successful': False, 'error_message': 'No result'},
-                f'shazam_video_{update.message.message_id}.mp4',
-                user
-            )
-    finally:
-        try:
-            os.remove(tmp)
-        except OSError:
-            pass
+    await _recognize_file(update, context, user, video.file_id, f'shazam_video_{update.message.message_id}.mp4')
 
 
 async def handle_audio_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle audio file"""
-    user = await save_user(update.effective_user)
-    await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
-
     audio = update.message.audio or update.message.document
     if not audio:
         return
+    if not await allow(update) or not await acquire(update, context, SHAZAMS):
+        return
+    user = context.db_user
+    with refund_on_error(context, SHAZAMS):
+        await update.message.reply_text("🎤 Qo'shiq aniqlanmoqda...")
 
-    file = await context.bot.get_file(audio.file_id)
     ext = 'mp3'
     if hasattr(audio, 'file_name') and audio.file_name:
         ext = audio.file_name.split('.')[-1] if '.' in audio.file_name else 'mp3'
-    tmp = os.path.join(DOWNLOADS_DIR, f'shazam_audio_{update.message.message_id}.{ext}')
-    await file.download_to_drive(tmp)
-
-    try:
-        result = await shazam_service.recognize(tmp)
-        if result:
-            await send_shazam_result(update, result, f'shazam_audio_{update.message.message_id}.{ext}', user)
-        else:
-            await send_shazam_result(
-                update,
-                {'is_successful': False, 'error_message': 'No result'},
-                f'shazam_audio_{update.message.message_id}.{ext}',
-                user
-            )
-    finally:
-        try:
-            os.remove(tmp)
-        except OSError:
-            pass
+    await _recognize_file(update, context, user, audio.file_id, f'shazam_audio_{update.message.message_id}.{ext}')
@@ -0,0 +1,136 @@
+"""Event loop stall watchdog.
+
+Async handler ichida bloklovchi chaqiruv (yt-dlp, ffmpeg, sync ORM, katta
+fayl o'qish) butun botni to'xtatadi. Bu yerda:
+
+- heartbeat task har LAG_INTERVAL da uyg'onadi; kechikish (loop lag)
+  metrics'ga yoziladi: loop.lag_seconds p50/p95/p99, /healthz da ko'rinadi;
+- alohida thread heartbeat STALL_THRESHOLD dan ko'p kechiksa event loop
+  thread'ining stack'ini oladi va qaysi task/handler bloklaganini log qiladi.
+
+Log'dagi "Event loop bloklandi" yozuvi — to'g'ridan-to'g'ri tuzatish kerak
+bo'lgan joy: chaqiruvni asyncio.to_thread / repository.run_db ga o'tkazing.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_ENABLED = os.getenv('BOT_LOOP_WATCHDOG', 'True').lower() in ('true', '1', 'yes')
+LAG_INTERVAL = float(os.getenv('BOT_LOOP_LAG_INTERVAL', '0.1'))
+STALL_THRESHOLD = float(os.getenv('BOT_LOOP_STALL_THRESHOLD', '0.5'))
+# Stack'da ko'rsatiladigan oxirgi kadrlar soni
+STACK_LIMIT = 25
+
+_HANDLER_PACKAGES = (os.sep + 'bot' + os.sep, os.sep + 'services' + os.sep, os.sep + 'core' + os.sep)
+
+
+def _task_name(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return '-'
+    coro = task.get_coro()
+    qualname = getattr(coro, '__qualname__', None) or repr(coro)
+    return f'{task.get_name()} ({qualname})'
+
+
+def _project_frame(frames) -> str:
+    """Stack'dagi eng ichki loyiha kadri (bot/, services/, core/) — odatda aybdor handler"""
+    for frame in reversed(frames):
+        if any(part in frame.filename for part in _HANDLER_PACKAGES) and 'loop_watchdog' not in frame.filename:
+            return f'{frame.name} ({frame.filename}:{frame.lineno})'
+    return '-'
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = LAG_INTERVAL, threshold: float = STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._last_beat = now
+            metrics.observe('loop.lag_seconds', lag)
+            if lag >= self.threshold:
+                metrics.incr('loop.stalls')
+                logger.warning("Event loop %.2f s bloklangan edi", lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat
+            # Har bir stall uchun bitta stack yetadi
+            if stalled < self.threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            self._report(stalled)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        frames = traceback.extract_stack(frame)
+        try:
+            # Faqat o'qish; loop shu paytda bloklangan, lug'at o'zgarmaydi
+            task = asyncio.tasks._current_tasks.get(self._loop)
+        except Exception:
+            task = None
+        logger.warning(
+            "Event loop bloklandi (%.2f s va davom etmoqda)\n  task: %s\n  handler: %s\n%s",
+            stalled, _task_name(task), _project_frame(frames),
+            ''.join(traceback.format_list(frames[-STACK_LIMIT:])),
+        )
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat(), name='loop_watchdog')
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+loop_watchdog = LoopWatchdog()
+
+
+async def start_watchdog(application):
+    if WATCHDOG_ENABLED:
+        loop_watchdog.start()
+
+
+async def stop_watchdog(application):
+    await loop_watchdog.stop()
@@ -1,9 +1,17 @@
 from django.core.management.base import BaseCommand
-from bot.telegram_bot import _run_bot
+from bot.run_bot import main
+from bot.supervisor import WORKERS
 
 
 class Command(BaseCommand):
     help = 'Telegram botni ishga tushirish'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--webhook', action='store_true', help='Polling o\'rniga webhook rejimi')
+        parser.add_argument(
+            '--workers', type=int, default=WORKERS,
+            help='Worker process soni (1 dan ko\'p bo\'lsa supervisor rejimi)',
+        )
+
     def handle(self, *args, **options):
-        _run_bot()
+        main(mode='webhook' if options['webhook'] else None, workers=options['workers'])
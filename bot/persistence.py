@@ -0,0 +1,212 @@
+"""Django (SQLite) based persistence for the Application.
+
+user_data/chat_data BotState jadvalida zlib bilan siqilgan json qatorlar
+sifatida saqlanadi:
+
+- Lazy: ishga tushishda hech narsa o'qilmaydi; foydalanuvchining qatori
+  uning birinchi update'ida (refresh_user_data) bitta so'rov bilan yuklanadi.
+  Sessiyalari xotiradan chiqarilgan (session_store) foydalanuvchi "yuklangan"
+  ro'yxatidan ham o'chadi — keyingi update'da qator qayta o'qiladi.
+- Batch: PTB har update_interval da faqat o'zgargan user/chat'larni beradi,
+  ular bitta tranzaksiyada upsert qilinadi.
+- TTL: qatorlar SESSION_TTL dan keyin eskiradi, o'qilmaydi va vaqti-vaqti
+  bilan o'chiriladi.
+
+Supervisor rejimida update'lar user id bo'yicha taqsimlanadi: har user
+qatorini faqat bitta worker o'qiydi/yozadi, qayta ishga tushgan worker
+holatni bazadan tiklaydi. chat_data saqlanmaydi (ishlatilmaydi; bitta chat
+bir nechta worker'da bo'lishi mumkin).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from bot.session import SESSION_TTL, SESSIONS_KEY, UserSessions, session_store
+from core import repository
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_ENABLED = os.getenv('BOT_PERSISTENCE', 'True').lower() in ('true', '1', 'yes')
+PERSISTENCE_INTERVAL = float(os.getenv('BOT_PERSISTENCE_INTERVAL', '10'))
+WRITE_BATCH_SIZE = repository.WRITE_BATCH_SIZE
+PURGE_INTERVAL = 3600
+
+_SESSIONS_TAG = '__sessions__'
+
+# (kind, key) -> (data, expires_at); data=None — qatorni o'chirish
+Pending = Dict[Tuple[str, str], Tuple[Optional[bytes], Optional[float]]]
+
+
+# ─── Serialization ──────────────────────────────────────────
+
+def _default(value):
+    if isinstance(value, UserSessions):
+        return {_SESSIONS_TAG: value.to_state()}
+    raise TypeError(f'{type(value).__name__} saqlanmaydi')
+
+
+def _object_hook(value: dict):
+    if _SESSIONS_TAG in value:
+        return UserSessions.from_state(value[_SESSIONS_TAG])
+    return value
+
+
+def encode(data) -> bytes:
+    raw = json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(raw.encode())
+
+
+def decode(blob: bytes):
+    return json.loads(zlib.decompress(blob), object_hook=_object_hook)
+
+
+# ─── Persistence ────────────────────────────────────────────
+
+class DjangoPersistence(BasePersistence):
+    """BasePersistence: BotState jadvali, lazy o'qish, batch yozish"""
+
+    def __init__(self, update_interval: float = PERSISTENCE_INTERVAL, ttl: int = SESSION_TTL):
+        super().__init__(
+            store_data=PersistenceInput(chat_data=False, callback_data=False), update_interval=update_interval,
+        )
+        self.ttl = ttl
+        self._loaded: Dict[str, set] = {'user': set(), 'chat': set()}
+        self._loading: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._pending: Pending = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._last_purge = time.time()
+        session_store.on_evict(self._loaded['user'].discard)
+
+    # Loading
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        blob = await repository.load_state('bot', '0')
+        return decode(blob) if blob else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await repository.load_states('conv', f'{name}:')
+        return {
+            tuple(json.loads(key[len(name) + 1:])): decode(blob)
+            for key, blob in rows
+        }
+
+    async def _load_into(self, kind: str, key: int, data: dict):
+        """Birinchi murojaatda qatorni bazadan o'qiydi; parallel so'rovlar bitta o'qishni kutadi"""
+        if key in self._loaded[kind]:
+            return
+        loading = self._loading.get((kind, key))
+        if loading:
+            await loading
+            return
+        future = self._loading[(kind, key)] = asyncio.get_running_loop().create_future()
+        try:
+            blob = await repository.load_state(kind, str(key))
+            if blob:
+                data.update(decode(blob))
+        except Exception as e:
+            logger.warning("%s %s holatini o'qib bo'lmadi: %s", kind, key, e)
+        finally:
+            self._loaded[kind].add(key)
+            del self._loading[(kind, key)]
+            future.set_result(None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._load_into('user', user_id, user_data)
+        # Sessiyasiz foydalanuvchi ham session_store'da turadi — aks holda u
+        # hech qachon evict qilinmaydi va _loaded dan chiqmaydi
+        sessions = user_data.get(SESSIONS_KEY)
+        if sessions is None:
+            sessions = user_data[SESSIONS_KEY] = UserSessions(user_id)
+        session_store.touch(sessions)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._load_into('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    # Writing
+
+    def _queue(self, kind: str, key: str, data, ttl: Optional[float]):
+        if data is None:
+            self._pending[(kind, key)] = (None, None)
+        else:
+            try:
+                self._pending[(kind, key)] = (encode(data), ttl)
+            except (TypeError, ValueError) as e:
+                logger.warning("%s %s saqlanmadi: %s", kind, key, e)
+                return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._queue('user', str(user_id), data, self.ttl)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._queue('chat', str(chat_id), data, self.ttl)
+
+    async def update_bot_data(self, data: dict):
+        self._queue('bot', '0', data, None)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        self._queue('conv', f'{name}:{json.dumps(list(key))}', new_state, None)
+
+    async def drop_user_data(self, user_id: int):
+        self._loaded['user'].discard(user_id)
+        self._queue('user', str(user_id), None, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._loaded['chat'].discard(chat_id)
+        self._queue('chat', str(chat_id), None, None)
+
+    async def _flush_pending(self):
+        # update_persistence hamma update_* ni bitta gather'da chaqiradi —
+        # bir tick kutib, ularni bitta batch qilib yozamiz
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            while self._pending:
+                pending, self._pending = self._pending, {}
+                items = list(pending.items())
+                for start in range(0, len(items), WRITE_BATCH_SIZE):
+                    batch = dict(items[start:start + WRITE_BATCH_SIZE])
+                    try:
+                        await repository.write_states(batch)
+                    except Exception as e:
+                        logger.error("Persistence yozishda xatolik (%d qator): %s", len(batch), e)
+                        # Keyingi urinishda yoziladi, agar shu orada yangisi kelmagan bo'lsa
+                        for k, v in batch.items():
+                            self._pending.setdefault(k, v)
+                        return
+            if time.time() - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = time.time()
+                try:
+                    deleted = await repository.purge_expired_states()
+                    if deleted:
+                        logger.info("Persistence: %d ta eskirgan qator o'chirildi", deleted)
+                except Exception as e:
+                    logger.warning("Persistence purge xatolik: %s", e)
+
+    async def flush(self):
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        if self._pending:
+            await self._flush_pending()
@@ -0,0 +1,201 @@
+"""Daily download / Shazam quotas.
+
+Har foydalanuvchining bugungi hisoblagichi xotirada turadi; tekshiruv
+DownloadHistory/ShazamLog ni sanamaydi, O(1):
+
+- Kunning birinchi so'rovida DailyUsage qatori (bitta indeksli o'qish)
+  yuklanadi, keyin hammasi xotirada.
+- O'zgarishlar farq (delta) sifatida to'planib, BOT_QUOTA_FLUSH_INTERVAL da
+  bir marta writer thread'da qo'shiladi (bir necha worker bir foydalanuvchini
+  hisoblasa ham qiymat yo'qolmaydi).
+- Kun QUOTA_TIMEZONE (Asia/Tashkent) bo'yicha: yarim tunda yangi kalit,
+  eski kunning yozuvlari xotiradan tashlanadi.
+
+Limitlar (0 — cheklanmagan):
+- oddiy foydalanuvchi: free_daily_download_limit, shazam_daily_limit
+- premium: faol PremiumPlan'lardan eng kattasi, reja bo'lmasa
+  premium_daily_download_limit va shazam_daily_limit
+BotSettings settings_cache dan, rejalar PLAN_CACHE_TTL soniya keshdan olinadi.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from core import repository
+from core.metrics import metrics
+from core.models import PremiumPlan
+from bot.settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+QUOTA_TIMEZONE = ZoneInfo(os.getenv('BOT_QUOTA_TIMEZONE', 'Asia/Tashkent'))
+FLUSH_INTERVAL = float(os.getenv('BOT_QUOTA_FLUSH_INTERVAL', '5'))
+PLAN_CACHE_TTL = float(os.getenv('BOT_PLAN_CACHE_TTL', '60'))
+
+DOWNLOADS = 0
+SHAZAMS = 1
+KIND_NAMES = {DOWNLOADS: 'downloads', SHAZAMS: 'shazams'}
+
+
+class Entitlements(NamedTuple):
+    downloads: int
+    shazams: int
+
+
+def quota_day(now: Optional[datetime] = None) -> date:
+    return (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE).date()
+
+
+class QuotaEngine:
+    def __init__(self):
+        self._day: Optional[date] = None
+        # user_id -> [downloads, shazams] (bugun)
+        self._usage: Dict[int, List[int]] = {}
+        # (user_id, day) -> [downloads, shazams] hali yozilmagan farqlar
+        self._pending: Dict[Tuple[int, date], List[int]] = {}
+        self._last_flush = time.time()
+        self._plans: List[PremiumPlan] = []
+        self._plans_loaded_at = 0.0
+        metrics.gauge('quota.users', lambda: len(self._usage))
+
+    # Entitlements
+
+    async def _premium_plans(self) -> List[PremiumPlan]:
+        if time.time() - self._plans_loaded_at > PLAN_CACHE_TTL:
+            try:
+                self._plans = await repository.get_active_plans()
+            except Exception as e:
+                logger.warning("Premium rejalarni o'qib bo'lmadi: %s", e)
+            self._plans_loaded_at = time.time()
+        return self._plans
+
+    async def entitlements(self, user) -> Entitlements:
+        current = settings_cache.current
+        if not user.is_premium:
+            return Entitlements(current.free_daily_download_limit, current.shazam_daily_limit)
+        plans = await self._premium_plans()
+        if not plans:
+            return Entitlements(current.premium_daily_download_limit, current.shazam_daily_limit)
+        return Entitlements(
+            max(plan.daily_download_limit for plan in plans),
+            max(plan.daily_shazam_limit for plan in plans),
+        )
+
+    # Counters
+
+    async def _counters(self, user_id: int) -> List[int]:
+        today = quota_day()
+        if today != self._day:
+            # Yarim tun: eski kun hisoblagichlari kerak emas (farqlari _pending da qoladi)
+            self._day = today
+            self._usage = {}
+        counters = self._usage.get(user_id)
+        if counters is not None:
+            return counters
+        loaded = await repository.load_daily_usage(user_id, today)
+        # await paytida boshqa so'rov yuklagan va oshirgan bo'lishi mumkin
+        counters = self._usage.get(user_id)
+        if counters is None or today != self._day:
+            counters = self._usage[user_id] = list(loaded)
+        return counters
+
+    def _add(self, user_id: int, kind: int, amount: int):
+        self._usage[user_id][kind] += amount
+        delta = self._pending.setdefault((user_id, self._day), [0, 0])
+        delta[kind] += amount
+
+    async def acquire(self, user, kind: int) -> Tuple[bool, int]:
+        """
+        Limit qolgan bo'lsa bittasini band qiladi. (ruxsat, limit) qaytaradi.
+        Ish bajarilmasa refund() bilan qaytariladi.
+        """
+        limit = (await self.entitlements(user))[kind]
+        try:
+            counters = await self._counters(user.pk)
+        except Exception as e:
+            # Baza ishlamasa foydalanuvchini to'xtatmaymiz
+            logger.warning("Kunlik limitni o'qib bo'lmadi (user %s): %s", user.pk, e)
+            return True, limit
+        if limit and counters[kind] >= limit:
+            metrics.incr(f'quota.rejected.{KIND_NAMES[kind]}')
+            return False, limit
+        self._add(user.pk, kind, 1)
+        return True, limit
+
+    def refund(self, user, kind: int):
+        if user.pk in self._usage and self._usage[user.pk][kind] > 0:
+            self._add(user.pk, kind, -1)
+
+    def flush_due(self) -> bool:
+        return bool(self._pending) and time.time() - self._last_flush >= FLUSH_INTERVAL
+
+    async def flush(self):
+        self._last_flush = time.time()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        deltas = {key: tuple(value) for key, value in pending.items() if any(value)}
+        if not deltas:
+            return
+        try:
+            await repository.add_daily_usage(deltas)
+        except Exception as e:
+            logger.warning("Kunlik limitlar yozilmadi (%d qator): %s", len(deltas), e)
+            for key, (downloads, shazams) in deltas.items():
+                delta = self._pending.setdefault(key, [0, 0])
+                delta[DOWNLOADS] += downloads
+                delta[SHAZAMS] += shazams
+
+
+quota_engine = QuotaEngine()
+
+
+async def acquire(update, context, kind: int) -> bool:
+    """Handler uchun: limit tugagan bo'lsa foydalanuvchiga aytadi va False qaytaradi"""
+    user = context.db_user
+    if user is None:
+        return True
+    allowed, limit = await quota_engine.acquire(user, kind)
+    if allowed:
+        context.refunded.discard(kind)
+    if quota_engine.flush_due():
+        context.application.create_task(quota_engine.flush(), name='quota:flush')
+    if allowed:
+        return True
+    what = 'yuklash' if kind == DOWNLOADS else 'Shazam'
+    text = (
+        f"📊 Bugungi {what} limiti tugadi ({limit} ta).\n"
+        "Limit Toshkent vaqti bilan 00:00 da yangilanadi."
+    )
+    if not user.is_premium:
+        text += "\n⭐ Premium bilan limit kattaroq."
+    message = update.effective_message
+    if message:
+        await message.reply_text(text)
+    return False
+
+
+def refund(context, kind: int):
+    """Band qilingan limitni qaytaradi; bir acquire() uchun faqat bir marta"""
+    if context.db_user is not None and kind not in context.refunded:
+        context.refunded.add(kind)
+        quota_engine.refund(context.db_user, kind)
+
+
+@contextmanager
+def refund_on_error(context, kind: int):
+    """acquire() dan keyingi ish kutilmagan xato bilan tugasa limit qaytariladi"""
+    try:
+        yield
+    except Exception:
+        refund(context, kind)
+        raise
+
+
+async def flush_quotas(application):
+    """Application.post_stop: yozilmagan hisoblagichlarni saqlaydi"""
+    await quota_engine.flush()
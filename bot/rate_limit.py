@@ -0,0 +1,110 @@
+"""Per-user rate limiting (GCRA token bucket).
+
+BotSettings.rate_limit_per_minute — foydalanuvchi bir daqiqada sarflashi
+mumkin bo'lgan token'lar soni (bucket sig'imi ham shu). Har so'rov narxi:
+
+- COST_CHEAP: sahifalash, bekor qilish kabi arzon callback'lar
+- COST_EXPENSIVE: qidiruv, yuklash, Shazam (yt-dlp / tarmoq ishi)
+
+GCRA: har foydalanuvchi uchun bitta float — bucket qachon to'liq bo'lishi
+(theoretical arrival time). Refill alohida hisoblanmaydi, tekshiruv paytida
+vaqt farqidan kelib chiqadi. Vaqti o'tgan yozuv to'liq bucket bilan bir xil,
+shuning uchun ular vaqti-vaqti bilan o'chiriladi: xotirada faqat oxirgi
+daqiqada faol bo'lgan foydalanuvchilar qoladi.
+"""
+import logging
+import os
+import time
+from typing import Dict
+
+from telegram import Update
+
+from core.metrics import metrics
+from bot.settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+COST_CHEAP = float(os.getenv('BOT_RATE_COST_CHEAP', '1'))
+COST_EXPENSIVE = float(os.getenv('BOT_RATE_COST_EXPENSIVE', '2'))
+# Shuncha tekshiruvda bir marta eskirgan yozuvlar tozalanadi
+PRUNE_EVERY = 10000
+
+
+class RateLimiter:
+    def __init__(self):
+        # telegram_id -> bucket to'liq bo'ladigan vaqt (time.monotonic)
+        self._tat: Dict[int, float] = {}
+        # telegram_id -> shu vaqtgacha qayta ogohlantirilmaydi
+        self._warned: Dict[int, float] = {}
+        self._checks = 0
+        metrics.gauge('rate_limit.buckets', lambda: len(self._tat))
+
+    def hit(self, key: int, cost: float, per_minute: float, now: float = None) -> float:
+        """
+        cost token sarflaydi. 0 qaytarsa ruxsat, aks holda necha soniyadan
+        keyin shu narxdagi so'rov o'tishini qaytaradi (bucket o'zgarmaydi).
+        """
+        if per_minute <= 0:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        self._checks += 1
+        if self._checks % PRUNE_EVERY == 0:
+            self.prune(now)
+
+        interval = 60.0 / per_minute
+        tat = max(self._tat.get(key, now), now) + cost * interval
+        # Bucket sig'imi: per_minute token = 60 soniyalik "qarz"
+        excess = tat - now - 60.0
+        if excess > 1e-9:
+            metrics.incr('rate_limit.rejected')
+            return excess
+        self._tat[key] = tat
+        return 0.0
+
+    def should_warn(self, key: int, retry_after: float, now: float = None) -> bool:
+        """Rad etilgan foydalanuvchiga bitta oynada faqat bir marta javob beriladi"""
+        if now is None:
+            now = time.monotonic()
+        if self._warned.get(key, 0) > now:
+            return False
+        self._warned[key] = now + retry_after
+        return True
+
+    def prune(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        self._tat = {k: v for k, v in self._tat.items() if v > now}
+        self._warned = {k: v for k, v in self._warned.items() if v > now}
+
+    def __len__(self):
+        return len(self._tat)
+
+
+rate_limiter = RateLimiter()
+
+
+async def allow(update: Update, cost: float = COST_EXPENSIVE) -> bool:
+    """Handler boshida: limit oshgan bo'lsa foydalanuvchiga aytadi va False qaytaradi"""
+    user = update.effective_user
+    if not user:
+        return True
+    retry_after = rate_limiter.hit(user.id, cost, settings_cache.current.rate_limit_per_minute)
+    if not retry_after:
+        return True
+    if rate_limiter.should_warn(user.id, retry_after):
+        text = f"⏳ Juda ko'p so'rov. {int(retry_after) + 1} soniyadan keyin qayta urinib ko'ring."
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text, show_alert=False)
+            elif update.effective_message:
+                await update.effective_message.reply_text(text)
+        except Exception as e:
+            logger.debug("Rate limit xabari yuborilmadi: %s", e)
+    elif update.callback_query:
+        # Callback'ga javob berilmasa tugmada soat belgisi qotib qoladi
+        try:
+            await update.callback_query.answer()
+        except Exception:
+            pass
+    return False
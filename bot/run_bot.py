@@ -26,18 +26,35 @@ sys.path.insert(0, str(BASE_DIR))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, filters
 from telegram import Update
 
+from bot.concurrency import CONCURRENT_UPDATES, INTAKE_QUEUE_SIZE, ChatOrderedUpdateProcessor, IntakeQueue
+from bot.event_sink import event_sink
+from bot.flood_control import FloodControl
+from bot.loop_watchdog import start_watchdog, stop_watchdog
+from bot.persistence import PERSISTENCE_ENABLED, DjangoPersistence
+from bot.quota import flush_quotas
+from bot.settings_cache import register_settings_gate, start_settings_cache, stop_settings_cache
+from bot.strategy_store import start_strategy_store, stop_strategy_store
+from bot.supervisor import WORKERS, run_supervisor
+from bot.users import context_types, flush_user_activity, register_user_context
+from bot.webhook import get_allowed_updates, run_webhook
 from bot.handlers.commands import start_command
 from bot.handlers.message import handle_message
 from bot.handlers.shazam import handle_voice, handle_video, handle_audio_file
 from bot.handlers.callback import callback_handler
+from bot.handlers.inline import handle_inline_query
+from core.db import maintenance_loop
 from core.models import BotSettings
+from services.search.spotify import close_spotify
 
+# Faqat ro'yxatdan o'tgan handler'lar ishlaydigan update turlari
+HANDLED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
 
-def main():
-    """Run Telegram bot independently"""
+
+def get_token():
+    """Token qidirish: .env -> BotSettings -> Django settings. Topilmasa chiqib ketadi."""
     token = None
     
     # 1. Avval .env faylidan o'qib ko'ramiz
@@ -88,7 +105,81 @@ def main():
             except Exception as e:
                 print(f'  [ERROR] O\'qib bo\'lmadi: {e}')
         sys.exit(1)
-    
+
+    return token
+
+
+_maintenance_task = None
+
+
+async def post_init(app):
+    """Sozlamalar keshini yuklaydi; DB maintenance'ni bitta process rejalashtiradi (supervisor rejimida 0-worker)"""
+    global _maintenance_task
+    await start_watchdog(app)
+    await start_settings_cache(app)
+    await start_strategy_store(app)
+    if os.getenv('BOT_WORKER_INDEX', '0') == '0':
+        _maintenance_task = asyncio.create_task(maintenance_loop())
+
+
+async def post_stop(app):
+    """Application to'xtaganda buferdagi yozuvlarni bazaga yozadi"""
+    if _maintenance_task:
+        _maintenance_task.cancel()
+    await stop_settings_cache(app)
+    await flush_user_activity(app)
+    await flush_quotas(app)
+    await stop_strategy_store(app)
+    await stop_watchdog(app)
+    await close_spotify(app)
+    await event_sink.close()
+
+
+def build_application(token, workers=1):
+    """
+    Application: turli chatlar parallel, bitta chat ichida tartib saqlanadi.
+    workers — shu token bilan ishlayotgan process'lar soni (global limit bo'linadi).
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .update_queue(IntakeQueue(maxsize=INTAKE_QUEUE_SIZE))
+        .context_types(context_types())
+        # Chiquvchi so'rovlar: global/chat limitlari, ustuvorlik, RetryAfter
+        .rate_limiter(FloodControl(workers=workers))
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if PERSISTENCE_ENABLED:
+        # Sessiyalar (qidiruv natijalari, yuklash takliflari) restart'dan keyin ham ishlaydi
+        builder = builder.persistence(DjangoPersistence())
+    return builder.build()
+
+
+def register_handlers(app):
+    # group -2: texnik xizmat rejimi / o'chirilgan bot
+    register_settings_gate(app)
+    # group -1: har update'dan oldin context.db_user ni to'ldiradi
+    register_user_context(app)
+    app.add_handler(CommandHandler('start', start_command))
+    app.add_handler(CallbackQueryHandler(callback_handler))
+    app.add_handler(InlineQueryHandler(handle_inline_query))
+    app.add_handler(MessageHandler(filters.VOICE, handle_voice))
+    app.add_handler(MessageHandler(filters.VIDEO | filters.VIDEO_NOTE, handle_video))
+    app.add_handler(MessageHandler(filters.AUDIO, handle_audio_file))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+
+def main(mode=None, workers=None):
+    """Run Telegram bot independently"""
+    # BOT_MODE=webhook yoki: python bot/run_bot.py --webhook
+    if mode is None:
+        mode = 'webhook' if '--webhook' in sys.argv else os.getenv('BOT_MODE', 'polling').lower()
+    if workers is None:
+        workers = WORKERS
+    token = get_token()
+
     # 5. BotSettings dan enabled holatini tekshiramiz (agar mavjud bo'lsa)
     try:
         settings = BotSettings.get_settings()
@@ -98,22 +189,28 @@ def main():
     except Exception:
         pass  # BotSettings yo'q bo'lsa, davom etamiz
 
-    # Create application
-    app = Application.builder().token(token).build()
+    allowed_updates = get_allowed_updates(HANDLED_UPDATES)
 
-    # Register handlers
-    app.add_handler(CommandHandler('start', start_command))
-    app.add_handler(CallbackQueryHandler(callback_handler))
-    app.add_handler(MessageHandler(filters.VOICE, handle_voice))
-    app.add_handler(MessageHandler(filters.VIDEO | filters.VIDEO_NOTE, handle_video))
-    app.add_handler(MessageHandler(filters.AUDIO, handle_audio_file))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    if workers > 1:
+        # Supervisor rejimi: update'lar user id bo'yicha worker process'larga taqsimlanadi
+        print(f'[BOT] Supervisor rejimi: {workers} worker ({mode})')
+        run_supervisor(token, workers, mode, allowed_updates)
+        return
+
+    # Create application
+    app = build_application(token)
+    register_handlers(app)
 
     print('[BOT] Telegram bot ishga tushdi!')
     print('[BOT] Bot Django\'dan mustaqil ishlayapti, faqat database orqali bog\'langan.')
-    
+    print(f'[BOT] Parallel update limiti: {CONCURRENT_UPDATES}')
+
     # Run bot
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if mode == 'webhook':
+        print('[BOT] Webhook rejimi')
+        asyncio.run(run_webhook(app, allowed_updates))
+    else:
+        app.run_polling(allowed_updates=allowed_updates)
 
 
 if __name__ == '__main__':
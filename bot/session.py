@@ -0,0 +1,273 @@
+"""Compact, TTL-bounded per-user session store.
+
+Download taklifi va qidiruv natijalari kichik __slots__ yozuvlar sifatida
+saqlanadi va qisqa token bilan callback_data ga qo'yiladi:
+
+    ytdl_{token}_{quality}, social_video_{platform}_{token},
+    music_instagram_{token}, select_{token}_{index}, page_{token}_{page}
+
+Qidiruv natijalari sahifalab yuklanadi: SearchSession.cursor bo'yicha
+keyingi bo'lak so'ralganda (yoki oldindan, bot/handlers/search.py) olinadi.
+
+Yozuvlar foydalanuvchining context.user_data[SESSIONS_KEY] ichida turadi
+(shu sababli supervisor rejimida ham worker'da qoladi). Global SessionStore
+umumiy yozuvlar soni, xotira hajmi va TTL ni nazorat qiladi.
+"""
+import os
+import secrets
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Type, TypeVar
+
+SESSIONS_KEY = 'sessions'
+
+SESSION_TTL = int(os.getenv('BOT_SESSION_TTL', str(6 * 3600)))
+SESSIONS_PER_USER = int(os.getenv('BOT_SESSIONS_PER_USER', '20'))
+MAX_SESSIONS = int(os.getenv('BOT_MAX_SESSIONS', '200000'))
+MAX_SESSION_BYTES = int(os.getenv('BOT_MAX_SESSION_MB', '64')) * 1024 * 1024
+SWEEP_INTERVAL = 60
+
+_OBJECT_OVERHEAD = 64
+
+
+def _str_size(value) -> int:
+    return sys.getsizeof(value) if value else 0
+
+
+class Track:
+    """Qidiruv natijasidagi bitta qo'shiq"""
+    __slots__ = ('id', 'title', 'artist', 'duration', 'url', 'isrc')
+
+    def __init__(self, id: str, title: str, artist: str = '', duration: int = 0, url: str = '', isrc: str = ''):
+        self.id = id
+        self.title = title
+        self.artist = artist
+        self.duration = duration
+        self.url = url
+        # Spotify treklarida: spotify_map shu kod bo'yicha boshqa id'dagi yozuvni ham topadi
+        self.isrc = isrc
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Track':
+        vid = data.get('id') or ''
+        url = data.get('url') or ''
+        # Oddiy YouTube havolasini saqlamaymiz — id dan tiklanadi
+        if url == f'https://www.youtube.com/watch?v={vid}':
+            url = ''
+        return cls(vid, data.get('title') or "Noma'lum", data.get('artist') or '',
+                   int(data.get('duration') or 0), url, data.get('isrc') or '')
+
+    @property
+    def is_spotify(self) -> bool:
+        """Spotify natijasi: yuklashdan oldin YouTube'dagi mos video topiladi"""
+        return self.url.startswith('https://open.spotify.com/')
+
+    @property
+    def watch_url(self) -> str:
+        if self.url.startswith('http'):
+            return self.url
+        return f'https://www.youtube.com/watch?v={self.id}' if self.id else ''
+
+    def size(self) -> int:
+        return _OBJECT_OVERHEAD + sum(_str_size(v) for v in (self.id, self.title, self.artist, self.url, self.isrc))
+
+
+class DownloadOffer:
+    """Havola yuborilgandan keyin tugma bosilishini kutayotgan yuklash"""
+    __slots__ = ('url', 'platform', 'title', 'touched')
+
+    def __init__(self, url: str, platform: str, title: str):
+        self.url = url
+        self.platform = platform
+        self.title = title
+        self.touched = time.time()
+
+    def size(self) -> int:
+        return _OBJECT_OVERHEAD + _str_size(self.url) + _str_size(self.title)
+
+
+class SearchSession:
+    """
+    Bitta qidiruv xabari: hozircha yuklangan natijalar, joriy sahifa va
+    keyingi sahifa cursor'i (None — boshqa natija yo'q). loading — keyingi
+    bo'lakni olayotgan task (saqlanmaydi).
+    """
+    __slots__ = ('query', 'tracks', 'page', 'touched', 'cursor', 'loading')
+
+    def __init__(self, query: str, tracks: List[Track], cursor: Optional[int] = None):
+        self.query = query
+        self.tracks = tracks
+        self.page = 0
+        self.touched = time.time()
+        self.cursor = cursor
+        self.loading = None
+
+    def size(self) -> int:
+        return (_OBJECT_OVERHEAD + _str_size(self.query) + sys.getsizeof(self.tracks)
+                + sum(t.size() for t in self.tracks))
+
+
+R = TypeVar('R', DownloadOffer, SearchSession)
+
+
+class UserSessions:
+    """Bitta foydalanuvchining yozuvlari: token -> record (eng eskisi boshida)"""
+    __slots__ = ('user_id', 'records', 'sizes', 'last_seen')
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.records: 'OrderedDict[str, object]' = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.last_seen = time.time()
+
+    def add(self, record) -> str:
+        token = secrets.token_hex(4)
+        while token in self.records:
+            token = secrets.token_hex(4)
+        size = record.size()
+        self.records[token] = record
+        self.sizes[token] = size
+        session_store.count += 1
+        session_store.bytes += size
+        while len(self.records) > SESSIONS_PER_USER:
+            self.remove(next(iter(self.records)))
+        session_store.enforce_limits()
+        return token
+
+    def get(self, token: str, kind: Type[R]) -> Optional[R]:
+        """O(1) lookup; TTL o'tgan yozuv o'chiriladi"""
+        record = self.records.get(token)
+        if record is None or not isinstance(record, kind):
+            return None
+        now = time.time()
+        if now - record.touched > SESSION_TTL:
+            self.remove(token)
+            return None
+        record.touched = now
+        self.records.move_to_end(token)
+        return record
+
+    def update_size(self, token: str):
+        record = self.records.get(token)
+        if record is None:
+            return
+        size = record.size()
+        session_store.bytes += size - self.sizes[token]
+        self.sizes[token] = size
+
+    def remove(self, token: str):
+        if self.records.pop(token, None) is not None:
+            session_store.count -= 1
+            session_store.bytes -= self.sizes.pop(token, 0)
+
+    def clear(self):
+        for token in list(self.records):
+            self.remove(token)
+
+    # Persistence uchun ixcham ko'rinish (ro'yxatlar, kalit nomlarisiz)
+
+    def to_state(self) -> Dict:
+        records = []
+        for token, r in self.records.items():
+            if isinstance(r, DownloadOffer):
+                records.append([token, 'o', r.touched, r.url, r.platform, r.title])
+            else:
+                # isrc oxirida: eski (5 maydonli) holat ham Track(*t) bilan o'qiladi
+                tracks = [[t.id, t.title, t.artist, t.duration, t.url, t.isrc] for t in r.tracks]
+                records.append([token, 's', r.touched, r.query, r.page, tracks, r.cursor])
+        return {'u': self.user_id, 'r': records}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'UserSessions':
+        """TTL o'tgan yozuvlarni tashlab, qolganini global hisobga qo'shadi"""
+        sessions = cls(state['u'])
+        now = time.time()
+        for token, kind, touched, *fields in state['r']:
+            if now - touched > SESSION_TTL:
+                continue
+            if kind == 'o':
+                record = DownloadOffer(*fields)
+            else:
+                query, page, tracks, *cursor = fields
+                record = SearchSession(query, [Track(*t) for t in tracks], cursor[0] if cursor else None)
+                record.page = page
+            record.touched = touched
+            size = record.size()
+            sessions.records[token] = record
+            sessions.sizes[token] = size
+            session_store.count += 1
+            session_store.bytes += size
+        session_store.touch(sessions)
+        session_store.enforce_limits()
+        return sessions
+
+
+class SessionStore:
+    """Global hisob: LRU tartibdagi foydalanuvchilar, umumiy limitlar va TTL"""
+
+    def __init__(self):
+        self._users: 'OrderedDict[int, UserSessions]' = OrderedDict()
+        self.count = 0
+        self.bytes = 0
+        self.evicted = 0
+        self._last_sweep = time.time()
+        # user id bilan chaqiriladi, foydalanuvchi xotiradan chiqarilganda (persistence)
+        self._evict_listeners: List[Callable[[int], None]] = []
+
+    def on_evict(self, listener: Callable[[int], None]):
+        self._evict_listeners.append(listener)
+
+    def _evict_user(self, user_id: int):
+        del self._users[user_id]
+        for listener in self._evict_listeners:
+            listener(user_id)
+
+    def touch(self, sessions: UserSessions):
+        now = time.time()
+        sessions.last_seen = now
+        self._users[sessions.user_id] = sessions
+        self._users.move_to_end(sessions.user_id)
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None):
+        """TTL davomida faol bo'lmagan foydalanuvchilarni tozalaydi (LRU boshidan)"""
+        now = now or time.time()
+        self._last_sweep = now
+        while self._users:
+            user_id, sessions = next(iter(self._users.items()))
+            if now - sessions.last_seen <= SESSION_TTL:
+                break
+            self.evicted += len(sessions.records)
+            sessions.clear()
+            self._evict_user(user_id)
+
+    def enforce_limits(self):
+        while (self.count > MAX_SESSIONS or self.bytes > MAX_SESSION_BYTES) and self._users:
+            user_id, sessions = next(iter(self._users.items()))
+            if sessions.records:
+                sessions.remove(next(iter(sessions.records)))
+                self.evicted += 1
+            if not sessions.records:
+                self._evict_user(user_id)
+
+    def stats(self) -> Dict:
+        return {
+            'users': len(self._users),
+            'records': self.count,
+            'bytes': self.bytes,
+            'evicted': self.evicted,
+        }
+
+
+session_store = SessionStore()
+
+
+def get_sessions(update, context) -> UserSessions:
+    """Foydalanuvchining sessiyalari (kerak bo'lsa yaratiladi)"""
+    sessions = context.user_data.get(SESSIONS_KEY)
+    if sessions is None:
+        sessions = context.user_data[SESSIONS_KEY] = UserSessions(update.effective_user.id)
+    session_store.touch(sessions)
+    return sessions
@@ -0,0 +1,125 @@
+"""In-process BotSettings cache.
+
+BotSettings.get_settings() har chaqiruvda bazaga boradi, shuning uchun
+handler'lar sozlamalarni settings_cache.current dan o'qiydi (xotirada).
+
+- Fon task har BOT_SETTINGS_REFRESH soniyada faqat version ustunini o'qiydi;
+  u o'zgargan bo'lsa (dashboard/admin save() qilgan) butun qator qayta
+  yuklanadi. Dashboard'dagi o'zgarish ~1 soniyada har bir process'ga yetadi.
+- Baza vaqtincha ishlamasa oxirgi ma'lum sozlamalar qoladi.
+
+Pre-handler (group -2) texnik xizmat rejimi va o'chirilgan botni har
+update'da tekshiradi; platforma va fayl hajmi cheklovlarini handler'lar
+settings_cache orqali tekshiradi.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+from core import repository
+from core.metrics import metrics
+from core.models import BotSettings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.getenv('BOT_SETTINGS_REFRESH', '1'))
+
+SETTINGS_GATE_GROUP = -2
+
+DEFAULT_MAINTENANCE_MESSAGE = (
+    "🛠 Bot hozir texnik xizmat rejimida.\n"
+    "Birozdan keyin qayta urinib ko'ring."
+)
+
+
+class SettingsCache:
+    def __init__(self, interval: float = REFRESH_INTERVAL):
+        self.interval = interval
+        # Birinchi yuklashgacha model default'lari
+        self.current = BotSettings()
+        self.version: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge('bot_settings.version', lambda: self.version or 0)
+
+    async def refresh(self) -> bool:
+        """Versiya o'zgargan bo'lsa sozlamalarni qayta yuklaydi"""
+        version = await repository.get_settings_version()
+        if version == self.version:
+            return False
+        self.current = await repository.get_bot_settings()
+        self.version = self.current.version
+        logger.info("Bot sozlamalari yangilandi (versiya %s)", self.version)
+        return True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                metrics.incr('bot_settings.refresh_errors')
+                logger.warning("Bot sozlamalarini o'qib bo'lmadi: %s", e)
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("Bot sozlamalari yuklanmadi, default'lar ishlatiladi: %s", e)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='settings_cache')
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Hot-path tekshiruvlar (bazaga bormaydi)
+
+    def platform_enabled(self, platform: str) -> bool:
+        return getattr(self.current, f'{platform}_enabled', True)
+
+    @property
+    def max_file_size(self) -> int:
+        """Baytlarda"""
+        return self.current.max_file_size_mb * 1024 * 1024
+
+
+settings_cache = SettingsCache()
+
+
+async def settings_gate(update: Update, context):
+    """Pre-handler: bot o'chirilgan yoki texnik xizmatda bo'lsa update shu yerda to'xtaydi"""
+    current = settings_cache.current
+    if current.is_bot_enabled and not current.is_maintenance_mode:
+        return
+    metrics.incr('bot_settings.blocked_updates')
+    if current.is_bot_enabled:
+        text = current.maintenance_message or DEFAULT_MAINTENANCE_MESSAGE
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text[:200], show_alert=True)
+            elif update.effective_message:
+                await update.effective_message.reply_text(text)
+        except Exception as e:
+            logger.debug("Texnik xizmat xabari yuborilmadi: %s", e)
+    raise ApplicationHandlerStop
+
+
+async def start_settings_cache(application):
+    await settings_cache.start()
+
+
+async def stop_settings_cache(application):
+    await settings_cache.close()
+
+
+def register_settings_gate(app):
+    app.add_handler(TypeHandler(Update, settings_gate), group=SETTINGS_GATE_GROUP)
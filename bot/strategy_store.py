@@ -0,0 +1,88 @@
+"""Download-strategy statistikasini saqlash.
+
+services.downloaders.strategy.strategy_stats faqat xotirada o'rganadi; bu modul
+uni BotState jadvalida ('bot', 'strategies:<worker>') saqlaydi:
+
+- post_init: hamma worker'larning qatorlari o'qiladi va o'rtachalanadi —
+  restart'dan keyin tartib qaytadan o'rganilmaydi.
+- Har BOT_STRATEGY_FLUSH_INTERVAL soniyada, yangi urinish bo'lgan bo'lsa,
+  shu worker'ning qatori writer thread'da yoziladi; post_stop da oxirgi marta.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from bot.persistence import decode, encode
+from core import repository
+from services.downloaders.strategy import strategy_stats
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv('BOT_STRATEGY_FLUSH_INTERVAL', '60'))
+KEY_PREFIX = 'strategies:'
+# Endi yo'q worker'ning (BOT_WORKERS kamaytirilgan) qatori shundan keyin o'chiriladi
+STATE_TTL = 30 * 24 * 3600
+
+
+class StrategyStore:
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._saved_version = strategy_stats.version
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        rows = await repository.load_states('bot', KEY_PREFIX)
+        states = [decode(blob) for _, blob in rows]
+        if states:
+            strategy_stats.restore(states)
+            logger.info("Download strategiyalari statistikasi yuklandi (%d qator)", len(states))
+
+    async def flush(self):
+        version = strategy_stats.version
+        if version == self._saved_version:
+            return
+        # Worker indeksi worker_main da qo'yiladi — import paytida emas
+        key = f"{KEY_PREFIX}{os.getenv('BOT_WORKER_INDEX', '0')}"
+        await repository.write_states({('bot', key): (encode(strategy_stats.to_state()), STATE_TTL)})
+        self._saved_version = version
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Strategiya statistikasi yozilmadi: %s", e)
+
+    async def start(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.warning("Strategiya statistikasi o'qilmadi, default tartib ishlatiladi: %s", e)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='strategy_store')
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Strategiya statistikasi yozilmadi: %s", e)
+
+
+strategy_store = StrategyStore()
+
+
+async def start_strategy_store(application):
+    await strategy_store.start()
+
+
+async def stop_strategy_store(application):
+    await strategy_store.close()
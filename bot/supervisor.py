@@ -0,0 +1,324 @@
+"""User-sharded multi-process bot workers.
+
+Supervisor update'larni qabul qiladi (polling yoki webhook) va yuboruvchi
+user id bo'yicha (user bo'lmasa chat id) N ta worker process'dan biriga
+yo'naltiradi. Bitta foydalanuvchining hamma update'lari — qaysi chatda
+bo'lmasin — doim bitta worker'ga tushadi, shuning uchun context.user_data
+(va uning BotState qatori) faqat shu process'da o'zgaradi. Shaxsiy chatda
+user id = chat id, tartib saqlanadi.
+
+- Health check: worker har soniyada heartbeat yozadi; process o'lsa yoki
+  event loop qotib heartbeat eskirsa, worker qayta ishga tushiriladi.
+- Reload (SIGHUP): worker'lar navbat bilan drain qilinadi — navbatdagi
+  update'larni tugatib chiqadi, yangisi o'sha navbatdan davom etadi.
+- SIGINT/SIGTERM: hamma worker drain qilinadi, keyin supervisor chiqadi.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import List, Optional
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter
+
+from bot.webhook import WebhookReceiver, application_running, register_webhook, resolve_secret, serve
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+WORKER_QUEUE_SIZE = int(os.getenv('BOT_WORKER_QUEUE_SIZE', '1000'))
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TIMEOUT = float(os.getenv('BOT_WORKER_HEARTBEAT_TIMEOUT', '30'))
+HEALTH_CHECK_INTERVAL = 2.0
+# Tez-tez yiqilayotgan worker'ni (masalan, noto'g'ri token) shu vaqtdan oldin qayta ko'tarmaymiz
+RESTART_BACKOFF = 10.0
+DRAIN_TIMEOUT = float(os.getenv('BOT_WORKER_DRAIN_TIMEOUT', '120'))
+POLL_TIMEOUT = 30
+
+# Worker'ga "navbatni tugatib chiq" signali
+_DRAIN = None
+
+
+def route_key(data: dict) -> int:
+    """Raw update JSON'idan user id (user bo'lmasa, masalan kanal post'i — chat id)"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from')
+        if user and 'id' in user:
+            return int(user['id'])
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return int(chat['id'])
+    return 0
+
+
+# ─── Worker process ─────────────────────────────────────────
+
+def worker_main(index: int, workers: int, inbox, heartbeats, token: str):
+    """Worker process entry point (spawn bilan ishga tushadi)"""
+    # Ctrl+C ni supervisor boshqaradi, worker drain signalini kutadi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # DB maintenance kabi process'ga bitta ishlar faqat 0-worker'da
+    os.environ['BOT_WORKER_INDEX'] = str(index)
+
+    # Django setup + handler'lar shu import ichida
+    from bot import run_bot
+
+    app = run_bot.build_application(token, workers)
+    run_bot.register_handlers(app)
+    asyncio.run(_run_worker(app, index, inbox, heartbeats))
+
+
+async def _heartbeat(index: int, heartbeats):
+    while True:
+        heartbeats[index] = time.time()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _run_worker(app, index: int, inbox, heartbeats):
+    # post_init (sozlamalar keshi, watchdog, 0-worker'da DB maintenance) va
+    # post_stop (buferlarni yozish) — polling/webhook rejimidagidek
+    async with application_running(app):
+        beat = asyncio.create_task(_heartbeat(index, heartbeats))
+        logger.info("Worker %d ishga tushdi (pid=%d)", index, os.getpid())
+        try:
+            while True:
+                data = await asyncio.to_thread(inbox.get)
+                if data is _DRAIN:
+                    break
+                try:
+                    update = Update.de_json(data, app.bot)
+                except Exception as e:
+                    logger.warning("Worker %d: invalid update: %s", index, e)
+                    continue
+                await app.update_queue.put(update)
+        finally:
+            beat.cancel()
+    logger.info("Worker %d drain qilindi", index)
+
+
+# ─── Supervisor ─────────────────────────────────────────────
+
+class _Worker:
+    __slots__ = ('index', 'inbox', 'process', 'started_at', 'restarts')
+
+    def __init__(self, index: int, inbox):
+        self.index = index
+        self.inbox = inbox
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, token: str, workers: int = WORKERS, allowed_updates: Optional[List[str]] = None):
+        self.token = token
+        self.allowed_updates = allowed_updates
+        self._ctx = multiprocessing.get_context('spawn')
+        self._heartbeats = self._ctx.Array('d', workers, lock=False)
+        self._workers = [_Worker(i, self._new_inbox()) for i in range(workers)]
+        self._stopping = False
+        self._reloading = False
+        # Polling: worker navbatiga qo'yilgan oxirgi update_id + 1
+        self._offset: Optional[int] = None
+
+    def _new_inbox(self):
+        return self._ctx.Queue(maxsize=WORKER_QUEUE_SIZE)
+
+    @staticmethod
+    def _move_pending(old, new) -> int:
+        """Eski navbatda qolgan update'larni yangisiga o'tkazadi (lock buzilgan bo'lsa timeout bilan chiqadi)"""
+        moved = 0
+        while True:
+            try:
+                data = old.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError, ValueError):
+                break
+            if data is not _DRAIN:
+                new.put(data)
+                moved += 1
+        old.close()
+        old.cancel_join_thread()
+        return moved
+
+    # Worker lifecycle
+
+    def _start(self, worker: _Worker):
+        self._heartbeats[worker.index] = time.time()
+        worker.process = self._ctx.Process(
+            target=worker_main,
+            args=(worker.index, len(self._workers), worker.inbox, self._heartbeats, self.token),
+            name=f'bot-worker-{worker.index}',
+            daemon=False,
+        )
+        worker.process.start()
+        worker.started_at = time.time()
+
+    async def _drain(self, worker: _Worker):
+        """Drain signalini yuboradi va worker chiqishini kutadi"""
+        if not worker.process or not worker.process.is_alive():
+            return
+        await asyncio.to_thread(worker.inbox.put, _DRAIN)
+        await asyncio.to_thread(worker.process.join, DRAIN_TIMEOUT)
+        if worker.process.is_alive():
+            logger.warning("Worker %d drain timeout, terminate", worker.index)
+            worker.process.terminate()
+            await asyncio.to_thread(worker.process.join, 5)
+
+    async def reload(self):
+        """Rolling restart: navbatdagi update'lar yo'qolmaydi, tartib saqlanadi"""
+        if self._reloading:
+            return
+        self._reloading = True
+        try:
+            for worker in self._workers:
+                await self._drain(worker)
+                # Drain belgisidan keyin kelgan update'lar shu navbatda kutib turadi
+                self._start(worker)
+                logger.info("Worker %d qayta yuklandi", worker.index)
+        finally:
+            self._reloading = False
+
+    async def _health_loop(self):
+        while not self._stopping:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            if self._reloading or self._stopping:
+                continue
+            now = time.time()
+            for worker in self._workers:
+                process = worker.process
+                stale = now - self._heartbeats[worker.index] > HEARTBEAT_TIMEOUT
+                if process.is_alive() and not stale:
+                    continue
+                if not process.is_alive() and now - worker.started_at < RESTART_BACKOFF:
+                    continue
+                if process.is_alive():
+                    logger.error("Worker %d javob bermayapti (heartbeat %.0fs), terminate",
+                                 worker.index, now - self._heartbeats[worker.index])
+                    process.terminate()
+                    await asyncio.to_thread(process.join, 5)
+                    # Majburan to'xtatilgan process navbat lock'ini buzishi mumkin —
+                    # yangi navbat, eskisida kutayotgan update'lar unga ko'chiriladi
+                    old, worker.inbox = worker.inbox, self._new_inbox()
+                    moved = await asyncio.to_thread(self._move_pending, old, worker.inbox)
+                    if moved:
+                        logger.warning("Worker %d: %d ta update yangi navbatga ko'chirildi", worker.index, moved)
+                else:
+                    logger.error("Worker %d to'xtadi (exitcode=%s)", worker.index, process.exitcode)
+                worker.restarts += 1
+                self._start(worker)
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            'workers': [
+                {
+                    'index': w.index,
+                    'pid': w.process.pid if w.process else None,
+                    'alive': bool(w.process and w.process.is_alive()),
+                    'heartbeat_age': round(now - self._heartbeats[w.index], 1),
+                    'restarts': w.restarts,
+                }
+                for w in self._workers
+            ],
+        }
+
+    # Routing
+
+    def _worker_for(self, data: dict) -> _Worker:
+        return self._workers[route_key(data) % len(self._workers)]
+
+    def submit(self, data: dict) -> bool:
+        try:
+            self._worker_for(data).inbox.put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    async def _route(self, data: dict):
+        """Polling uchun: worker navbati to'la bo'lsa kutadi"""
+        await asyncio.to_thread(self._worker_for(data).inbox.put, data)
+
+    # Intake
+
+    async def _poll(self, bot: Bot):
+        await bot.delete_webhook()
+        while not self._stopping:
+            try:
+                updates = await bot.get_updates(
+                    offset=self._offset, timeout=POLL_TIMEOUT, allowed_updates=self.allowed_updates,
+                    read_timeout=POLL_TIMEOUT + 10,
+                )
+            except RetryAfter as e:
+                retry = e.retry_after
+                await asyncio.sleep(retry.total_seconds() if hasattr(retry, 'total_seconds') else float(retry))
+                continue
+            except NetworkError as e:
+                logger.warning("get_updates error: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self._route(update.to_dict())
+                self._offset = update.update_id + 1
+
+    async def _acknowledge(self, bot: Bot):
+        """
+        Offset keyingi getUpdates bilan tasdiqlanadi: to'xtashda oxirgi bo'lak
+        shu yerda tasdiqlanmasa, restart'dan keyin qayta keladi (yuklash, qidiruv
+        ikki marta bajariladi). Worker navbatidagilar drain paytida ishlanadi.
+        """
+        if self._offset is None:
+            return
+        try:
+            await bot.get_updates(offset=self._offset, timeout=0, allowed_updates=self.allowed_updates)
+        except Exception as e:
+            logger.warning("Oxirgi offset tasdiqlanmadi: %s", e)
+
+    async def run(self, mode: str = 'polling'):
+        for worker in self._workers:
+            self._start(worker)
+
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig, callback in ((signal.SIGINT, stop.set), (signal.SIGTERM, stop.set),
+                              (getattr(signal, 'SIGHUP', None), lambda: asyncio.ensure_future(self.reload()))):
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, callback)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        health = asyncio.create_task(self._health_loop())
+        runner = None
+        intake = None
+        async with Bot(self.token) as bot:
+            if mode == 'webhook':
+                secret = resolve_secret()
+                receiver = WebhookReceiver(self.submit, secret, status=self.status)
+                runner = await serve(receiver)
+                await register_webhook(bot, self.allowed_updates, secret)
+            else:
+                intake = asyncio.create_task(self._poll(bot))
+
+            await stop.wait()
+            logger.info("Supervisor to'xtamoqda, worker'lar drain qilinmoqda...")
+            self._stopping = True
+            if runner:
+                await runner.cleanup()
+            if intake:
+                intake.cancel()
+                await asyncio.gather(intake, return_exceptions=True)
+                await self._acknowledge(bot)
+            health.cancel()
+            await asyncio.gather(*(self._drain(w) for w in self._workers))
+
+
+def run_supervisor(token: str, workers: int, mode: str, allowed_updates: List[str]):
+    asyncio.run(Supervisor(token, workers, allowed_updates).run(mode))
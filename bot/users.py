@@ -0,0 +1,133 @@
+"""User context layer: TelegramUser cache with write-behind last_active.
+
+Har update'dan oldin (group -1) ishlaydigan pre-handler foydalanuvchini
+keshdan oladi va context.db_user ga qo'yadi:
+
+- Bazaga faqat yangi foydalanuvchi yoki profil (username, ism, familiya)
+  o'zgarganda yoziladi.
+- last_active har update'da yozilmaydi: faol foydalanuvchilar to'planib,
+  BOT_LAST_ACTIVE_INTERVAL da bir marta bitta UPDATE bilan yoziladi.
+- Kesh yozuvi BOT_USER_CACHE_TTL dan keyin bazadan qayta o'qiladi (admin
+  panelda is_premium/is_banned o'zgarsa ko'rinadi).
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+from django.utils import timezone
+from telegram import Update
+from telegram.ext import CallbackContext, ContextTypes, TypeHandler
+
+from core import repository
+from core.models import TelegramUser
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv('BOT_USER_CACHE_SIZE', '50000'))
+USER_CACHE_TTL = int(os.getenv('BOT_USER_CACHE_TTL', '300'))
+LAST_ACTIVE_INTERVAL = int(os.getenv('BOT_LAST_ACTIVE_INTERVAL', '60'))
+
+USER_CONTEXT_GROUP = -1
+
+Profile = Tuple[str, str, str]
+
+
+class BotContext(CallbackContext):
+    """CallbackContext + pre-handler qo'ygan TelegramUser"""
+
+    def __init__(self, application, chat_id=None, user_id=None):
+        super().__init__(application, chat_id=chat_id, user_id=user_id)
+        self.db_user: Optional[TelegramUser] = None
+        # shu update'da qaytarilgan limit turlari (bot.quota) — ikki marta qaytarilmasin
+        self.refunded: Set[int] = set()
+
+
+def profile_of(tg_user) -> Profile:
+    return (tg_user.username or '', tg_user.first_name or '', tg_user.last_name or '')
+
+
+class UserCache:
+    """telegram_id -> (TelegramUser, profil, o'qilgan vaqt), LRU"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: 'OrderedDict[int, Tuple[TelegramUser, Profile, float]]' = OrderedDict()
+        self._active: Set[int] = set()
+        self._last_flush = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, tg_user) -> TelegramUser:
+        profile = profile_of(tg_user)
+        now = time.time()
+        entry = self._users.get(tg_user.id)
+        if entry and entry[1] == profile and now - entry[2] < self.ttl:
+            self.hits += 1
+            self._users.move_to_end(tg_user.id)
+            self._active.add(tg_user.id)
+            return entry[0]
+
+        self.misses += 1
+        user = await repository.get_or_create_user(tg_user.id, *profile)
+        self._users[tg_user.id] = (user, profile, now)
+        self._users.move_to_end(tg_user.id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+        # get_or_create_user last_active ni faqat yangi yoki profili o'zgargan
+        # foydalanuvchida yozadi — qolganlari keyingi flush'da
+        self._active.add(tg_user.id)
+        return user
+
+    def flush_due(self) -> bool:
+        return bool(self._active) and time.time() - self._last_flush >= LAST_ACTIVE_INTERVAL
+
+    async def flush(self):
+        """To'plangan last_active'larni bitta UPDATE bilan yozadi"""
+        self._last_flush = time.time()
+        if not self._active:
+            return
+        active, self._active = self._active, set()
+        when = timezone.now()
+        try:
+            await repository.touch_users(active, when)
+        except Exception as e:
+            logger.warning("last_active yozilmadi (%d user): %s", len(active), e)
+            self._active |= active
+            return
+        for telegram_id in active:
+            entry = self._users.get(telegram_id)
+            if entry:
+                entry[0].last_active = when
+
+
+user_cache = UserCache()
+
+
+async def user_context(update: Update, context: BotContext):
+    """Pre-handler: context.db_user ni to'ldiradi"""
+    tg_user = update.effective_user
+    if not tg_user or tg_user.is_bot:
+        return
+    try:
+        context.db_user = await user_cache.get(tg_user)
+    except Exception as e:
+        logger.error("User %s ni saqlab bo'lmadi: %s", tg_user.id, e)
+        return
+    if user_cache.flush_due():
+        context.application.create_task(user_cache.flush(), name='user_cache:flush')
+
+
+async def flush_user_activity(application):
+    """Application.post_stop: qolgan last_active'larni yozib qo'yadi"""
+    await user_cache.flush()
+
+
+def context_types() -> ContextTypes:
+    return ContextTypes(context=BotContext)
+
+
+def register_user_context(app):
+    app.add_handler(TypeHandler(Update, user_context), group=USER_CONTEXT_GROUP)
@@ -0,0 +1,197 @@
+"""Webhook mode: async HTTP receiver instead of long polling.
+
+Telegram update'larni POST qiladi, biz secret token'ni tekshiramiz va
+update'ni cheklangan navbatga qo'yamiz. BOT_WEBHOOK_SECRET siz ishga
+tushmaydi: tasodifiy secret'ni har process (worker, replika, restart) o'zicha
+yaratib setWebhook qilsa, oxirgisidan boshqa hammasi Telegram'ga 403 qaytaradi.
+Umumiy secret bilan setWebhook'ni bir necha process chaqirsa ham zarari yo'q.
+Navbat to'la bo'lsa 503 qaytaramiz — Telegram keyinroq qayta yuboradi
+(backpressure).
+
+Bir nechta process bitta portni (SO_REUSEPORT) yoki har biri o'z portini
+ishlatib, lokal reverse proxy (nginx) orqasida ishlashi mumkin.
+"""
+import asyncio
+import contextlib
+import hmac
+import logging
+import os
+import secrets
+import signal
+import socket
+from typing import Callable, List, Optional
+
+from aiohttp import web
+from telegram import Update
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', '/telegram/webhook')
+# Telegram ko'radigan tashqi URL (proxy manzili), masalan https://bot.example.com/telegram/webhook
+WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('BOT_WEBHOOK_MAX_CONNECTIONS', '40'))
+# setWebhook (URL va secret hamma process'da bir xil — qayta chaqirish zararsiz)
+WEBHOOK_REGISTER = os.getenv('BOT_WEBHOOK_REGISTER', 'True').lower() in ('true', '1', 'yes')
+WEBHOOK_REUSE_PORT = os.getenv(
+    'BOT_WEBHOOK_REUSE_PORT', str(hasattr(socket, 'SO_REUSEPORT'))
+).lower() in ('true', '1', 'yes')
+RETRY_AFTER_SECONDS = 1
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def resolve_secret() -> str:
+    """BOT_WEBHOOK_SECRET; yo'q bo'lsa RuntimeError"""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    raise RuntimeError(
+        "Webhook rejimi BOT_WEBHOOK_SECRET siz ishga tushmaydi (hamma process'da bir xil bo'lishi kerak). "
+        f"Masalan: BOT_WEBHOOK_SECRET={secrets.token_urlsafe(32)}"
+    )
+
+
+def get_allowed_updates(default: List[str]) -> List[str]:
+    """BOT_ALLOWED_UPDATES=message,callback_query,inline_query bilan almashtirish mumkin"""
+    raw = os.getenv('BOT_ALLOWED_UPDATES', '').strip()
+    if not raw:
+        return list(default)
+    return [u.strip() for u in raw.split(',') if u.strip()]
+
+
+class WebhookReceiver:
+    """
+    submit(data) update JSON'ini qabul qiladi va False qaytarsa navbat to'la
+    hisoblanadi. Bitta processda bu Application.update_queue, supervisor
+    rejimida esa worker'ga yo'naltirish.
+    """
+
+    def __init__(self, submit: Callable[[dict], bool], secret: str,
+                 path: str = WEBHOOK_PATH, status: Optional[Callable[[], dict]] = None):
+        if not secret:
+            raise ValueError("WebhookReceiver secret talab qiladi")
+        self.submit = submit
+        self.secret = secret
+        self.path = path
+        self.status = status
+        self.accepted = 0
+        self.rejected = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 * 1024)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict) or 'update_id' not in data:
+            return web.Response(status=400)
+
+        if not self.submit(data):
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+        self.accepted += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        data = {'accepted': self.accepted, 'rejected': self.rejected}
+        if self.status:
+            data.update(self.status())
+        return web.json_response(data)
+
+
+def queue_submitter(application) -> Callable[[dict], bool]:
+    """Update'ni Application navbatiga kutmasdan qo'yadi"""
+    def submit(data: dict) -> bool:
+        try:
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            # Buzilgan update'ni qayta yubortirishdan foyda yo'q — qabul qilib tashlaymiz
+            logger.warning("Invalid update %s: %s", data.get('update_id'), e)
+            return True
+        try:
+            application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+    return submit
+
+
+async def serve(receiver: WebhookReceiver, host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT) -> web.AppRunner:
+    runner = web.AppRunner(receiver.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=WEBHOOK_REUSE_PORT or None)
+    await site.start()
+    logger.info("Webhook receiver http://%s:%s%s", host, port, receiver.path)
+    return runner
+
+
+async def wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C KeyboardInterrupt orqali to'xtatadi
+    await stop.wait()
+
+
+async def register_webhook(bot, allowed_updates: List[str], secret: str, url: Optional[str] = None):
+    url = url or WEBHOOK_URL
+    if not WEBHOOK_REGISTER or not url:
+        return
+    await bot.set_webhook(
+        url=url,
+        secret_token=secret,
+        allowed_updates=allowed_updates,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info("setWebhook: %s (allowed_updates=%s)", url, allowed_updates)
+
+
+@contextlib.asynccontextmanager
+async def application_running(application):
+    """
+    run_polling/run_webhook lifecycle'i o'z runner'larimiz uchun: initialize,
+    post_init, start ... stop, post_stop, shutdown, post_shutdown. `async with
+    application` + start() post_init/post_stop'ni chaqirmaydi.
+    """
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            yield application
+        finally:
+            # stop() navbatdagi update'lar va fon task'lar tugashini kutadi
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+async def run_webhook(application, allowed_updates: List[str]):
+    """Application'ni webhook rejimida ishga tushiradi va signal kelguncha ishlaydi"""
+    secret = resolve_secret()
+    receiver = WebhookReceiver(queue_submitter(application), secret, status=metrics.snapshot)
+    async with application_running(application):
+        runner = await serve(receiver)
+        try:
+            await register_webhook(application.bot, allowed_updates, secret)
+            await wait_for_stop_signal()
+        finally:
+            # Avval yangi update qabul qilishni to'xtatamiz, keyin navbatni tugatamiz
+            await runner.cleanup()
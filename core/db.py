@@ -0,0 +1,117 @@
+"""SQLite connection profile and maintenance.
+
+Bot va dashboard bitta db.sqlite3 ga yozadi. Har yangi ulanishda:
+
+- journal_mode=WAL: o'quvchilar yozuvchini, yozuvchi o'quvchilarni bloklamaydi
+- synchronous=NORMAL: WAL bilan xavfsiz, har commit'da fsync qilinmaydi
+- busy_timeout: lock band bo'lsa darhol "database is locked" emas, kutadi
+- mmap_size, cache_size, temp_store: katta o'qishlar (dashboard) uchun
+
+DB_SQLITE_TUNING=False bilan o'chiriladi (Django default'lari qoladi).
+run_maintenance() ANALYZE (PRAGMA optimize), incremental vacuum va WAL
+checkpoint qiladi; bot (supervisor rejimida 0-worker) uni
+DB_MAINTENANCE_INTERVAL da bir ishga tushiradi, qo'lda:
+python manage.py sqlite_maintenance
+
+Incremental vacuum faqat auto_vacuum=INCREMENTAL bazada ishlaydi. Mavjud
+baza bir marta o'tkaziladi (to'liq VACUUM, bazani qisqa vaqt bloklaydi —
+botni to'xtatib qiling): python manage.py sqlite_maintenance --vacuum
+Shungacha maintenance faqat ANALYZE va checkpoint qiladi va bu haqda ogohlantiradi.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict
+
+from django.db import connection as default_connection
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+SQLITE_TUNING = os.getenv('DB_SQLITE_TUNING', 'True').lower() in ('true', '1', 'yes')
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '20000'))
+MMAP_SIZE = int(os.getenv('DB_MMAP_MB', '256')) * 1024 * 1024
+CACHE_SIZE_KB = int(os.getenv('DB_CACHE_MB', '64')) * 1024
+MAINTENANCE_INTERVAL = int(os.getenv('DB_MAINTENANCE_INTERVAL', str(6 * 3600)))
+# Bir maintenance'da bo'shatiladigan sahifalar (4 KB) soni
+INCREMENTAL_VACUUM_PAGES = 2000
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('mmap_size', MMAP_SIZE),
+    ('cache_size', -CACHE_SIZE_KB),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created signal: yangi SQLite ulanishga pragma'larni qo'yadi"""
+    if connection.vendor != 'sqlite' or not SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for name, value in PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+
+
+def connect_signals():
+    connection_created.connect(configure_sqlite, dispatch_uid='core.db.configure_sqlite')
+
+
+def _pragma(cursor, name: str):
+    cursor.execute(f'PRAGMA {name}')
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def run_maintenance(vacuum: bool = False, connection=None) -> Dict:
+    """
+    PRAGMA optimize (kerakli jadvallar uchun ANALYZE), incremental vacuum va
+    WAL checkpoint. vacuum=True: auto_vacuum=INCREMENTAL ga o'tkazish uchun
+    bir martalik to'liq VACUUM (bazani qisqa vaqt bloklaydi).
+    """
+    connection = connection or default_connection
+    if connection.vendor != 'sqlite':
+        return {}
+    result = {}
+    with connection.cursor() as cursor:
+        if vacuum and _pragma(cursor, 'auto_vacuum') != 2:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('VACUUM')
+            result['vacuum'] = True
+        cursor.execute('PRAGMA analysis_limit=1000')
+        cursor.execute('PRAGMA optimize')
+        free_before = _pragma(cursor, 'freelist_count')
+        if _pragma(cursor, 'auto_vacuum') == 2:
+            cursor.execute(f'PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})')
+            cursor.fetchall()
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        busy, log_frames, checkpointed = cursor.fetchone()
+        result.update({
+            'auto_vacuum': _pragma(cursor, 'auto_vacuum'),
+            'freed_pages': free_before - _pragma(cursor, 'freelist_count'),
+            'wal_checkpoint': {'busy': busy, 'log': log_frames, 'checkpointed': checkpointed},
+        })
+    return result
+
+
+async def maintenance_loop(interval: int = MAINTENANCE_INTERVAL):
+    """Uzoq ishlaydigan process uchun: har interval soniyada run_maintenance (writer thread'da)"""
+    from .repository import run_db
+
+    warned = False
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_db(run_maintenance, write=True)
+            logger.info("SQLite maintenance: %s", result)
+        except Exception as e:
+            logger.warning("SQLite maintenance xatolik: %s", e)
+            continue
+        if result and result.get('auto_vacuum') != 2 and not warned:
+            warned = True
+            logger.warning(
+                "SQLite auto_vacuum=INCREMENTAL emas: bo'sh sahifalar qaytarilmaydi. "
+                "Bir marta (bot to'xtatilgan holda): python manage.py sqlite_maintenance --vacuum"
+            )
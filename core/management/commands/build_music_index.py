@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+
+from core.models import DownloadHistory, ShazamLog
+from services.search.local_index import music_index
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Mahalliy musiqa indeksini (FTS5) yuklab olish va Shazam tarixidan to'ldiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Indeksni tozalab, noldan quradi (aks holda mavjudlariga hits qo'shiladi)",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            music_index.clear()
+
+        downloads = (
+            DownloadHistory.objects
+            .filter(platform='youtube', status='completed')
+            .values('video_url')
+            .annotate(title=Max('video_title'), hits=Count('id'))
+            .order_by()
+        )
+        indexed = 0
+        batch = []
+        for row in downloads.iterator(chunk_size=BATCH_SIZE):
+            batch.append({'url': row['video_url'], 'title': row['title'], 'hits': row['hits']})
+            if len(batch) >= BATCH_SIZE:
+                indexed += music_index.add_tracks(batch)
+                batch = []
+        if batch:
+            indexed += music_index.add_tracks(batch)
+
+        recognized = (
+            ShazamLog.objects
+            .filter(is_successful=True)
+            .exclude(recognized_title__isnull=True)
+            .values('recognized_title', 'recognized_artist')
+            .annotate(hits=Count('id'))
+            .order_by()
+        )
+        bumped = sum(
+            music_index.bump(row['recognized_title'], row['recognized_artist'] or '', row['hits'])
+            for row in recognized.iterator(chunk_size=BATCH_SIZE)
+        )
+
+        self.stdout.write(f'indexed: {indexed}')
+        self.stdout.write(f'shazam_bumped: {bumped}')
+        self.stdout.write(f'total: {music_index.count()}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.db import run_maintenance
+
+
+class Command(BaseCommand):
+    help = (
+        "SQLite maintenance: ANALYZE (PRAGMA optimize), incremental vacuum, WAL checkpoint. "
+        "Incremental vacuum bazani bir marta --vacuum bilan o'tkazgandan keyin ishlaydi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vacuum', action='store_true',
+            help="Bir martalik to'liq VACUUM va auto_vacuum=INCREMENTAL (bazani qisqa vaqt bloklaydi)",
+        )
+
+    def handle(self, *args, **options):
+        result = run_maintenance(vacuum=options['vacuum'])
+        for key, value in result.items():
+            self.stdout.write(f'{key}: {value}')
@@ -0,0 +1,71 @@
+"""Process-local metrics: counters, gauges va latency taqsimoti.
+
+Django'ga bog'liq emas — bot, services va benchmark'lar ishlatishi mumkin.
+snapshot() webhook /healthz javobiga qo'shiladi.
+"""
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict
+
+# Percentile uchun har metrikada oxirgi N ta qiymat saqlanadi
+SAMPLE_SIZE = 1024
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * q))
+    return sorted_values[index]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        """Qiymat snapshot paytida func() dan o'qiladi (masalan, navbat uzunligi)"""
+        self._gauges[name] = func
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=SAMPLE_SIZE)
+            samples.append(value)
+
+    def summary(self, name: str) -> Dict[str, float]:
+        with self._lock:
+            values = sorted(self._samples.get(name, ()))
+        return {
+            'count': len(values),
+            'p50': round(percentile(values, 0.50), 4),
+            'p95': round(percentile(values, 0.95), 4),
+            'p99': round(percentile(values, 0.99), 4),
+            'max': round(values[-1], 4) if values else 0.0,
+        }
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+        gauges = {}
+        for name, func in list(self._gauges.items()):
+            try:
+                gauges[name] = func()
+            except Exception:
+                gauges[name] = None
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'latency': {name: self.summary(name) for name in names},
+        }
+
+
+metrics = Metrics()
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_adcampaign_premiumplan_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Foydalanuvchi'), ('chat', 'Chat'), ('bot', 'Bot'), ('conv', 'Suhbat')], max_length=8, verbose_name='Turi')),
+                ('key', models.CharField(max_length=255, verbose_name='Kalit')),
+                ('data', models.BinaryField(verbose_name="Ma'lumot")),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Amal qilish muddati')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Yangilangan vaqt')),
+            ],
+            options={
+                'verbose_name': 'Bot holati',
+                'verbose_name_plural': 'Bot holatlari',
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
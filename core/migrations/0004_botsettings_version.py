@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_botstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botsettings',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Versiya'),
+        ),
+    ]
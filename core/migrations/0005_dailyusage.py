@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_botsettings_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Kun')),
+                ('downloads', models.PositiveIntegerField(default=0, verbose_name='Yuklashlar')),
+                ('shazams', models.PositiveIntegerField(default=0, verbose_name="Shazam so'rovlari")),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Yangilangan vaqt')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='core.telegramuser')),
+            ],
+            options={
+                'verbose_name': 'Kunlik foydalanish',
+                'verbose_name_plural': 'Kunlik foydalanish',
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
@@ -161,6 +161,8 @@ class BotSettings(models.Model):
     free_daily_download_limit = models.PositiveIntegerField(default=5, verbose_name='Bepul kunlik yuklab olish limiti')
     premium_daily_download_limit = models.PositiveIntegerField(default=100, verbose_name='Premium kunlik yuklab olish limiti')
     ad_revenue_per_view = models.DecimalField(max_digits=10, decimal_places=4, default=0, verbose_name='Reklama daromadi (ko\u02BBrishga)')
+    # Har save() da oshadi; bot process'lari shu orqali keshni yangilaydi
+    version = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Versiya')
 
     class Meta:
         verbose_name = 'Bot sozlamalari'
@@ -172,7 +174,21 @@ class BotSettings(models.Model):
     def save(self, *args, **kwargs):
         # Faqat bitta instance bo'lishini ta'minlash
         self.pk = 1
+        if not kwargs.get('force_insert') and BotSettings.objects.filter(pk=1).exists():
+            # Xotiradagi (eskirgan bo'lishi mumkin) version yozilmaydi: A va B bir
+            # vaqtda o'qib saqlasa ham versiya ikki marta oshadi
+            fields = kwargs.pop('update_fields', None) or [
+                field.name for field in self._meta.concrete_fields if not field.primary_key
+            ]
+            kwargs['update_fields'] = [name for name in fields if name != 'version']
         super().save(*args, **kwargs)
+        # Versiya bazada oshiriladi. queryset.update() bu yerdan o'tmaydi —
+        # u holda bump_version() ni chaqiring.
+        self.bump_version()
+
+    def bump_version(self):
+        BotSettings.objects.filter(pk=1).update(version=models.F('version') + 1)
+        self.refresh_from_db(fields=['version'])
 
     @classmethod
     def get_settings(cls):
@@ -274,3 +290,44 @@ class ErrorLog(models.Model):
 
     def __str__(self):
         return f'{self.get_error_type_display()} - {self.created_at}'
+
+
+class BotState(models.Model):
+    """Bot persistence: user/chat/bot data, siqilgan (zlib + json) ko'rinishda"""
+    KIND_CHOICES = [
+        ('user', 'Foydalanuvchi'),
+        ('chat', 'Chat'),
+        ('bot', 'Bot'),
+        ('conv', 'Suhbat'),
+    ]
+
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, verbose_name='Turi')
+    key = models.CharField(max_length=255, verbose_name='Kalit')
+    data = models.BinaryField(verbose_name="Ma'lumot")
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name='Amal qilish muddati')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Yangilangan vaqt')
+
+    class Meta:
+        verbose_name = 'Bot holati'
+        verbose_name_plural = 'Bot holatlari'
+        unique_together = [('kind', 'key')]
+
+    def __str__(self):
+        return f'{self.kind}:{self.key}'
+
+
+class DailyUsage(models.Model):
+    """Foydalanuvchining kunlik yuklash/Shazam hisoblagichlari (Asia/Tashkent kuni)"""
+    user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, related_name='daily_usage')
+    day = models.DateField(verbose_name='Kun')
+    downloads = models.PositiveIntegerField(default=0, verbose_name='Yuklashlar')
+    shazams = models.PositiveIntegerField(default=0, verbose_name='Shazam so\'rovlari')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Yangilangan vaqt')
+
+    class Meta:
+        verbose_name = 'Kunlik foydalanish'
+        verbose_name_plural = 'Kunlik foydalanish'
+        unique_together = [('user', 'day')]
+
+    def __str__(self):
+        return f'{self.user_id} {self.day}: {self.downloads}/{self.shazams}'
@@ -0,0 +1,259 @@
+"""Bot data access: async funksiyalar va cheklangan DB executor.
+
+sync_to_async (thread_sensitive=True) — shu jumladan Django'ning aget/acreate
+metodlari — hamma ORM chaqiruvlarini bitta thread'ga navbat qiladi. Bu yerda:
+
+- o'qishlar BOT_DB_THREADS ta thread'li executor'da parallel bajariladi;
+- yozishlar bitta writer thread'da: SQLite baribir bitta yozuvchiga ruxsat
+  beradi, bir nechta thread'dan yozish faqat lock kutishini oshiradi.
+
+Har chaqiruvdan oldin va keyin close_old_connections() — uzoq ishlaydigan
+process'da uzilgan yoki CONN_MAX_AGE dan eskirgan ulanishlar yopiladi.
+"""
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BotSettings, BotState, DailyUsage, PremiumPlan, TelegramUser
+
+logger = logging.getLogger(__name__)
+
+DB_THREADS = int(os.getenv('BOT_DB_THREADS', '4'))
+WRITE_BATCH_SIZE = 500
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(func, *args, write: bool = False, **kwargs):
+    """func(*args, **kwargs) ni DB executor'da (write=True bo'lsa writer thread'da) bajaradi"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_writer if write else db_executor, _call, func, args, kwargs)
+
+
+def db_task(func=None, *, write: bool = False):
+    """Sync ORM funksiyasini DB executor'da ishlaydigan async funksiyaga aylantiradi"""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await run_db(func, *args, write=write, **kwargs)
+        wrapper.sync = func
+        return wrapper
+    return decorate(func) if func else decorate
+
+
+def shutdown():
+    db_executor.shutdown()
+    db_writer.shutdown()
+
+
+# ─── Users ──────────────────────────────────────────────────
+
+def _profile(user: TelegramUser) -> Tuple[str, str, str]:
+    return user.username or '', user.first_name or '', user.last_name or ''
+
+
+@db_task
+def _find_user(telegram_id: int) -> Optional[TelegramUser]:
+    return TelegramUser.objects.filter(telegram_id=telegram_id).first()
+
+
+@db_task(write=True)
+def _save_user(telegram_id: int, username: str, first_name: str, last_name: str) -> TelegramUser:
+    user, created = TelegramUser.objects.get_or_create(
+        telegram_id=telegram_id,
+        defaults={'username': username, 'first_name': first_name, 'last_name': last_name},
+    )
+    profile = (username, first_name, last_name)
+    if not created and _profile(user) != profile:
+        user.username, user.first_name, user.last_name = profile
+        user.last_active = timezone.now()
+        TelegramUser.objects.filter(pk=user.pk).update(
+            username=username, first_name=first_name, last_name=last_name,
+            last_active=user.last_active,
+        )
+    return user
+
+
+async def get_or_create_user(telegram_id: int, username: str, first_name: str, last_name: str) -> TelegramUser:
+    """
+    Yangi bo'lsa yaratadi; profil o'zgargan bo'lsa faqat o'sha maydonlarni yozadi.
+    Odatdagi holat (bor, o'zgarmagan) — faqat o'qish; yozuv writer thread'da.
+    """
+    user = await _find_user(telegram_id)
+    if user is not None and _profile(user) == (username, first_name, last_name):
+        return user
+    return await _save_user(telegram_id, username, first_name, last_name)
+
+
+@db_task(write=True)
+def touch_users(telegram_ids: Iterable[int], when) -> None:
+    ids = list(telegram_ids)
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        TelegramUser.objects.filter(telegram_id__in=ids[start:start + WRITE_BATCH_SIZE]).update(last_active=when)
+
+
+# ─── Bot settings ───────────────────────────────────────────
+
+@db_task
+def get_settings_version() -> int:
+    """Faqat versiya ustuni: har soniyada chaqirilsa ham arzon (pk bo'yicha)"""
+    return BotSettings.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+@db_task
+def _find_bot_settings() -> Optional[BotSettings]:
+    return BotSettings.objects.filter(pk=1).first()
+
+
+async def get_bot_settings() -> BotSettings:
+    """Qator bo'lmasa (yangi baza) standart qator writer thread'da yaratiladi"""
+    settings = await _find_bot_settings()
+    if settings is None:
+        settings = await run_db(BotSettings.get_settings, write=True)
+    return settings
+
+
+@db_task
+def get_active_plans() -> List[PremiumPlan]:
+    return list(PremiumPlan.objects.filter(is_active=True))
+
+
+# ─── Daily quotas ───────────────────────────────────────────
+
+@db_task
+def load_daily_usage(user_id: int, day) -> Tuple[int, int]:
+    row = DailyUsage.objects.filter(user_id=user_id, day=day).values_list('downloads', 'shazams').first()
+    return row or (0, 0)
+
+
+@db_task(write=True)
+def add_daily_usage(deltas: Dict[Tuple[int, object], Tuple[int, int]]) -> None:
+    """
+    (user_id, day) -> (downloads, shazams) farqlari (qaytarilganda manfiy).
+    Qiymat ustiga qo'shiladi — bulk_create(update_conflicts) faqat almashtiradi,
+    bu yerda esa bir foydalanuvchini bir necha process hisoblasa ham yo'qolmaydi.
+    """
+    table = DailyUsage._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (user_id, day, downloads, shazams, updated_at) '
+        f'VALUES (%s, %s, MAX(0, %s), MAX(0, %s), %s) '
+        f'ON CONFLICT (user_id, day) DO UPDATE SET '
+        f'downloads = MAX(0, {table}.downloads + %s), '
+        f'shazams = MAX(0, {table}.shazams + %s), '
+        f'updated_at = excluded.updated_at'
+    )
+    now = timezone.now()
+    items = list(deltas.items())
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(items), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, [
+                (user_id, day, downloads, shazams, now, downloads, shazams)
+                for (user_id, day), (downloads, shazams) in items[start:start + WRITE_BATCH_SIZE]
+            ])
+
+
+# ─── Bot state (persistence) ────────────────────────────────
+
+@db_task
+def load_state(kind: str, key: str) -> Optional[bytes]:
+    blob = (
+        BotState.objects
+        .filter(kind=kind, key=key)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+        .values_list('data', flat=True)
+        .first()
+    )
+    return bytes(blob) if blob is not None else None
+
+
+@db_task
+def load_states(kind: str, prefix: str) -> List[Tuple[str, bytes]]:
+    rows = BotState.objects.filter(kind=kind, key__startswith=prefix).values_list('key', 'data')
+    return [(key, bytes(data)) for key, data in rows]
+
+
+@db_task(write=True)
+def write_states(pending: Dict[Tuple[str, str], Tuple[Optional[bytes], Optional[float]]]) -> None:
+    """(kind, key) -> (data, ttl soniya); data=None — qatorni o'chirish. Bitta tranzaksiya."""
+    rows = []
+    deletes = []
+    for (kind, key), (data, ttl) in pending.items():
+        if data is None:
+            deletes.append((kind, key))
+            continue
+        rows.append(BotState(
+            kind=kind, key=key, data=data,
+            expires_at=timezone.now() + timedelta(seconds=ttl) if ttl else None,
+        ))
+    with transaction.atomic():
+        if rows:
+            BotState.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['kind', 'key'],
+                update_fields=['data', 'expires_at', 'updated_at'],
+            )
+        for kind, key in deletes:
+            BotState.objects.filter(kind=kind, key=key).delete()
+
+
+@db_task(write=True)
+def purge_expired_states() -> int:
+    deleted, _ = BotState.objects.filter(expires_at__lt=timezone.now()).delete()
+    return deleted
+
+
+# ─── History / log rows (event sink) ────────────────────────
+
+@db_task(write=True)
+def write_events(inserts: list, updates: Dict[Tuple[type, Tuple[str, ...]], list]) -> None:
+    """Bitta tranzaksiya: model bo'yicha bulk_create, keyin bulk_update"""
+    by_model = defaultdict(list)
+    for obj in inserts:
+        by_model[type(obj)].append(obj)
+    with transaction.atomic():
+        for model, objs in by_model.items():
+            model.objects.bulk_create(objs)
+        for (model, fields), objs in updates.items():
+            model.objects.bulk_update(objs, list(fields))
+
+
+@db_task(write=True)
+def write_events_one_by_one(inserts: list, updates: Dict[Tuple[type, Tuple[str, ...]], list]) -> int:
+    """Batch xato bersa: buzuq yozuvni tashlab, qolganlarini saqlaydi. Tashlanganlar sonini qaytaradi."""
+    dropped = 0
+    for obj in inserts:
+        try:
+            with transaction.atomic():
+                obj.save(force_insert=True)
+        except (IntegrityError, ValueError) as e:
+            dropped += 1
+            logger.warning("%s yozilmadi: %s", type(obj).__name__, e)
+    for (model, fields), objs in updates.items():
+        for obj in objs:
+            if obj.pk is None:
+                continue
+            try:
+                with transaction.atomic():
+                    obj.save(update_fields=list(fields))
+            except (IntegrityError, ValueError) as e:
+                dropped += 1
+                logger.warning("%s yangilanmadi: %s", model.__name__, e)
+    return dropped
+
@@ -1,11 +1,16 @@
 """Base downloader interface"""
+import os
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Sequence
+
+from .strategy import Strategy, download_with_strategies
 
 
 class BaseDownloader(ABC):
     """Base class for all platform downloaders"""
 
+    platform = 'other'
+
     @abstractmethod
     def detect(self, url: str) -> bool:
         """Check if URL belongs to this platform"""
@@ -30,3 +35,8 @@ class BaseDownloader(ABC):
     def get_available_qualities(self, url: str) -> List[Dict]:
         """Get available quality options"""
         pass
+
+    def _download(self, url: str, output_path: str, strategies: Sequence[Strategy]) -> Optional[str]:
+        """Try strategies in learned order; output_path extension is replaced by yt-dlp"""
+        output_base = os.path.splitext(output_path)[0]
+        return download_with_strategies(self.platform, url, output_base, strategies)
@@ -31,15 +31,4 @@ class DownloaderFactory:
     def detect_platform(cls, url: str) -> Optional[str]:
         """Detect platform name from URL"""
         downloader = cls.get_downloader(url)
-        if downloader:
-            if isinstance(downloader, YouTubeService):
-                return 'youtube'
-            elif isinstance(downloader, InstagramService):
-                return 'instagram'
-            elif isinstance(downloader, TikTokService):
-                return 'tiktok'
-            elif isinstance(downloader, SnapchatService):
-                return 'snapchat'
-            elif isinstance(downloader, LikeeService):
-                return 'likee'
-        return 'other'
+        return downloader.platform if downloader else 'other'
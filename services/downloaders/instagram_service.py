@@ -1,14 +1,16 @@
 """Instagram downloader service"""
-import os
 import yt_dlp
 from typing import Optional, Dict, List
 from .base import BaseDownloader
+from .strategy import AUDIO_STRATEGIES, video_strategies
 from .ytdl_utils import get_ydl_base_opts
 
 
 class InstagramService(BaseDownloader):
     """Instagram platform downloader"""
 
+    platform = 'instagram'
+
     def detect(self, url: str) -> bool:
         import re
         pattern = re.compile(
@@ -40,45 +42,7 @@ class InstagramService(BaseDownloader):
         ]
 
     def download_video(self, url: str, output_path: str, quality: Optional[str] = None) -> Optional[str]:
-        video_id = str(abs(hash(url)))[-10:]
-        ydl_opts = {
-            **get_ydl_base_opts(),
-            'format': 'best[ext=mp4]/best',
-            'outtmpl': output_path.replace('.mp4', '.%(ext)s'),
-        }
-
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-            for ext in ['mp4', 'webm', 'mkv']:
-                alt_path = output_path.replace('.mp4', f'.{ext}')
-                if os.path.exists(alt_path):
-                    return alt_path
-            return None
-        except Exception:
-            return None
+        return self._download(url, output_path, video_strategies(quality))
 
     def download_audio(self, url: str, output_path: str) -> Optional[str]:
-        ydl_opts = {
-            **get_ydl_base_opts(),
-            'format': 'bestaudio/best',
-            'outtmpl': output_path.replace('.mp3', '.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
-
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-            for ext in ['mp3', 'm4a', 'ogg']:
-                alt_path = output_path.replace('.mp3', f'.{ext}')
-                if os.path.exists(alt_path):
-                    return alt_path
-            return None
-        except Exception:
-            return None
+        return self._download(url, output_path, AUDIO_STRATEGIES)
@@ -0,0 +1,233 @@
+"""Learned download-strategy ordering.
+
+Har bir yt-dlp urinish (platform, strategy, outcome, latency, bytes) sifatida
+yoziladi. Keyingi yuklashlarda strategiyalar kutilgan "muvaffaqiyatgacha vaqt"
+bo'yicha tartiblanadi: o'rtacha urinish vaqti / muvaffaqiyat ehtimoli.
+Vaqti-vaqti bilan (EXPLORATION_RATE) boshqa strategiya birinchi sinab ko'riladi,
+shunda extractor o'zgarsa eng tez yo'l avtomatik qayta topiladi.
+
+Tartib faqat bir xil sifatdagi (tier) strategiyalar ichida o'zgaradi: sifatni
+pasaytiradigan zaxira yo'llar (mp3 siz audio, eng kichik audio) tez bo'lsa ham
+doim oxirida qoladi. Faqat format farq qiladigan zaxiralar alohida urinish
+emas — bitta yt-dlp chaqiruvidagi "a/b/c" format zanjiri (video).
+
+Statistika to_state()/restore() orqali saqlanadi (bot.strategy_store), restart'dan
+keyin o'rganilgan tartib yo'qolmaydi.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import yt_dlp
+
+from .ytdl_utils import get_ydl_base_opts
+
+logger = logging.getLogger(__name__)
+
+EXPLORATION_RATE = float(os.getenv('DOWNLOAD_EXPLORATION_RATE', '0.1'))
+# Hali urinish bo'lmagan strategiya uchun taxminiy urinish vaqti (soniya)
+PRIOR_LATENCY = 15.0
+# Eski natijalar og'irligi har yangi urinishda shu koeffitsientga kamayadi
+DECAY = 0.95
+HISTORY_SIZE = 1000
+
+VIDEO_EXTENSIONS = ('mp4', 'webm', 'mkv')
+AUDIO_EXTENSIONS = ('mp3', 'm4a', 'webm', 'ogg', 'opus', 'wav', 'mp4')
+_ALL_EXTENSIONS = tuple(dict.fromkeys(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS))
+
+
+@dataclass(frozen=True)
+class Strategy:
+    """One way of asking yt-dlp for a file; tier — output quality class, 0 is best"""
+    name: str
+    opts: Dict = field(hash=False)
+    extensions: Tuple[str, ...] = VIDEO_EXTENSIONS
+    tier: int = 0
+
+
+@dataclass(frozen=True)
+class Attempt:
+    platform: str
+    strategy: str
+    ok: bool
+    latency: float
+    size: int
+    at: float
+
+
+class _Stats:
+    __slots__ = ('attempts', 'successes', 'latency')
+
+    def __init__(self):
+        self.attempts = 0.0
+        self.successes = 0.0
+        self.latency = 0.0
+
+
+class StrategyStats:
+    """Thread-safe per-(platform, strategy) outcome statistics"""
+
+    def __init__(self, exploration_rate: float = EXPLORATION_RATE,
+                 prior_latency: float = PRIOR_LATENCY, decay: float = DECAY,
+                 history_size: int = HISTORY_SIZE):
+        self.exploration_rate = exploration_rate
+        self.prior_latency = prior_latency
+        self.decay = decay
+        self.history: Deque[Attempt] = deque(maxlen=history_size)
+        self._stats: Dict[Tuple[str, str], _Stats] = {}
+        self._lock = threading.RLock()
+        # record() da oshadi — saqlovchi o'zgarish bor-yo'qligini shundan biladi
+        self.version = 0
+
+    def record(self, platform: str, strategy: str, ok: bool, latency: float, size: int = 0):
+        attempt = Attempt(platform, strategy, ok, latency, size, time.time())
+        with self._lock:
+            stats = self._stats.setdefault((platform, strategy), _Stats())
+            stats.attempts = stats.attempts * self.decay + 1
+            stats.successes = stats.successes * self.decay + (1 if ok else 0)
+            stats.latency = stats.latency * self.decay + latency
+            self.history.append(attempt)
+            self.version += 1
+        logger.info(
+            "download attempt platform=%s strategy=%s ok=%s latency=%.2fs bytes=%d",
+            platform, strategy, ok, latency, size,
+        )
+
+    def expected_cost(self, platform: str, strategy: str) -> float:
+        """Mean attempt latency divided by success probability (both smoothed)"""
+        with self._lock:
+            stats = self._stats.get((platform, strategy)) or _Stats()
+            probability = (stats.successes + 1) / (stats.attempts + 2)
+            latency = (stats.latency + self.prior_latency) / (stats.attempts + 1)
+        return latency / probability
+
+    def order(self, platform: str, strategies: Sequence[Strategy]) -> List[Strategy]:
+        # sorted() is stable, so with no data the hand-written order is kept.
+        # Cost only reorders strategies of the same tier; worse quality stays last.
+        ranked = sorted(strategies, key=lambda s: (s.tier, self.expected_cost(platform, s.name)))
+        peers = sum(1 for s in ranked if s.tier == ranked[0].tier) if ranked else 0
+        if peers > 1 and random.random() < self.exploration_rate:
+            ranked.insert(0, ranked.pop(random.randrange(1, peers)))
+        return ranked
+
+    def snapshot(self) -> List[Dict]:
+        rows = []
+        with self._lock:
+            for (platform, strategy), stats in self._stats.items():
+                rows.append({
+                    'platform': platform,
+                    'strategy': strategy,
+                    'attempts': round(stats.attempts, 2),
+                    'success_rate': round(stats.successes / stats.attempts, 3) if stats.attempts else None,
+                    'expected_cost': round(self.expected_cost(platform, strategy), 2),
+                })
+        return sorted(rows, key=lambda r: (r['platform'], r['expected_cost']))
+
+    def to_state(self) -> List[List]:
+        """[platform, strategy, attempts, successes, latency] qatorlari (json uchun)"""
+        with self._lock:
+            return [
+                [platform, strategy, stats.attempts, stats.successes, stats.latency]
+                for (platform, strategy), stats in self._stats.items()
+            ]
+
+    def restore(self, states: Sequence[List[List]]):
+        """Saqlangan holat(lar)ni yuklaydi; bir nechta worker'niki o'rtachalanadi"""
+        merged: Dict[Tuple[str, str], _Stats] = {}
+        for state in states:
+            for platform, strategy, attempts, successes, latency in state:
+                stats = merged.setdefault((platform, strategy), _Stats())
+                stats.attempts += attempts / len(states)
+                stats.successes += successes / len(states)
+                stats.latency += latency / len(states)
+        with self._lock:
+            # Yuklash paytida yozilgan urinishlar ustun turadi
+            merged.update(self._stats)
+            self._stats = merged
+
+
+strategy_stats = StrategyStats()
+
+
+def video_strategies(quality: Optional[str] = None) -> List[Strategy]:
+    """
+    Bitta urinish: progressive mp4, keyin istalgan progressive, keyin istalgan.
+    Zaxiralar faqat formatda farq qiladi — yt-dlp ularni bitta extraction ichida tanlaydi.
+    """
+    if quality and quality != 'audio':
+        selector = f'[height<={quality}]'
+        video_format = f'best{selector}[ext=mp4]/best{selector}/best'
+    else:
+        video_format = 'best[ext=mp4]/best'
+    return [Strategy('video', {'format': video_format, 'merge_output_format': 'mp4'})]
+
+
+AUDIO_STRATEGIES = [
+    # 1-usul: ffmpeg bilan mp3 ga convert
+    Strategy('mp3_ffmpeg', {
+        'format': 'bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }],
+    }, AUDIO_EXTENSIONS),
+    # 2-usul: ffmpeg'siz — raw audio formatda (mp3 emas)
+    Strategy('raw_bestaudio', {'format': 'bestaudio/best'}, AUDIO_EXTENSIONS, tier=1),
+    # 3-usul: eng kichik fayl (eng past sifat)
+    Strategy('worstaudio', {'format': 'worstaudio/worst'}, AUDIO_EXTENSIONS, tier=2),
+]
+
+
+def _cleanup(output_base: str):
+    for ext in _ALL_EXTENSIONS:
+        for path in (f'{output_base}.{ext}', f'{output_base}.{ext}.part'):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _find_output(output_base: str, extensions: Sequence[str]) -> Optional[str]:
+    for ext in extensions:
+        path = f'{output_base}.{ext}'
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
+    return None
+
+
+def download_with_strategies(platform: str, url: str, output_base: str,
+                             strategies: Sequence[Strategy]) -> Optional[str]:
+    """
+    Strategiyalarni o'rganilgan tartibda sinaydi, birinchi chiqqan fayl yo'lini qaytaradi.
+    output_base - kengaytmasiz fayl yo'li (yt-dlp o'zi kengaytma qo'yadi).
+    """
+    for strategy in strategy_stats.order(platform, strategies):
+        _cleanup(output_base)
+        ydl_opts = {
+            **get_ydl_base_opts(),
+            **strategy.opts,
+            'outtmpl': f'{output_base}.%(ext)s',
+        }
+        started = time.monotonic()
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+        except Exception as e:
+            logger.warning("%s strategy %s failed for %s: %s", platform, strategy.name, url, e)
+        # Postprocessor xato bersa ham yuklangan fayl ishlatilishi mumkin
+        path = _find_output(output_base, strategy.extensions)
+
+        size = os.path.getsize(path) if path else 0
+        strategy_stats.record(platform, strategy.name, bool(path), time.monotonic() - started, size)
+        if path:
+            return path
+
+    logger.error("Hech qanday strategiya ishlamadi: platform=%s url=%s", platform, url)
+    return None
@@ -1,8 +1,8 @@
 """YouTube downloader service"""
-import os
 import yt_dlp
 from typing import Optional, Dict, List
 from .base import BaseDownloader
+from .strategy import AUDIO_STRATEGIES, video_strategies
 from .ytdl_utils import get_ydl_base_opts
 
 VIDEO_QUALITIES = ['144', '240', '360', '480', '720', '1080']
@@ -11,6 +11,8 @@ VIDEO_QUALITIES = ['144', '240', '360', '480', '720', '1080']
 class YouTubeService(BaseDownloader):
     """YouTube platform downloader"""
 
+    platform = 'youtube'
+
     def detect(self, url: str) -> bool:
         import re
         pattern = re.compile(
@@ -39,7 +41,10 @@ class YouTubeService(BaseDownloader):
         info = self.get_info(url)
         if not info:
             return []
+        return self.qualities_from_info(info)
 
+    def qualities_from_info(self, info: Dict) -> List[Dict]:
+        """get_info() natijasidagi formatlardan — qayta extraction'siz"""
         formats = info.get('formats', [])
         available = []
         seen = set()
@@ -75,57 +80,7 @@ class YouTubeService(BaseDownloader):
         return available
 
     def download_video(self, url: str, output_path: str, quality: Optional[str] = None) -> Optional[str]:
-        video_id = url.split('v=')[-1].split('&')[0] if 'v=' in url else 'video'
-        base = get_ydl_base_opts()
-        if quality and quality != 'audio':
-            ydl_opts = {
-                **base,
-                'format': f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best',
-                'outtmpl': output_path.replace('.mp4', '.%(ext)s'),
-                'merge_output_format': 'mp4',
-            }
-        else:
-            ydl_opts = {
-                **base,
-                'format': 'best[ext=mp4]/best',
-                'outtmpl': output_path.replace('.mp4', '.%(ext)s'),
-                'merge_output_format': 'mp4',
-            }
-
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-            # Check if file exists with different extensions
-            for ext in ['mp4', 'webm', 'mkv']:
-                alt_path = output_path.replace('.mp4', f'.{ext}')
-                if os.path.exists(alt_path):
-                    return alt_path
-            return None
-        except Exception:
-            return None
+        return self._download(url, output_path, video_strategies(quality))
 
     def download_audio(self, url: str, output_path: str) -> Optional[str]:
-        ydl_opts = {
-            **get_ydl_base_opts(),
-            'format': 'bestaudio/best',
-            'outtmpl': output_path.replace('.mp3', '.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
-
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-            # Check if file exists with different extensions
-            for ext in ['mp3', 'm4a', 'ogg']:
-                alt_path = output_path.replace('.mp3', f'.{ext}')
-                if os.path.exists(alt_path):
-                    return alt_path
-            return None
-        except Exception:
-            return None
+        return self._download(url, output_path, AUDIO_STRATEGIES)
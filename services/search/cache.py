@@ -0,0 +1,228 @@
+"""Search result cache.
+
+Kalit — normallashtirilgan so'rov: kichik harf (casefold), bo'sh joylar
+bittaga, tinish belgilari va apostroflar olib tashlangan, kirill yozuvi
+lotinga o'girilgan ("Шаҳзода" va "shahzoda" bitta kalit).
+
+- Xotira: LRU, SEARCH_CACHE_SIZE ta yozuv, natijalar zlib+json blob.
+- Disk: alohida SQLite fayl (SEARCH_CACHE_PATH) — restart'dan keyin ham
+  issiq, asosiy bazaga yozuv yuki tushmaydi.
+- SEARCH_CACHE_TTL gacha yangi; SEARCH_CACHE_STALE gacha eskirgan yozuv
+  darhol qaytariladi va fonda yangilanadi (stale-while-revalidate).
+- Bir xil so'rov bir vaqtda kelsa, qidiruv bir marta bajariladi.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+CACHE_ENABLED = os.getenv("SEARCH_CACHE", "True").lower() in ("true", "1", "yes")
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", str(BASE_DIR / "search_cache.sqlite3"))
+CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+CACHE_STALE = int(os.getenv("SEARCH_CACHE_STALE", str(7 * 24 * 3600)))
+# Hech narsa topilmagan yoki timeout tufayli to'liq bo'lmagan natija qisqaroq saqlanadi
+EMPTY_TTL = int(os.getenv("SEARCH_CACHE_EMPTY_TTL", "600"))
+PURGE_INTERVAL = 3600
+
+# Kirill (o'zbek + rus) -> o'zbek lotin yozuvi
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+}
+# str.translate har belgi uchun dict'ga qaraydi; regex faqat kirill harflarida to'xtaydi
+_CYRILLIC_CHARS = re.compile("[" + "".join(_CYRILLIC) + "]")
+_APOSTROPHES = re.compile("['`\u00b4\u02bb\u02bc\u2018\u2019]")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+# normalize_many: tinish belgilari va bo'sh joylar bitta o'tishda (qatorlar saqlanadi)
+_SEPARATORS = re.compile(r"[^\w\n]+")
+
+
+def _transliterate(text: str) -> str:
+    return _CYRILLIC_CHARS.sub(lambda match: _CYRILLIC[match.group()], text)
+
+
+def normalize_query(query: str) -> str:
+    text = _transliterate(unicodedata.normalize("NFKC", query or "").casefold())
+    # o‘, g', oʻ -> o, g (apostrof turlari har xil yoziladi, kirillda umuman yo'q)
+    text = _APOSTROPHES.sub("", text)
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def normalize_many(texts) -> list:
+    """normalize_query ro'yxat uchun: regex'lar bitta ulangan satrda bir marta ishlaydi"""
+    joined = "\n".join(text.replace("\n", " ") for text in texts)
+    text = _transliterate(unicodedata.normalize("NFKC", joined).casefold())
+    text = _SEPARATORS.sub(" ", _APOSTROPHES.sub("", text))
+    return [line.strip() for line in text.split("\n")]
+
+
+def encode(data) -> bytes:
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def decode(blob: bytes):
+    return json.loads(zlib.decompress(blob))
+
+
+class SearchCache:
+    def __init__(self, path: str = CACHE_PATH, max_size: int = CACHE_SIZE,
+                 ttl: int = CACHE_TTL, stale: int = CACHE_STALE):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale = stale
+        # key -> (blob, saqlangan vaqt, ttl)
+        self._entries: "OrderedDict[str, Tuple[bytes, float, int]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+        # Miss (haqiqiy qidiruv) o'rtacha vaqti — hit qancha vaqt tejaganini baholash uchun
+        self._fetch_avg = 0.0
+        self.hits = 0
+        self.misses = 0
+        metrics.gauge("search_cache.size", lambda: len(self._entries))
+        metrics.gauge("search_cache.hit_ratio", self.hit_ratio)
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return round(self.hits / total, 3) if total else 0.0
+
+    # SQLite (thread'da chaqiriladi)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, stored_at REAL NOT NULL, ttl INTEGER NOT NULL)"
+            )
+            self._db = db
+        return self._db
+
+    def _db_get(self, key: str) -> Optional[Tuple[bytes, float, int]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT data, stored_at, ttl FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (bytes(row[0]), row[1], row[2]) if row else None
+
+    def _db_put(self, key: str, entry: Tuple[bytes, float, int]):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, data, stored_at, ttl) VALUES (?, ?, ?, ?)",
+                (key, *entry),
+            )
+            if time.time() - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = time.time()
+                db.execute("DELETE FROM search_cache WHERE stored_at < ?", (time.time() - self.stale,))
+
+    # Memory
+
+    def _remember(self, key: str, entry: Tuple[bytes, float, int]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, key: str) -> Optional[Tuple[bytes, float, int]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        try:
+            entry = await asyncio.to_thread(self._db_get, key)
+        except sqlite3.Error as e:
+            logger.warning("Search cache o'qishda xatolik: %s", e)
+            return None
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    async def _fetch(self, key: str, query: str, fetch: Callable[[str], Awaitable], to_data, is_empty):
+        started = time.perf_counter()
+        result = await fetch(query)
+        elapsed = time.perf_counter() - started
+        self._fetch_avg = elapsed if not self._fetch_avg else self._fetch_avg * 0.9 + elapsed * 0.1
+        entry = (encode(to_data(result)), time.time(), EMPTY_TTL if is_empty(result) else self.ttl)
+        self._remember(key, entry)
+        try:
+            await asyncio.to_thread(self._db_put, key, entry)
+        except sqlite3.Error as e:
+            logger.warning("Search cache yozishda xatolik: %s", e)
+        return result
+
+    def _single_flight(self, key: str, coro) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(coro, name=f"search_cache:{key[:30]}")
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            coro.close()
+        return task
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[str], Awaitable], to_data, from_data, is_empty):
+        """
+        Keshdan qaytaradi yoki fetch(query) ni chaqiradi.
+        to_data/from_data — natijani json'ga va qaytarish; is_empty — bo'sh yoki
+        to'liq bo'lmagan natija (EMPTY_TTL bilan saqlanadi).
+        """
+        key = normalize_query(query)
+        if not CACHE_ENABLED or not key:
+            return await fetch(query)
+
+        entry = await self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            blob, stored_at, ttl = entry
+            age = now - stored_at
+            # Qisqa muddatli (bo'sh/to'liq bo'lmagan) natija eskirgan holda berilmaydi
+            if age < ttl or (ttl == self.ttl and age < self.stale):
+                self.hits += 1
+                metrics.incr("search_cache.hits")
+                metrics.incr("search_cache.saved_seconds", self._fetch_avg)
+                if age >= ttl:
+                    metrics.incr("search_cache.stale_hits")
+                    task = self._single_flight(key, self._fetch(key, query, fetch, to_data, is_empty))
+                    task.add_done_callback(_log_refresh_error)
+                return from_data(decode(blob))
+
+        self.misses += 1
+        metrics.incr("search_cache.misses")
+        return await asyncio.shield(self._single_flight(key, self._fetch(key, query, fetch, to_data, is_empty)))
+
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.warning("Search cache fon yangilash xatolik: %s", task.exception())
+
+
+search_cache = SearchCache()
@@ -2,49 +2,308 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 
-from .youtube_music import search_youtube_music
+from core.metrics import metrics
+
+from .cache import search_cache
+from .local_index import INDEX_ENABLED, is_confident, music_index
+from .ranking import rank_results
+from .youtube_music import search_youtube_music, search_youtube_page
 from .spotify import search_spotify_tracks
+from .spotify_map import spotify_map
 from .lyrics import search_lyrics_fallback
 
 logger = logging.getLogger(__name__)
 
+# Umumiy byudjet: shu vaqtda nima kelgan bo'lsa, o'sha qaytariladi
+SEARCH_BUDGET = float(os.getenv("SEARCH_BUDGET", "12"))
+YOUTUBE_TIMEOUT = float(os.getenv("SEARCH_YOUTUBE_TIMEOUT", "10"))
+SPOTIFY_TIMEOUT = float(os.getenv("SEARCH_SPOTIFY_TIMEOUT", "4"))
+LYRICS_TIMEOUT = float(os.getenv("SEARCH_LYRICS_TIMEOUT", "8"))
+# YouTube/Spotify shu vaqtgacha natija bermasa lyrics ham parallel boshlanadi
+LYRICS_HEDGE = float(os.getenv("SEARCH_LYRICS_HEDGE", "1.5"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "16"))
+# Mahalliy indeks odatda bir necha ms; disk band bo'lsa ham qidiruvni ushlab turmasin
+LOCAL_TIMEOUT = float(os.getenv("SEARCH_LOCAL_TIMEOUT", "0.5"))
+# Spotify trekni YouTube'dan topish (jadvalda bo'lmasa bitta YouTube qidiruvi)
+RESOLVE_TIMEOUT = float(os.getenv("SEARCH_RESOLVE_TIMEOUT", "15"))
+
+# Birinchi sahifa shuncha natija bilan tez qaytadi; qolgani fetch_more bilan, MAX_RESULTS gacha
+PAGE_SIZE = 10
+MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "50"))
+
+# yt-dlp/requests sync — alohida cheklangan pool (default executor'ni band qilmaydi)
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="search")
+
 
 @dataclass
 class MultiSearchResult:
     youtube: List[Dict] = field(default_factory=list)
     spotify: List[Dict] = field(default_factory=list)
     lyrics: List[Dict] = field(default_factory=list)
+    # Biror manba timeout/xato bo'ldi yoki byudjet tugadi
+    partial: bool = False
+    # Keyingi YouTube sahifasi uchun (fetch_more); None — boshqa natija yo'q
+    cursor: Optional[int] = None
 
 
-def multi_search_text(query: str) -> MultiSearchResult:
+async def _run_source(name: str, deadline: float, func, *args, **kwargs) -> Optional[List[Dict]]:
+    """
+    Sync manbani search_executor'da, async manbani (Spotify) loop'da bajaradi.
+    Deadline o'tsa yoki task bekor qilinsa natija kutilmaydi (thread o'z
+    timeout'i bilan tugaydi). Timeout/xatoda None.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    if asyncio.iscoroutinefunction(func):
+        work = func(*args, **kwargs)
+    else:
+        work = loop.run_in_executor(search_executor, functools.partial(func, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(work, timeout=deadline) or []
+    except asyncio.TimeoutError:
+        metrics.incr(f"search.{name}.timeouts")
+        logger.warning("%s search timeout (%.1fs)", name, deadline)
+        return None
+    except Exception as e:
+        metrics.incr(f"search.{name}.errors")
+        logger.error("%s search error: %s", name, e)
+        return None
+    finally:
+        metrics.observe(f"search.{name}.seconds", time.perf_counter() - started)
+
+
+def _found(task: Optional[asyncio.Task]) -> List[Dict]:
+    if task is None or not task.done() or task.cancelled():
+        return []
+    return task.result() or []
+
+
+def _failed(task: Optional[asyncio.Task]) -> bool:
+    """Manba ishga tushgan, lekin natija bermadi (timeout, xato, bekor qilindi)"""
+    return task is not None and (not task.done() or task.cancelled() or task.result() is None)
+
+
+async def multi_search(
+    query: str, budget: float = SEARCH_BUDGET, on_partial: Optional[Callable[[MultiSearchResult], None]] = None,
+) -> MultiSearchResult:
     """
     Flow:
-    1) YouTube Music search
-    2) Spotify (optional)
-    3) Lyrics fallback (only if 1+2 empty)
+    0) Mahalliy FTS indeks — ishonchli moslik bo'lsa, tashqi so'rovsiz qaytadi
+    Qolgani parallel:
+    1) YouTube Music va Spotify bir vaqtda, har biri o'z deadline'i bilan
+    2) Lyrics fallback: ikkalasi bo'sh qaytsa yoki LYRICS_HEDGE ichida
+       natija bo'lmasa — kutmasdan boshlanadi
+    3) Byudjet tugasa, kelgan natijalar qaytariladi, qolganlari bekor qilinadi
+    4) ranking.rank_results: saralash, takrorlarni qisqartirish, Spotify -> YouTube
+
+    on_partial(result) — boshqa manbalar hali kutilayotganda, har manba natija
+    bergani zahoti shu paytgacha kelganlar bilan chaqiriladi (sync, tez bo'lishi kerak).
     """
-    yt: List[Dict] = []
-    sp: List[Dict] = []
-    ly: List[Dict] = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + budget
+
+    if INDEX_ENABLED:
+        local = await _run_source("local", LOCAL_TIMEOUT, music_index.search, query, limit=10)
+        if local and is_confident(query, local):
+            metrics.incr("search.local_answers")
+            metrics.observe("search.total_seconds", loop.time() - started)
+            ranked, _ = rank_results(query, [_public(track) for track in local])
+            # Keyingi sahifalar YouTube'dan boshidan (takrorlar id bo'yicha tashlanadi)
+            return MultiSearchResult(youtube=ranked, cursor=0)
+
+    youtube = asyncio.create_task(
+        _run_source("youtube", YOUTUBE_TIMEOUT, search_youtube_music, query, limit=PAGE_SIZE)
+    )
+    spotify = asyncio.create_task(
+        _run_source("spotify", SPOTIFY_TIMEOUT, search_spotify_tracks, query, limit=5, timeout=SPOTIFY_TIMEOUT)
+    )
+    lyrics: Optional[asyncio.Task] = None
+    hedge_at = started + min(LYRICS_HEDGE, budget)
+    reported = set()
+
+    def start_lyrics():
+        return asyncio.create_task(_run_source("lyrics", LYRICS_TIMEOUT, search_lyrics_fallback, query, limit=10))
 
     try:
-        yt = search_youtube_music(query, limit=10)
-    except Exception as e:
-        logger.error("YouTube search error: %s", e)
+        while True:
+            if youtube.done() and spotify.done():
+                if _found(youtube) or _found(spotify):
+                    break
+                if lyrics is None:
+                    lyrics = start_lyrics()
+                if lyrics.done():
+                    break
+            elif lyrics is None and loop.time() >= hedge_at and not (_found(youtube) or _found(spotify)):
+                lyrics = start_lyrics()
+            pending = {t for t in (youtube, spotify, lyrics) if t is not None and not t.done()}
+            remaining = deadline - loop.time()
+            if not pending or remaining <= 0:
+                break
+            if on_partial is not None:
+                fresh = {t for t in (youtube, spotify, lyrics) if _found(t)} - reported
+                if fresh:
+                    reported |= fresh
+                    _report_partial(on_partial, query, _found(youtube), _found(spotify), _found(lyrics))
+            if lyrics is None and loop.time() < hedge_at:
+                remaining = min(remaining, hedge_at - loop.time())
+            await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        partial = _failed(youtube) or _failed(spotify) or (_failed(lyrics) and not (_found(youtube) or _found(spotify)))
+    finally:
+        for task in (youtube, spotify, lyrics):
+            if task is not None and not task.done():
+                task.cancel()
+
+    yt = _found(youtube)
+    sp = _found(spotify)
+    cursor = PAGE_SIZE if len(yt) >= PAGE_SIZE else None
+    lyr = [] if yt or sp else _found(lyrics)
+    if sp:
+        # Oldin YouTube'ga bog'langan Spotify treklar darhol yuklab olinadigan qator bo'ladi
+        mapped = await _run_source("spotify_map", LOCAL_TIMEOUT, spotify_map.lookup, sp) or {}
+        known = {item["id"] for item in yt}
+        yt = yt + [row for row in mapped.values() if row["id"] not in known]
+        sp = [track for track in sp if track.get("id") not in mapped]
+    if INDEX_ENABLED and (yt or lyr):
+        _index_in_background(music_index.add_tracks, yt + lyr)
+    # Takrorlar qisqaradi, Spotify mos YouTube qatoriga biriktiriladi
+    yt, sp = rank_results(query, yt, sp)
+    lyr, _ = rank_results(query, lyr)
+    result = MultiSearchResult(youtube=yt, spotify=sp, lyrics=lyr, partial=partial, cursor=cursor)
+    metrics.observe("search.total_seconds", loop.time() - started)
+    return result
+
+
+async def fetch_more(query: str, cursor: int) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Keyingi sahifa (cursor — MultiSearchResult.cursor yoki oldingi chaqiruvdan).
+    (natijalar, keyingi cursor); oxiriga yetsa yoki MAX_RESULTS dan oshsa cursor None.
+    """
+    count = min(PAGE_SIZE, MAX_RESULTS - cursor)
+    if count <= 0:
+        return [], None
+    rows = await _run_source("youtube_page", YOUTUBE_TIMEOUT, search_youtube_page, query, cursor, count)
+    if rows is None:
+        # Timeout/xato: cursor o'zgarmaydi, keyingi urinishda qaytadan
+        return [], cursor
+    if INDEX_ENABLED and rows:
+        _index_in_background(music_index.add_tracks, rows)
+    ranked, _ = rank_results(query, rows)
+    next_cursor = cursor + count if len(rows) >= count and cursor + count < MAX_RESULTS else None
+    return ranked, next_cursor
 
+
+def _report_partial(on_partial, query: str, yt: List[Dict], sp: List[Dict], lyr: List[Dict]):
+    """Oraliq natija: faqat saralash (indeksga yozish va spotify_map yakuniy natijada)"""
+    yt, sp = rank_results(query, yt, sp)
+    lyr = [] if yt or sp else rank_results(query, lyr)[0]
     try:
-        sp = search_spotify_tracks(query, limit=5)
+        on_partial(MultiSearchResult(youtube=yt, spotify=sp, lyrics=lyr, partial=True))
     except Exception as e:
-        logger.error("Spotify search error: %s", e)
+        logger.warning("on_partial xatolik: %s", e)
+
+
+def _public(track: Dict) -> Dict:
+    return {key: value for key, value in track.items() if key not in ("norm", "file_id", "hits", "exact")}
+
+
+def _index_in_background(func, *args, **kwargs):
+    """Indeksga yozish javobni kutdirmaydi"""
+    future = asyncio.get_running_loop().run_in_executor(search_executor, functools.partial(func, *args, **kwargs))
+    future.add_done_callback(_log_index_error)
 
-    if not yt and not sp:
-        try:
-            ly = search_lyrics_fallback(query, limit=10)
-        except Exception as e:
-            logger.error("Lyrics search error: %s", e)
 
-    return MultiSearchResult(youtube=yt, spotify=sp, lyrics=ly)
+def _log_index_error(future):
+    if not future.cancelled() and future.exception():
+        logger.warning("Music index yozishda xatolik: %s", future.exception())
+
+
+def remember_download(url: str, title: str, artist: str = "", duration: int = 0, file_id: str = ""):
+    """
+    YouTube'dan muvaffaqiyatli yuklab olingan trek: indeksga qo'shiladi (hits + 1).
+    file_id — yuborilgan audio; inline rejim uni qayta yuklamasdan yuboradi.
+    """
+    if INDEX_ENABLED:
+        _index_in_background(
+            music_index.add_tracks,
+            [{"title": title, "artist": artist, "duration": duration, "url": url, "file_id": file_id}],
+            hits=1,
+        )
+
+
+def remember_recognized(title: str, artist: str):
+    """Shazam tanigan qo'shiq indeksda bo'lsa, uning reytingi oshadi"""
+    if INDEX_ENABLED and title:
+        _index_in_background(music_index.bump, title, artist)
+
+
+async def local_tracks(query: str, limit: int = 20) -> Tuple[List[Dict], bool]:
+    """
+    Inline rejim: faqat mahalliy indeks (file_id bilan). Bo'sh so'rov — eng
+    ko'p yuklab olinganlar. (treklar, ishonchli) — ishonchsiz bo'lsa tashqi qidiruv kerak.
+    """
+    if not INDEX_ENABLED:
+        return [], False
+    query = (query or "").strip()
+    if not query:
+        return await _run_source("inline_popular", LOCAL_TIMEOUT, music_index.popular, limit) or [], True
+    tracks = await _run_source("inline_local", LOCAL_TIMEOUT, music_index.search, query, limit=limit) or []
+    return tracks, is_confident(query, tracks)
+
+
+async def cached_file_ids(video_ids: List[str]) -> Dict[str, str]:
+    """Tashqi qidiruv natijalari orasida bot avval yuborganlari: YouTube id -> file_id"""
+    if not INDEX_ENABLED or not video_ids:
+        return {}
+    return await _run_source("inline_file_ids", LOCAL_TIMEOUT, music_index.file_ids, video_ids) or {}
+
+
+_resolving: Dict[str, asyncio.Task] = {}
+
+
+async def resolve_spotify(track: Dict) -> Optional[Dict]:
+    """
+    Spotify trek -> yuklab olinadigan YouTube qatori (spotify_map: doimiy jadval
+    yoki bitta YouTube qidiruvi). Bir trek bir vaqtda bir marta qidiriladi.
+    """
+    key = track.get("id") or ""
+    if not key:
+        return None
+    task = _resolving.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_source("resolve", RESOLVE_TIMEOUT, spotify_map.resolve, track))
+        _resolving[key] = task
+        task.add_done_callback(lambda _: _resolving.pop(key, None))
+    return await asyncio.shield(task) or None
+
+
+def _to_data(result: MultiSearchResult) -> Dict:
+    return {"y": result.youtube, "s": result.spotify, "l": result.lyrics, "c": result.cursor}
+
+
+def _from_data(data: Dict) -> MultiSearchResult:
+    return MultiSearchResult(youtube=data["y"], spotify=data["s"], lyrics=data["l"], cursor=data.get("c"))
+
+
+def _short_lived(result: MultiSearchResult) -> bool:
+    return result.partial or not (result.youtube or result.spotify or result.lyrics)
+
+
+async def cached_search(
+    query: str, on_partial: Optional[Callable[[MultiSearchResult], None]] = None,
+) -> MultiSearchResult:
+    """
+    multi_search + normallashtirilgan so'rov keshi (services/search/cache.py).
+    on_partial faqat keshda yo'q so'rovni shu chaqiruv boshlaganda ishlaydi.
+    """
+    fetch = functools.partial(multi_search, on_partial=on_partial) if on_partial else multi_search
+    return await search_cache.get_or_fetch(query, fetch, _to_data, _from_data, _short_lived)
@@ -0,0 +1,261 @@
+"""Local music index (SQLite FTS5).
+
+Bot ko'rgan va YouTube id'si ma'lum bo'lgan treklar (yuklab olinganlar,
+qidiruv natijalari) alohida SQLite faylda (MUSIC_INDEX_PATH) saqlanadi:
+
+- tracks: id (YouTube), title, artist, duration, url, hits (necha marta
+  yuklab olingan/tanilgan), file_id (bot yuborgan audio — inline rejimda
+  qayta yuklamasdan yuboriladi)
+- tracks_fts: so'z va prefiks qidiruvi (unicode61, prefix 2/3)
+- tracks_tri: trigram — so'z ichidagi bo'lak va xato yozilgan so'rovlar uchun
+
+Matn search_cache.normalize_query bilan normallashtiriladi, shuning uchun
+kirillcha so'rov lotincha nomni ham topadi. multi_search avval shu indeksga
+qaraydi; aniq moslik bo'lsa tashqi so'rov umuman bo'lmaydi.
+
+Eski tarixdan to'ldirish: python manage.py build_music_index
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+INDEX_ENABLED = os.getenv("MUSIC_INDEX", "True").lower() in ("true", "1", "yes")
+INDEX_PATH = os.getenv("MUSIC_INDEX_PATH", str(BASE_DIR / "music_index.sqlite3"))
+# Shuncha so'z mosligi bo'lsa (yoki eng yaxshisi so'rovga to'liq mos kelsa) tashqi qidiruv kerak emas
+LOCAL_MIN_RESULTS = int(os.getenv("MUSIC_INDEX_MIN_RESULTS", "5"))
+
+_VIDEO_ID = re.compile(r"(?:v=|youtu\.be/|shorts/|embed/)([\w-]{11})")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL DEFAULT '',
+    duration INTEGER NOT NULL DEFAULT 0,
+    url TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    file_id TEXT NOT NULL DEFAULT '',
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    norm, content='tracks', content_rowid='rowid', tokenize='unicode61', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, norm) VALUES (new.rowid, new.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, norm) VALUES ('delete', old.rowid, old.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF norm ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, norm) VALUES ('delete', old.rowid, old.norm);
+    INSERT INTO tracks_fts(rowid, norm) VALUES (new.rowid, new.norm);
+END;
+"""
+
+TRIGRAM_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_tri USING fts5(
+    norm, content='tracks', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_tri_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_tri(rowid, norm) VALUES (new.rowid, new.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_tri_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_tri(tracks_tri, rowid, norm) VALUES ('delete', old.rowid, old.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_tri_au AFTER UPDATE OF norm ON tracks BEGIN
+    INSERT INTO tracks_tri(tracks_tri, rowid, norm) VALUES ('delete', old.rowid, old.norm);
+    INSERT INTO tracks_tri(rowid, norm) VALUES (new.rowid, new.norm);
+END;
+"""
+
+
+def video_id_from_url(url: str) -> Optional[str]:
+    match = _VIDEO_ID.search(url or "")
+    return match.group(1) if match else None
+
+
+def _fts_phrase(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _row_dict(row, exact: bool = True) -> Dict:
+    """exact — so'z/prefiks (FTS) mosligi; False — trigram bo'lak bilan to'ldirilgan"""
+    vid, title, artist, duration, url, norm, file_id, hits = row
+    return {
+        "id": vid, "title": title, "artist": artist, "duration": duration, "url": url,
+        "norm": norm, "file_id": file_id, "hits": hits, "exact": exact,
+    }
+
+
+class MusicIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.trigram = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(tracks)")}
+            if "file_id" not in columns:
+                # file_id ustunidan oldin yaratilgan indeks fayli
+                db.execute("ALTER TABLE tracks ADD COLUMN file_id TEXT NOT NULL DEFAULT ''")
+            try:
+                db.executescript(TRIGRAM_SCHEMA)
+                self.trigram = True
+            except sqlite3.OperationalError as e:
+                # trigram tokenizer SQLite 3.34+ da bor
+                logger.warning("FTS5 trigram mavjud emas, faqat prefiks qidiruvi: %s", e)
+            self._db = db
+        return self._db
+
+    # Writing
+
+    def add_tracks(self, tracks: Iterable[Dict], hits: int = 0):
+        """
+        tracks: {id, title, artist?, duration?, url?, hits?, file_id?}. Mavjud bo'lsa
+        nom yangilanadi, hits qo'shiladi (yuklab olish = 1, qidiruv natijasi = 0),
+        bo'sh bo'lmagan file_id eskisini almashtiradi.
+        """
+        now = time.time()
+        rows = []
+        for track in tracks:
+            vid = track.get("id") or video_id_from_url(track.get("url", ""))
+            title = (track.get("title") or "").strip()
+            if not vid or not title:
+                continue
+            artist = (track.get("artist") or "").strip()
+            rows.append((
+                vid, title, artist, int(track.get("duration") or 0),
+                f"https://www.youtube.com/watch?v={vid}",
+                normalize_query(f"{title} {artist}"), int(track.get("hits", hits)),
+                track.get("file_id") or "", now,
+            ))
+        if not rows:
+            return 0
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            try:
+                db.executemany(
+                    "INSERT INTO tracks (id, title, artist, duration, url, norm, hits, file_id, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET title = excluded.title, "
+                    "artist = CASE WHEN excluded.artist != '' THEN excluded.artist ELSE tracks.artist END, "
+                    "duration = MAX(tracks.duration, excluded.duration), "
+                    "norm = CASE WHEN excluded.artist != '' THEN excluded.norm ELSE tracks.norm END, "
+                    "hits = tracks.hits + excluded.hits, "
+                    "file_id = CASE WHEN excluded.file_id != '' THEN excluded.file_id ELSE tracks.file_id END, "
+                    "updated_at = excluded.updated_at",
+                    rows,
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def bump(self, title: str, artist: str = "", amount: int = 1) -> bool:
+        """Shazam natijasi: indeksdagi aniq mos trekning hits'ini oshiradi"""
+        norm = normalize_query(f"{title} {artist}")
+        if not norm:
+            return False
+        with self._lock:
+            cursor = self._connect().execute("UPDATE tracks SET hits = hits + ? WHERE norm = ?", (amount, norm))
+        return cursor.rowcount > 0
+
+    # Reading
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        norm = normalize_query(query)
+        tokens = norm.split()
+        if not tokens:
+            return []
+        match = " ".join(_fts_phrase(token) + "*" for token in tokens)
+        sql = (
+            "SELECT t.id, t.title, t.artist, t.duration, t.url, t.norm, t.file_id, t.hits FROM {table} f "
+            "JOIN tracks t ON t.rowid = f.rowid WHERE {table} MATCH ? "
+            "ORDER BY bm25({table}) - t.hits * 0.1 LIMIT ?"
+        )
+        with self._lock:
+            db = self._connect()
+            rows = db.execute(sql.format(table="tracks_fts"), (match, limit)).fetchall()
+            extra = []
+            if len(rows) < limit and self.trigram and len(norm) >= 3:
+                seen = {row[0] for row in rows}
+                extra = db.execute(sql.format(table="tracks_tri"), (_fts_phrase(norm), limit)).fetchall()
+                extra = [row for row in extra if row[0] not in seen][:limit - len(rows)]
+        return [_row_dict(row) for row in rows] + [_row_dict(row, exact=False) for row in extra]
+
+    def popular(self, limit: int = 20) -> List[Dict]:
+        """Eng ko'p yuklab olingan, file_id'si bor treklar (bo'sh inline so'rov uchun)"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, title, artist, duration, url, norm, file_id, hits FROM tracks "
+                "WHERE file_id != '' ORDER BY hits DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_row_dict(row) for row in rows]
+
+    def file_ids(self, video_ids: Iterable[str]) -> Dict[str, str]:
+        """YouTube id -> Telegram file_id (faqat yuborilganlari)"""
+        video_ids = list(dict.fromkeys(video_ids))
+        if not video_ids:
+            return {}
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, file_id FROM tracks WHERE file_id != '' AND id IN ({','.join('?' * len(video_ids))})",
+                video_ids,
+            ).fetchall()
+        return dict(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM tracks")
+            db.execute("INSERT INTO tracks_fts(tracks_fts) VALUES ('rebuild')")
+            if self.trigram:
+                db.execute("INSERT INTO tracks_tri(tracks_tri) VALUES ('rebuild')")
+
+
+def is_confident(query: str, results: List[Dict]) -> bool:
+    """
+    Mahalliy natija yetarlimi. Faqat so'z/prefiks mosliklari hisoblanadi
+    (trigram to'ldiruvchilar emas) va ular orasida kamida bittasi yuklab
+    olingan (hits > 0) bo'lishi kerak. Shunda: LOCAL_MIN_RESULTS ta moslik
+    yoki eng yaxshisi so'rovning hamma so'zini o'z ichiga oladi.
+    """
+    query_tokens = set(normalize_query(query).split())
+    # Bitta so'z (masalan, faqat artist nomi yoki "love") — ko'p qo'shiqdan biri,
+    # yangi chiqqanlari indeksda bo'lmasligi mumkin
+    if len(query_tokens) < 2:
+        return False
+    exact = [row for row in results if row.get("exact", True)]
+    if not any(row.get("hits") for row in exact):
+        return False
+    return len(exact) >= LOCAL_MIN_RESULTS or query_tokens <= set(exact[0]["norm"].split())
+
+
+music_index = MusicIndex()
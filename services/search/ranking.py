@@ -0,0 +1,230 @@
+"""Search result ranking and cross-source dedup.
+
+Manbalardan kelgan natijalar bitta ro'yxatga keltiriladi:
+
+- Nom normallashtiriladi (normalize_query) va shovqin so'zlar olib
+  tashlanadi: "Official Video", "lyrics", "audio", "klip", "текст" ...
+- Har matn belgilar trigrammasi vektoriga aylanadi (hashing, RANK_DIM
+  o'lcham). Hamma nomzodlar bitta NumPy matritsada, o'xshashlik — bitta
+  matritsa ko'paytmasi (kosinus); 50 nomzod uchun millisekunddan ancha kam.
+- Tartib: so'rovga o'xshashlik + manbadagi o'rni (kichik vazn bilan).
+- Bir qo'shiqning klip/lyrics/audio nusxalari bittaga qisqaradi; remix,
+  live, cover ... belgilari yoki davomiyligi farq qilsa alohida qoladi.
+- Spotify trek eng mos, versiyasi bir xil YouTube nomzodiga biriktiriladi
+  (artist, spotify_url) — shu qatorni yuklab olish mumkin. Mos kelmaganlari alohida
+  qaytariladi.
+
+NumPy o'rnatilmagan bo'lsa natijalar manba tartibida, o'zgarishsiz qoladi.
+
+Benchmark: python benchmarks/bench_ranking.py
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from core.metrics import metrics
+
+from .cache import normalize_many
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+RANK_DIM = int(os.getenv("SEARCH_RANK_DIM", "256"))
+# Shundan o'xshash nomlar bitta qo'shiq hisoblanadi
+DUP_THRESHOLD = float(os.getenv("SEARCH_RANK_DUP", "0.8"))
+# Spotify trek YouTube nomzodiga shundan kam o'xshash bo'lsa biriktirilmaydi
+MATCH_THRESHOLD = float(os.getenv("SEARCH_RANK_MATCH", "0.5"))
+# Davomiyliklar shuncha soniyadan ko'p farq qilsa — boshqa yozuv
+DURATION_TOLERANCE = 15
+# Manba tartibining vazni (birinchi natija +POSITION_WEIGHT, oxirgisi ~0)
+POSITION_WEIGHT = 0.1
+SPOTIFY_BOOST = 0.1
+
+# Har so'z oldida bo'sh joy bor (clean_titles qatorlarni " " bilan boshlaydi):
+# literal prefiks regex'ni bir necha marta tezlashtiradi
+_NOISE = re.compile(
+    r" (?:official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|mv|clip|klipi?|"
+    r"premiere|premyera|premera|tekst|matn|full|ft|feat)\b"
+)
+# Bitta qo'shiqning boshqa versiyasi — takror emas
+_VERSIONS = {
+    "remix": 1, "remiks": 1, "live": 2, "jonli": 2, "concert": 2, "konsert": 2, "cover": 4,
+    "acoustic": 8, "akustik": 8, "slowed": 16, "reverb": 16, "sped": 32, "speed": 32,
+    "nightcore": 32, "instrumental": 64, "karaoke": 64, "minus": 64, "8d": 128,
+}
+_VERSION_WORDS = re.compile(r" (" + "|".join(_VERSIONS) + r")\b")
+# Trigram hash: uint32 ichida (to'lib ketishi — hash uchun muammo emas)
+_PRIME = np.uint32(16777619) if np is not None else None
+
+if np is None:
+    logger.warning("NumPy o'rnatilmagan: qidiruv natijalari saralanmaydi va takrorlar qoladi")
+
+
+def clean_titles(texts: Sequence[str]) -> List[str]:
+    """Taqqoslash uchun nomlar: normallashtirilgan, shovqin so'zlarsiz (regex'lar bir marta)"""
+    # Kanal/artist nomlari ko'p takrorlanadi — har xil matn bir marta ishlanadi
+    unique = list(dict.fromkeys(texts))
+    joined = _NOISE.sub("", " " + "\n ".join(normalize_many(unique)))
+    cleaned = dict(zip(unique, [line.strip() for line in joined.split("\n")]))
+    return [cleaned[text] for text in texts]
+
+
+def version_mask(title: str) -> int:
+    """title — clean_titles natijasi (so'zlar bitta bo'sh joy bilan ajralgan)"""
+    return version_masks([title])[0]
+
+
+def ngram_counts(texts: Sequence[str], dim: int = RANK_DIM):
+    """Matnlar -> (len(texts), dim) float32 trigram sanoqlari (normallanmagan), bitta NumPy o'tishida"""
+    count = len(texts)
+    # Har matn "  matn " ko'rinishida, \0 bilan ulanadi; \0 tushgan trigram
+    # ikki matn chegarasida — hisobga olinmaydi
+    codes = np.frombuffer(("  " + " \0  ".join(texts) + " ").encode("utf-32-le"), dtype=np.uint32)
+    separator = codes == 0
+    rows = np.cumsum(separator[:-2])
+    grams = (((codes[:-2] * _PRIME) ^ codes[1:-1]) * _PRIME ^ codes[2:]) % np.uint32(dim)
+    index = rows * dim + grams
+    index = index[~(separator[:-2] | separator[1:-1] | separator[2:])]
+    return np.bincount(index, minlength=count * dim).astype(np.float32).reshape(count, dim)
+
+
+def normalize_rows(counts):
+    norms = np.sqrt(np.einsum("ij,ij->i", counts, counts))
+    return counts / np.maximum(norms, 1e-9)[:, None]
+
+
+def ngram_vectors(texts: Sequence[str], dim: int = RANK_DIM):
+    """Matnlar -> (len(texts), dim) normallangan trigram vektorlari"""
+    return normalize_rows(ngram_counts(texts, dim))
+
+
+def version_masks(titles: Sequence[str]) -> List[int]:
+    """version_mask ro'yxat uchun: bitta regex o'tishi (versiya so'zlari kam uchraydi)"""
+    joined = " " + "\n ".join(titles)
+    masks = [0] * len(titles)
+    line = position = 0
+    for match in _VERSION_WORDS.finditer(joined):
+        line += joined.count("\n", position, match.start())
+        position = match.start()
+        masks[line] |= _VERSIONS[match.group(1)]
+    return masks
+
+
+def rank_results(query: str, candidates: List[Dict], spotify: Sequence[Dict] = ()) -> Tuple[List[Dict], List[Dict]]:
+    """
+    candidates — yuklab olinadigan (YouTube/lyrics) natijalar, spotify — Spotify treklari.
+    (saralangan va takrorsiz nomzodlar, hech bir nomzodga mos kelmagan Spotify treklari)
+    Kirish ro'yxatlari o'zgartirilmaydi (keshdagi ma'lumot bo'lishi mumkin).
+    """
+    if np is None or not candidates:
+        return list(candidates), list(spotify)
+    started = time.perf_counter()
+    count = len(candidates)
+    # Bitta normalize_many: [so'rov, nomlar..., artistlar..., spotify nom+artist...]
+    cleaned = clean_titles(
+        [query]
+        + [item.get("title") or "" for item in candidates]
+        + [item.get("artist") or "" for item in candidates]
+        + [f"{item.get('title') or ''} {item.get('artist') or ''}" for item in spotify]
+    )
+    titles = cleaned[1:count + 1]
+    # "nom artist" vektori = nom + artist sanoqlari: nomlar ikki marta hisoblanmaydi
+    counts = ngram_counts([cleaned[0]] + titles + cleaned[count + 1:])
+    vectors = normalize_rows(counts[:count + 1])
+    query_vec = vectors[0]
+    title_vecs = vectors[1:]
+    full_vecs = normalize_rows(counts[1:count + 1] + counts[count + 1:2 * count + 1])
+    sp_vecs = normalize_rows(counts[2 * count + 1:])
+
+    # Artist nomi sarlavhada ham, kanal nomida ham bo'lishi mumkin — yaxshirog'i olinadi
+    relevance = np.maximum(title_vecs @ query_vec, full_vecs @ query_vec)
+    scores = relevance + POSITION_WEIGHT * (1 - np.arange(count) / count)
+
+    durations = np.array([int(item.get("duration") or 0) for item in candidates], dtype=np.int64)
+    masks = version_masks(titles + cleaned[2 * count + 1:])
+    versions = np.array(masks[:count], dtype=np.int64)
+    unknown = durations == 0
+    same_length = np.abs(durations[:, None] - durations[None, :]) <= DURATION_TOLERANCE
+    same_length |= unknown[:, None]
+    same_length |= unknown[None, :]
+    duplicate = title_vecs @ title_vecs.T >= DUP_THRESHOLD
+    duplicate &= versions[:, None] == versions[None, :]
+    duplicate &= same_length
+
+    kept = []
+    removed = np.zeros(count, dtype=bool)
+    for index in np.argsort(-scores, kind="stable").tolist():
+        if removed[index]:
+            continue
+        kept.append(index)
+        removed |= duplicate[index]
+
+    results = {index: candidates[index] for index in kept}
+    score_list = scores.tolist()
+    unmatched = []
+    if len(spotify):
+        kept_idx = np.array(kept)
+        similarity = sp_vecs @ full_vecs[kept_idx].T
+        # best_match kabi: "Yoqub" Spotify treki "Yoqub (Remix)" qatoriga biriktirilmaydi
+        same_version = versions[kept_idx][None, :] == np.array(masks[count:], dtype=np.int64)[:, None]
+        similarity = np.where(same_version, similarity, -1.0)
+        best_columns = similarity.argmax(axis=1)
+        best_scores = similarity[np.arange(len(spotify)), best_columns].tolist()
+        duration_list = durations.tolist()
+        for track, best, score in zip(spotify, best_columns.tolist(), best_scores):
+            target = kept[best]
+            sp_duration = int(track.get("duration") or 0)
+            close = not sp_duration or not duration_list[target] or abs(duration_list[target] - sp_duration) <= DURATION_TOLERANCE
+            if score < MATCH_THRESHOLD or not close or "spotify_url" in results[target]:
+                unmatched.append(track)
+                continue
+            merged = dict(results[target])
+            merged["spotify_url"] = track.get("url") or ""
+            if track.get("artist"):
+                merged["artist"] = track["artist"]
+            results[target] = merged
+            score_list[target] += SPOTIFY_BOOST
+        metrics.incr("search.rank.spotify_matched", len(spotify) - len(unmatched))
+
+    kept.sort(key=lambda index: -score_list[index])
+    metrics.incr("search.rank.duplicates", count - len(kept))
+    metrics.observe("search.rank_seconds", time.perf_counter() - started)
+    return [results[index] for index in kept], unmatched
+
+
+def best_match(track: Dict, candidates: Sequence[Dict], window: int = DURATION_TOLERANCE) -> Tuple[int, float]:
+    """
+    Spotify trek uchun eng mos YouTube nomzodi: (indeks, ball), mos kelmasa (-1, 0).
+    Davomiyligi window soniyadan ko'p farq qiladigan nomzod (ikkalasi ma'lum bo'lsa)
+    hisobga olinmaydi; ichidagi farq ham ballni biroz kamaytiradi.
+    """
+    if np is None or not candidates:
+        return -1, 0.0
+    cleaned = clean_titles(
+        [f"{track.get('title') or ''} {track.get('artist') or ''}"]
+        + [f"{item.get('title') or ''} {item.get('artist') or ''}" for item in candidates]
+    )
+    vectors = ngram_vectors(cleaned)
+    scores = vectors[1:] @ vectors[0]
+    duration = int(track.get("duration") or 0)
+    durations = np.array([int(item.get("duration") or 0) for item in candidates], dtype=np.int64)
+    if duration:
+        known = durations > 0
+        diff = np.abs(durations - duration)
+        scores = np.where(known & (diff > window), -1.0, scores - known * (diff / max(window, 1)) * 0.1)
+    # Versiya (remix, live ...) Spotify nomida bo'lmasa, bunday nomzod kamroq mos
+    masks = np.array(version_masks(cleaned), dtype=np.int64)
+    scores = scores - 0.2 * (masks[1:] != masks[0])
+    best = int(np.argmax(scores))
+    if scores[best] < MATCH_THRESHOLD:
+        return -1, float(scores[best])
+    return best, float(scores[best])
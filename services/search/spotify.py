@@ -3,22 +3,50 @@
 Requires env vars:
 - SPOTIFY_CLIENT_ID
 - SPOTIFY_CLIENT_SECRET
+
+Bitta httpx.AsyncClient: ulanishlar pool'da qoladi (h2 o'rnatilgan bo'lsa
+HTTP/2, bitta ulanishda parallel so'rovlar), shuning uchun har qidiruv —
+bitta so'rov, TCP/TLS handshake'siz.
+
+Token: muddati tugashidan SPOTIFY_TOKEN_REFRESH_AHEAD soniya oldin fonda
+yangilanadi (eski token shu orada ishlayveradi). Bir vaqtda faqat bitta
+yangilash ketadi (single-flight), boshqa so'rovlar o'sha natijani kutadi.
+
+Ko'p trek: get_tracks(ids) — /v1/tracks?ids= (SPOTIFY_BATCH_SIZE tadan).
+
+SPOTIFY_API_URL / SPOTIFY_ACCOUNTS_URL — lokal stub uchun:
+python benchmarks/fake_spotify.py --self-test
 """
 
 from __future__ import annotations
 
-import base64
+import asyncio
+import logging
 import os
 import time
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
-import requests
+import httpx
 
+from core.metrics import metrics
 
-_token_cache: Dict[str, object] = {
-    "access_token": None,
-    "expires_at": 0,
-}
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com").rstrip("/")
+ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com").rstrip("/")
+POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("SPOTIFY_KEEPALIVE", "120"))
+REFRESH_AHEAD = float(os.getenv("SPOTIFY_TOKEN_REFRESH_AHEAD", "300"))
+TOKEN_TIMEOUT = 10
+# /v1/tracks bitta so'rovda 50 tagacha id qabul qiladi
+BATCH_SIZE = min(50, int(os.getenv("SPOTIFY_BATCH_SIZE", "50")))
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:  # pragma: no cover
+    HTTP2 = False
+    logger.info("h2 o'rnatilmagan: Spotify client HTTP/1.1 keep-alive bilan ishlaydi")
 
 
 def _get_credentials() -> Optional[tuple[str, str]]:
@@ -29,76 +57,151 @@ def _get_credentials() -> Optional[tuple[str, str]]:
     return cid, sec
 
 
-def _get_access_token() -> Optional[str]:
-    creds = _get_credentials()
-    if not creds:
-        return None
+def _track_dict(t: Dict) -> Dict:
+    artists = t.get("artists") or []
+    return {
+        "id": t.get("id") or "",
+        "title": t.get("name", ""),
+        "artist": artists[0].get("name") if artists else "",
+        "duration": (t.get("duration_ms") or 0) // 1000,
+        "isrc": ((t.get("external_ids") or {}).get("isrc")) or "",
+        "album": ((t.get("album") or {}).get("name")) or "",
+        "url": ((t.get("external_urls") or {}).get("spotify")) or "",
+    }
+
+
+class SpotifyClient:
+    def __init__(self, api_url: str = API_URL, accounts_url: str = ACCOUNTS_URL):
+        self.api_url = api_url
+        self.accounts_url = accounts_url
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Boshqa loop'da (masalan asyncio.run bilan benchmark) eski pool ishlamaydi
+            self._client = httpx.AsyncClient(
+                http2=HTTP2,
+                limits=httpx.Limits(
+                    max_connections=POOL_SIZE,
+                    max_keepalive_connections=POOL_SIZE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._loop = loop
+            self._refresh = None
+        return self._client
 
-    now = int(time.time())
-    if _token_cache["access_token"] and int(_token_cache["expires_at"]) - 30 > now:
-        return str(_token_cache["access_token"])
-
-    cid, sec = creds
-    basic = base64.b64encode(f"{cid}:{sec}".encode("utf-8")).decode("utf-8")
-
-    try:
-        r = requests.post(
-            "https://accounts.spotify.com/api/token",
-            headers={
-                "Authorization": f"Basic {basic}",
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            data={"grant_type": "client_credentials"},
-            timeout=20,
-        )
+    async def aclose(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    # Token
+
+    async def _fetch_token(self) -> Optional[str]:
+        creds = _get_credentials()
+        if not creds:
+            return None
+        try:
+            r = await self._http().post(
+                f"{self.accounts_url}/api/token",
+                auth=creds,
+                data={"grant_type": "client_credentials"},
+                timeout=TOKEN_TIMEOUT,
+            )
+        except httpx.HTTPError as e:
+            logger.warning("Spotify token olinmadi: %s", e)
+            metrics.incr("spotify.token_errors")
+            return None
         if r.status_code != 200:
+            logger.warning("Spotify token olinmadi: HTTP %s", r.status_code)
+            metrics.incr("spotify.token_errors")
             return None
         data = r.json()
         token = data.get("access_token")
-        expires_in = int(data.get("expires_in", 0) or 0)
         if not token:
             return None
-        _token_cache["access_token"] = token
-        _token_cache["expires_at"] = now + expires_in
-        return str(token)
-    except Exception:
+        self._token = str(token)
+        self._expires_at = time.monotonic() + int(data.get("expires_in", 0) or 0)
+        metrics.incr("spotify.token_refreshes")
+        return self._token
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._fetch_token(), name="spotify:token")
+        return self._refresh
+
+    async def token(self) -> Optional[str]:
+        if not _get_credentials():
+            return None
+        self._http()
+        remaining = self._expires_at - time.monotonic()
+        if self._token and remaining > 0:
+            if remaining < REFRESH_AHEAD:
+                # Hozirgi token hali ishlaydi — yangisi fonda olinadi
+                self._start_refresh()
+            return self._token
+        return await asyncio.shield(self._start_refresh())
+
+    # API
+
+    async def _get(self, path: str, params: Dict, timeout: float) -> Optional[Dict]:
+        for attempt in range(2):
+            token = await self.token()
+            if not token:
+                return None
+            r = await self._http().get(
+                f"{self.api_url}{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=timeout,
+            )
+            if r.status_code == 401 and attempt == 0:
+                # Token muddatidan oldin bekor qilingan — bir marta yangisi bilan
+                if self._token == token:
+                    self._token = None
+                continue
+            if r.status_code != 200:
+                metrics.incr("spotify.http_errors")
+                logger.warning("Spotify %s: HTTP %s", path, r.status_code)
+                return None
+            return r.json()
         return None
 
+    async def search_tracks(self, query: str, limit: int = 5, market: str = "UZ", timeout: float = 20) -> List[Dict]:
+        data = await self._get(
+            "/v1/search", {"q": query, "type": "track", "limit": limit, "market": market}, timeout,
+        )
+        items = (((data or {}).get("tracks") or {}).get("items")) or []
+        return [_track_dict(t) for t in items if t]
+
+    async def get_tracks(self, ids: Iterable[str], market: str = "UZ", timeout: float = 20) -> List[Dict]:
+        """Bir nechta trek id bo'yicha (ISRC, davomiylik) — BATCH_SIZE tadan parallel so'rovlar"""
+        ids = [track_id for track_id in dict.fromkeys(ids) if track_id]
+        chunks = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+        pages = await asyncio.gather(*(
+            self._get("/v1/tracks", {"ids": ",".join(chunk), "market": market}, timeout) for chunk in chunks
+        ))
+        return [_track_dict(t) for page in pages for t in ((page or {}).get("tracks") or []) if t]
+
+
+spotify_client = SpotifyClient()
+
 
-def search_spotify_tracks(query: str, limit: int = 5, market: str = "UZ") -> List[Dict]:
-    """Search Spotify tracks; returns list of {title, artist, url, album}."""
+async def search_spotify_tracks(query: str, limit: int = 5, market: str = "UZ", timeout: float = 20) -> List[Dict]:
+    """Search Spotify tracks; returns list of {id, title, artist, duration, isrc, album, url}."""
     query = (query or "").strip()
     if not query:
         return []
+    return await spotify_client.search_tracks(query, limit=limit, market=market, timeout=timeout)
 
-    token = _get_access_token()
-    if not token:
-        return []
-
-    try:
-        r = requests.get(
-            "https://api.spotify.com/v1/search",
-            headers={"Authorization": f"Bearer {token}"},
-            params={"q": query, "type": "track", "limit": limit, "market": market},
-            timeout=20,
-        )
-        if r.status_code != 200:
-            return []
-        data = r.json()
-        items = (((data.get("tracks") or {}).get("items")) or [])
-        out: List[Dict] = []
-        for t in items:
-            artists = t.get("artists") or []
-            artist = artists[0].get("name") if artists else ""
-            out.append(
-                {
-                    "title": t.get("name", ""),
-                    "artist": artist,
-                    "album": ((t.get("album") or {}).get("name")) or "",
-                    "url": ((t.get("external_urls") or {}).get("spotify")) or "",
-                }
-            )
-        return out
-    except Exception:
-        return []
 
+async def close_spotify(application=None):
+    """Application.post_stop: pool'dagi ulanishlarni yopadi"""
+    await spotify_client.aclose()
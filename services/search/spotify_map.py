@@ -0,0 +1,152 @@
+"""Spotify -> YouTube mapping.
+
+Spotify trek (id, ISRC, nom, artist, davomiylik) uchun yuklab olinadigan
+YouTube video topiladi va alohida SQLite faylda (SPOTIFY_MAP_PATH) doimiy
+saqlanadi:
+
+- Avval jadval: spotify id yoki ISRC bo'yicha. Topilgan trek qayta hech
+  qachon YouTube'da qidirilmaydi (boshqa albomdagi xuddi shu yozuv ham —
+  ISRC bir xil).
+- Bo'lmasa YouTube'da "artist - title" qidiriladi. Davomiyligi
+  SPOTIFY_MAP_WINDOW soniyadan ko'p farq qiladigan nomzodlar tashlanadi,
+  qolganidan ranking.best_match eng mosini tanlaydi.
+- Mos video topilmasa, bu ham yoziladi va SPOTIFY_MAP_MISS_TTL gacha
+  qayta qidirilmaydi.
+
+Chaqiruvlar sync (thread'da); async qatlam va single-flight — engine.resolve_spotify.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from core.metrics import metrics
+
+from .ranking import best_match
+from .youtube_music import search_youtube_music
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+MAP_PATH = os.getenv("SPOTIFY_MAP_PATH", str(BASE_DIR / "spotify_map.sqlite3"))
+DURATION_WINDOW = int(os.getenv("SPOTIFY_MAP_WINDOW", "10"))
+MISS_TTL = int(os.getenv("SPOTIFY_MAP_MISS_TTL", str(24 * 3600)))
+SEARCH_LIMIT = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spotify_map (
+    spotify_id TEXT PRIMARY KEY,
+    isrc TEXT NOT NULL DEFAULT '',
+    video_id TEXT,
+    video_title TEXT NOT NULL DEFAULT '',
+    score REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spotify_map_isrc ON spotify_map (isrc) WHERE isrc != '';
+"""
+
+
+def youtube_row(track: Dict, video_id: str, video_title: str) -> Dict:
+    """Spotify trek -> ro'yxatdagi yuklab olinadigan qator (Spotify nomi va artisti bilan)"""
+    return {
+        "id": video_id,
+        "title": track.get("title") or video_title,
+        "artist": track.get("artist") or "",
+        "duration": int(track.get("duration") or 0),
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "spotify_url": track.get("url") or "",
+    }
+
+
+class SpotifyMap:
+    def __init__(self, path: str = MAP_PATH):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def _get(self, spotify_id: str, isrc: str):
+        """(video_id yoki None, video_title, created_at, spotify_id) yoki None"""
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT video_id, video_title, created_at, spotify_id FROM spotify_map WHERE spotify_id = ?",
+                (spotify_id,),
+            ).fetchone()
+            if (row is None or row[0] is None) and isrc:
+                by_isrc = db.execute(
+                    "SELECT video_id, video_title, created_at, spotify_id FROM spotify_map "
+                    "WHERE isrc = ? AND video_id IS NOT NULL LIMIT 1", (isrc,)
+                ).fetchone()
+                row = by_isrc or row
+        return row
+
+    def _put(self, track: Dict, video_id: Optional[str], video_title: str = "", score: float = 0.0):
+        with self._lock:
+            # ISRC'siz chaqiruv (masalan, eski sessiya) ma'lum ISRC'ni o'chirmaydi
+            self._connect().execute(
+                "INSERT INTO spotify_map (spotify_id, isrc, video_id, video_title, score, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (spotify_id) DO UPDATE SET "
+                "isrc = CASE WHEN excluded.isrc != '' THEN excluded.isrc ELSE spotify_map.isrc END, "
+                "video_id = excluded.video_id, video_title = excluded.video_title, "
+                "score = excluded.score, created_at = excluded.created_at",
+                (track["id"], track.get("isrc") or "", video_id, video_title, score, time.time()),
+            )
+
+    def lookup(self, tracks: Iterable[Dict]) -> Dict[str, Dict]:
+        """Faqat jadvaldan (qidiruvsiz): spotify id -> YouTube qatori"""
+        found = {}
+        for track in tracks:
+            if not track.get("id"):
+                continue
+            row = self._get(track["id"], track.get("isrc") or "")
+            if row and row[0]:
+                found[track["id"]] = youtube_row(track, row[0], row[1])
+        return found
+
+    def resolve(self, track: Dict) -> Optional[Dict]:
+        """Jadvaldan yoki YouTube qidiruvidan; topilmasa None"""
+        if not track.get("id") or not track.get("title"):
+            return None
+        row = self._get(track["id"], track.get("isrc") or "")
+        if row is not None:
+            if row[0]:
+                metrics.incr("spotify_map.hits")
+                if row[3] != track["id"]:
+                    # ISRC orqali topildi — shu id uchun ham yozib qo'yamiz
+                    self._put(track, row[0], row[1])
+                return youtube_row(track, row[0], row[1])
+            if time.time() - row[2] < MISS_TTL:
+                metrics.incr("spotify_map.cached_misses")
+                return None
+
+        metrics.incr("spotify_map.searches")
+        query = f"{track.get('artist') or ''} - {track['title']}".strip(" -")
+        candidates = search_youtube_music(query, limit=SEARCH_LIMIT)
+        index, score = best_match(track, candidates, window=DURATION_WINDOW)
+        if index < 0:
+            logger.info("Spotify trek YouTube'da topilmadi: %s (eng yaxshi ball %.2f)", query, score)
+            self._put(track, None)
+            return None
+        video = candidates[index]
+        self._put(track, video["id"], video.get("title") or "", score)
+        return youtube_row(track, video["id"], video.get("title") or "")
+
+
+spotify_map = SpotifyMap()
@@ -6,6 +6,8 @@ Searches YouTube with music-biased queries and returns track info.
 from __future__ import annotations
 
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 
 import yt_dlp
@@ -14,23 +16,75 @@ from services.downloaders.ytdl_utils import get_ydl_base_opts
 
 logger = logging.getLogger(__name__)
 
+# Asosiy variant yetmasa, bir vaqtda ketadigan qo'shimcha variantlar (1 — ketma-ket)
+VARIANT_PARALLEL = int(os.getenv("YTSEARCH_VARIANT_PARALLEL", "3"))
+# Hamma qidiruvlar uchun umumiy pool
+VARIANT_THREADS = int(os.getenv("YTSEARCH_THREADS", "12"))
+
+_variant_executor = ThreadPoolExecutor(max_workers=VARIANT_THREADS, thread_name_prefix="ytsearch")
+
+
+def _search_variant(search_query: str, ydl_opts: Dict) -> List[Dict]:
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        result = ydl.extract_info(search_query, download=False)
+    if not result:
+        return []
+    return [entry for entry in (result.get("entries") or []) if entry]
+
+
+def _entry_dict(entry: Dict) -> Dict:
+    vid = entry.get("id", "")
+    return {
+        "id": vid,
+        "title": entry.get("title") or "Noma'lum",
+        "artist": entry.get("channel") or entry.get("uploader") or "",
+        "duration": entry.get("duration") or 0,
+        "url": entry.get("url") or entry.get("webpage_url") or f"https://www.youtube.com/watch?v={vid}",
+    }
+
+
+def _variants(query: str) -> List[str]:
+    """Qidiruv variantlari; birinchisi — asosiy (odatda birinchi sahifani to'liq beradi)"""
+    return [f"{query} audio", f"{query} official audio", query, f"{query} music", f"{query} song"]
+
+
+def search_youtube_page(query: str, start: int, count: int = 10) -> List[Dict]:
+    """
+    Keyingi sahifa: asosiy variant qidiruvining start..start+count oralig'i
+    (0 dan) — birinchi sahifa shu variantdan, cursor uning davomi. Boshqa
+    variantlardan qo'shilganlar bilan takrorlar chaqiruvchida id bo'yicha tashlanadi.
+    """
+    query = (query or "").strip()
+    if not query or count <= 0:
+        return []
+    ydl_opts = {
+        **get_ydl_base_opts(),
+        "extract_flat": "in_playlist",
+        "skip_download": True,
+        "ignoreerrors": True,
+        # 1 dan boshlanadi, ikkala chegara ham kiradi
+        "playlist_items": f"{start + 1}-{start + count}",
+    }
+    entries = _search_variant(f"ytsearch{start + count}:{_variants(query)[0]}", ydl_opts)
+    return [_entry_dict(entry) for entry in entries if entry.get("id")]
+
 
 def search_youtube_music(query: str, limit: int = 10) -> List[Dict]:
     """
     Returns a list of YouTube results:
     {id, title, duration, url, artist}
+
+    Avval faqat asosiy variant; u limit'ni to'ldirsa (odatda shunday) boshqa
+    so'rov yo'q. Yetmasa qolgan variantlar VARIANT_PARALLEL tadan parallel
+    boshlanadi, lekin natijalar variant tartibida birlashtiriladi (qaysi biri
+    oldin tugashiga bog'liq emas) va limit to'lgach qolganlari bekor qilinadi.
+    Natija ketma-ket qidiruvdagi bilan bir xil: variant tartibi, keyin o'rin.
     """
     query = (query or "").strip()
     if not query:
         return []
 
-    search_queries = [
-        f"ytsearch{limit}:{query} audio",
-        f"ytsearch{limit}:{query} official audio",
-        f"ytsearch{limit}:{query}",
-        f"ytsearch{limit}:{query} music",
-        f"ytsearch{limit}:{query} song",
-    ]
+    search_queries = [f"ytsearch{limit}:{variant}" for variant in _variants(query)]
 
     base_opts = get_ydl_base_opts()
     ydl_opts = {
@@ -43,35 +97,37 @@ def search_youtube_music(query: str, limit: int = 10) -> List[Dict]:
     seen = set()
     out: List[Dict] = []
 
-    for sq in search_queries:
-        if len(out) >= limit:
-            break
+    def merge(sq: str, future) -> None:
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                result = ydl.extract_info(sq, download=False)
-                if not result:
-                    continue
-                entries = result.get("entries") or []
-                for entry in entries:
-                    if not entry:
-                        continue
-                    vid = entry.get("id", "")
-                    if not vid or vid in seen:
-                        continue
-                    seen.add(vid)
-                    title = entry.get("title") or "Noma'lum"
-                    channel = entry.get("channel") or entry.get("uploader") or ""
-                    out.append({
-                        "id": vid,
-                        "title": title,
-                        "artist": channel,
-                        "duration": entry.get("duration") or 0,
-                        "url": entry.get("url") or entry.get("webpage_url") or f"https://www.youtube.com/watch?v={vid}",
-                    })
-                    if len(out) >= limit:
-                        break
+            entries = future.result()
         except Exception as e:
             logger.warning("YouTube search failed for %r: %s", sq, e)
-            continue
+            return
+        for entry in entries:
+            vid = entry.get("id", "")
+            if not vid or vid in seen:
+                continue
+            seen.add(vid)
+            out.append(_entry_dict(entry))
+            if len(out) >= limit:
+                return
+
+    merge(search_queries[0], _variant_executor.submit(_search_variant, search_queries[0], ydl_opts))
+    if len(out) >= limit:
+        return out
+
+    # Qolgan variantlar: oldinda parallel tagacha ishlab turadi, olinishi — tartib bilan
+    rest = search_queries[1:]
+    parallel = max(1, VARIANT_PARALLEL)
+    futures = [_variant_executor.submit(_search_variant, sq, ydl_opts) for sq in rest[:parallel]]
+    for index, sq in enumerate(rest):
+        merge(sq, futures[index])
+        if len(out) >= limit:
+            break
+        if index + parallel < len(rest):
+            futures.append(_variant_executor.submit(_search_variant, rest[index + parallel], ydl_opts))
 
+    # Limit to'ldi: navbatdagilar bekor, ishlayotganlari natijasi kutilmaydi
+    for future in futures:
+        future.cancel()
     return out
@@ -1,7 +1,9 @@
 """Shazam audio recognition service (works without ffmpeg)"""
+import asyncio
 import logging
 import os
 from typing import Optional, Dict
+from uuid import uuid4
 
 from shazamio import Shazam, HTTPClient
 from aiohttp_retry import ExponentialRetry
@@ -53,7 +55,7 @@ class ShazamService:
                 audio = audio.set_channels(1).set_frame_rate(44_100).set_sample_width(2)
 
                 tmp_dir = tempfile.gettempdir()
-                out_path = os.path.join(tmp_dir, f"shazam_{os.getpid()}.wav")
+                out_path = os.path.join(tmp_dir, f"shazam_{uuid4().hex}.wav")
                 audio.export(out_path, format="wav")
                 with open(out_path, "rb") as f:
                     data = f.read()
@@ -75,7 +77,8 @@ class ShazamService:
                 "error_message": "Fayl topilmadi.",
             }
 
-        audio_bytes = self._prepare_snippet(file_path)
+        # pydub/ffmpeg va fayl o'qish bloklaydi — event loop'dan tashqarida
+        audio_bytes = await asyncio.to_thread(self._prepare_snippet, file_path)
         if not audio_bytes:
             return {
                 "is_successful": False,